@@ -0,0 +1,226 @@
+# apply_decisions.py
+"""Writing reviewed changes back into a layer.
+
+The decisions taken on the results are turned into the edits that bring a
+target layer to the reviewed state:
+
+- accepted additions and rejected deletions create the feature,
+- accepted deletions and rejected additions delete it,
+- each decided field change writes the new value if accepted, the old one
+  if rejected.
+
+Pending rows are left alone. Edits that would not change the target are
+dropped. For example, rejected changes are already in place in the old
+layer. A dry run therefore counts exactly what would be written. The
+edits are made in one edit session with batched calls.
+"""
+import numpy as np
+from qgis.core import QgsFeature, QgsFeatureRequest, QgsGeometry
+
+from .comparators import GEOMETRY_FIELD, FID_FIELD, GeometryValue
+from .decision_store import ACCEPTED, REJECTED
+from .diff_engine import ADDED, DELETED, MODIFIED
+from .exporters import chunks, qt_value
+from .feature_fetcher import FeatureFetcher
+
+# Features added or deleted per call
+APPLY_CHUNK = 10000
+
+
+class ApplyError(Exception):
+    """Raised when the edits cannot be written to the target layer"""
+
+
+class ChangePlan:
+    """Edits bringing a target layer to the reviewed state"""
+
+    def __init__(self):
+        self.additions = []  # (attribute values by field, WKB or None) of features to create
+        self.deletions = []  # feature ids to delete
+        self.changes = {}  # feature id -> {field index: value}
+        self.geometries = {}  # feature id -> WKB, None for an empty geometry
+
+    def counts(self):
+        """Return the number of features added, deleted, with changed attributes and with changed geometry"""
+        return {'added': len(self.additions), 'deleted': len(self.deletions),
+                'changed': len(self.changes), 'geometries': len(self.geometries)}
+
+    def __len__(self):
+        return len(self.additions) + len(self.deletions) + len(self.changes) + len(self.geometries)
+
+
+def record_wkb(values):
+    geometry = values.get(GEOMETRY_FIELD)
+    return geometry.wkb if isinstance(geometry, GeometryValue) else None
+
+
+def source_geometries(layer, fids):
+    """Return fid -> WKB of features of a source layer"""
+    wkbs = {}
+    if layer is None or not layer.isSpatial() or not fids:
+        return wkbs
+    request = QgsFeatureRequest().setFilterFids(list(fids)).setNoAttributes()
+    for feature in layer.getFeatures(request):
+        if feature.hasGeometry():
+            wkbs[feature.id()] = bytes(feature.geometry().asWkb())
+    return wkbs
+
+
+def plan_changes(model, target, join_fields, old_layer=None, new_layer=None):
+    """Work out the edits applying the decisions of a results model to a target layer.
+
+    Features of the target are matched on the join fields; a changed field
+    is written to every target feature with the key of its row. Geometries
+    of created features come from the compared geometries or, when those
+    were not compared, from the old or new layer by feature id.
+    """
+    geometry_compared = GEOMETRY_FIELD in model.fields
+    present = {}  # key -> (values, source layer) of features the target must have
+    absent = set()  # keys the target must not have
+    changes = {}  # key -> {field: value}, GEOMETRY_FIELD for WKB
+    for row in np.flatnonzero(model.decisions.decided()):
+        row = int(row)
+        record = model.records[row]
+        decision = model.decisions.row(row)
+        if record.status == ADDED:
+            if decision == ACCEPTED:
+                present[record.key] = (record.new, new_layer)
+            elif decision == REJECTED:
+                absent.add(record.key)
+        elif record.status == DELETED:
+            if decision == ACCEPTED:
+                absent.add(record.key)
+            elif decision == REJECTED:
+                present[record.key] = (record.old, old_layer)
+        elif record.status == MODIFIED:
+            for field in record.changed:
+                field_decision = model.decisions.field(row, field)
+                if field_decision not in (ACCEPTED, REJECTED):
+                    continue
+                values = record.new if field_decision == ACCEPTED else record.old
+                value = record_wkb(values) if field == GEOMETRY_FIELD else values.get(field)
+                changes.setdefault(record.key, {})[field] = value
+
+    # Feature ids of the target for the keys involved, read from the join fields only
+    wanted = set(present) | absent | set(changes)
+    target_fids = {}
+    for fid, key, values in FeatureFetcher(target, target.fields(), join_fields, join_fields).rows(ordered=False):
+        if key in wanted:
+            target_fids.setdefault(key, []).append(fid)
+
+    plan = ChangePlan()
+    for key in absent:
+        plan.deletions.extend(target_fids.get(key, ()))
+
+    added = [(values, layer) for key, (values, layer) in present.items() if key not in target_fids]
+    if geometry_compared:
+        wkbs = [record_wkb(values) for values, layer in added]
+    else:
+        fetched = {}
+        for values, layer in added:
+            if layer is not None and values.get(FID_FIELD) is not None:
+                fetched.setdefault(layer.id(), (layer, []))[1].append(values[FID_FIELD])
+        fetched = {layer_id: source_geometries(layer, fids) for layer_id, (layer, fids) in fetched.items()}
+        wkbs = [fetched.get(layer.id(), {}).get(values.get(FID_FIELD)) if layer is not None else None
+                for values, layer in added]
+    plan.additions = [(values, wkb) for (values, layer), wkb in zip(added, wkbs)]
+
+    # Current values of the matched features, so fields already holding the wanted value are skipped
+    fields = sorted({field for values in changes.values() for field in values if field != GEOMETRY_FIELD})
+    with_geometry = any(GEOMETRY_FIELD in values for values in changes.values())
+    fids = {fid: key for key in changes for fid in target_fids.get(key, ())}
+    fetcher = FeatureFetcher(target, target.fields(), fields, join_fields, with_geometry=with_geometry)
+    for fid, key, current in fetcher.rows(ordered=False, fids=fids):
+        for field, value in changes[fids[fid]].items():
+            if field == GEOMETRY_FIELD:
+                if value != record_wkb(current):
+                    plan.geometries[fid] = value
+            elif field in current and current[field] != value:
+                plan.changes.setdefault(fid, {})[target.fields().lookupField(field)] = value
+    return plan
+
+
+def geometry_from_wkb(wkb):
+    geometry = QgsGeometry()
+    if wkb is not None:
+        geometry.fromWkb(wkb)
+    return geometry
+
+
+def _edits(plan, target):
+    """Make the edits of a plan chunk by chunk, yielding the number of edits of each chunk"""
+    fields = target.fields()
+    # Providers assign the primary key of new features
+    skipped = set(target.primaryKeyAttributes())
+
+    for chunk in chunks(plan.deletions, APPLY_CHUNK):
+        if not target.deleteFeatures(chunk):
+            raise ApplyError("Could not delete features from {}".format(target.name()))
+        yield len(chunk)
+
+    for chunk in chunks(plan.additions, APPLY_CHUNK):
+        features = []
+        for values, wkb in chunk:
+            feature = QgsFeature(fields)
+            for index, field in enumerate(fields):
+                if index not in skipped and field.name() in values:
+                    feature.setAttribute(index, qt_value(values[field.name()]))
+            if wkb is not None:
+                feature.setGeometry(geometry_from_wkb(wkb))
+            features.append(feature)
+        if not target.addFeatures(features):
+            raise ApplyError("Could not add features to {}".format(target.name()))
+        yield len(chunk)
+
+    for chunk in chunks(plan.changes.items(), APPLY_CHUNK):
+        for fid, change in chunk:
+            change = {index: qt_value(value) for index, value in change.items() if index not in skipped}
+            if not target.changeAttributeValues(fid, change):
+                raise ApplyError("Could not change feature {} of {}".format(fid, target.name()))
+        yield len(chunk)
+
+    for chunk in chunks(plan.geometries.items(), APPLY_CHUNK):
+        for fid, wkb in chunk:
+            if not target.changeGeometry(fid, geometry_from_wkb(wkb)):
+                raise ApplyError("Could not change the geometry of feature {} of {}".format(fid, target.name()))
+        yield len(chunk)
+
+
+def apply_plan(plan, target, progress=None):
+    """Write a ChangePlan to the target layer in one edit session and return the number of edits made.
+
+    Features are deleted and added APPLY_CHUNK at a time. A layer that was
+    not being edited is committed at the end, so its provider receives the
+    edits as batched writes; a layer already in edit mode keeps them
+    unsaved, as one undoable command. progress(done) is called after each
+    chunk and may return False to drop all edits, in which case 0 is
+    returned. Raises ApplyError if the layer cannot be edited or saved.
+    """
+    progress = progress or (lambda done: True)
+    started_editing = not target.isEditable()
+    if started_editing and not target.startEditing():
+        raise ApplyError("{} cannot be edited".format(target.name()))
+
+    def discard():
+        target.destroyEditCommand()
+        if started_editing:
+            target.rollBack()
+
+    done = 0
+    target.beginEditCommand("Apply decisions")
+    try:
+        for count in _edits(plan, target):
+            done += count
+            if not progress(done):
+                discard()
+                return 0
+    except Exception:
+        discard()
+        raise
+    target.endEditCommand()
+
+    if started_editing and not target.commitChanges():
+        errors = "\n".join(target.commitErrors())
+        target.rollBack()
+        raise ApplyError("Could not save the edits of {}:\n{}".format(target.name(), errors))
+    return done
@@ -0,0 +1,120 @@
+# batch.py
+"""Comparing many layer pairs in parallel worker processes.
+
+Each pair is described by the parameters of the comparison algorithm
+(OLD, NEW, JOIN_FIELDS, OUTPUT, ...) and an optional "name". Pairs run
+independently in a pool of processes, each with its own QGIS
+application, and a summary is reported as soon as each pair finishes:
+
+    python -m table_compare.batch pairs.json --workers 16 --output-dir diffs
+
+pairs.json holds a JSON list of pair objects, or one object per line.
+Pairs without OUTPUT are written to <output-dir>/<name>.<format>. One
+JSON summary line per pair (name, counts per status, rows per differing
+field of summary-only comparisons, output, phase statistics, seconds or
+error) is printed and, with --summary, appended to a file.
+"""
+import argparse
+import atexit
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from .cli import start_qgis, run_algorithm
+from .diff_engine import STATUSES
+
+# QGIS application of a worker process
+_application = None
+
+
+def read_pairs(path):
+    """Read pair specs from a JSON list or a JSON lines file"""
+    with open(path, encoding='utf-8') as file:
+        text = file.read()
+    stripped = text.lstrip()
+    if stripped.startswith('['):
+        pairs = json.loads(stripped)
+    else:
+        pairs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for index, pair in enumerate(pairs):
+        pair.setdefault('name', 'pair_{}'.format(index + 1))
+    return pairs
+
+
+def pair_parameters(pair, output_dir, output_format):
+    """Return the algorithm parameters of a pair, with a default output path"""
+    parameters = {name: value for name, value in pair.items() if name != 'name'}
+    if 'OUTPUT' not in parameters:
+        parameters['OUTPUT'] = os.path.join(output_dir, '{}.{}'.format(pair['name'], output_format))
+    return parameters
+
+
+def init_worker():
+    """Start the QGIS application of a worker process once"""
+    global _application
+    _application = start_qgis()
+    atexit.register(_application.exitQgis)
+
+
+def run_pair(name, parameters):
+    """Compare one pair in a worker and return its summary"""
+    started = time.perf_counter()
+    summary = {'name': name, 'output': parameters.get('OUTPUT')}
+    try:
+        results = run_algorithm(parameters)
+    except Exception as e:
+        summary['error'] = str(e)
+    else:
+        summary['counts'] = {status: results[status.upper()] for status in STATUSES if status.upper() in results}
+        if results.get('FIELD_COUNTS'):
+            # Summary-only comparisons also count the rows per differing field
+            summary['fields'] = json.loads(results['FIELD_COUNTS'])['fields']
+        summary['stats'] = json.loads(results.get('STATS') or '[]')
+    summary['seconds'] = round(time.perf_counter() - started, 3)
+    return summary
+
+
+def run_batch(pairs, workers=None, output_dir='.', output_format='csv'):
+    """Compare pairs in a pool of worker processes and yield their summaries as they finish"""
+    os.makedirs(output_dir, exist_ok=True)
+    # Workers are spawned rather than forked so each starts a clean QGIS application
+    context = multiprocessing.get_context('spawn')
+    with concurrent.futures.ProcessPoolExecutor(workers, mp_context=context, initializer=init_worker) as pool:
+        futures = [pool.submit(run_pair, pair['name'], pair_parameters(pair, output_dir, output_format))
+                   for pair in pairs]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m table_compare.batch', description="Compare many layer pairs in parallel")
+    parser.add_argument('pairs', help="JSON (list or one object per line) of comparison parameters per pair")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--output-dir', default='.', help="directory of outputs of pairs without OUTPUT")
+    parser.add_argument('--format', choices=('csv', 'gpkg', 'parquet'), default='csv',
+                        help="format of outputs of pairs without OUTPUT")
+    parser.add_argument('--summary', help="file the summary lines are appended to")
+    options = parser.parse_args(arguments)
+
+    failed = 0
+    summary_file = open(options.summary, 'a', encoding='utf-8') if options.summary else None
+    try:
+        for summary in run_batch(read_pairs(options.pairs), options.workers, options.output_dir, options.format):
+            line = json.dumps(summary, default=str)
+            print(line, flush=True)
+            if summary_file is not None:
+                summary_file.write(line + '\n')
+                summary_file.flush()
+            failed += 'error' in summary
+    finally:
+        if summary_file is not None:
+            summary_file.close()
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+# benchmark.py
+"""Benchmarks of the comparison phases on generated layers.
+
+Pairs of old/new layers are generated with a configurable number of rows
+and columns, field types and fractions of added, deleted and modified
+features, either in memory or in a GeoPackage. The fetch, diff, model
+build, filter, sort and export phases are then timed separately, and their
+peak Python memory is recorded in a second, traced run so that tracing
+does not slow down the timed one. Runs offscreen:
+
+    python -m table_compare.benchmark --rows 100000 --columns 10 --modified 0.05 --json results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .cli import start_qgis
+from .comparators import INTEGER, REAL, TEXT, DATE, DATETIME, BOOL
+
+# Kinds of the generated fields, in the order they are cycled through
+FIELD_TYPES = (INTEGER, REAL, TEXT, DATE, DATETIME, BOOL)
+
+MEMORY = "memory"
+GEOPACKAGE = "gpkg"
+
+JOIN_FIELD = "key"
+
+
+def field_definitions(columns, types=FIELD_TYPES):
+    """Return (name, kind) of the generated attribute fields, cycling through types"""
+    return [("{}_{}".format(types[i % len(types)], i), types[i % len(types)]) for i in range(columns)]
+
+
+def random_value(kind, rng):
+    if kind == INTEGER:
+        return rng.randrange(1000000)
+    if kind == REAL:
+        return round(rng.uniform(0, 10000), 3)
+    if kind == TEXT:
+        return "value {}".format(rng.randrange(100000))
+    if kind == DATE:
+        return datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(9000))
+    if kind == DATETIME:
+        return datetime.datetime(2000, 1, 1) + datetime.timedelta(seconds=rng.randrange(10 ** 9))
+    return rng.random() < 0.5
+
+
+def generate_rows(rows, fields, added=0.01, deleted=0.01, modified=0.05, null_rate=0.02, seed=0):
+    """Return (old rows, new rows) as lists of (key, attributes, (x, y)).
+
+    deleted and modified are fractions of the old rows, added a fraction of
+    new rows appended after them. A modified row has one random attribute
+    changed; null_rate is the fraction of NULL attribute values.
+    """
+    rng = random.Random(seed)
+
+    def attributes():
+        return [None if rng.random() < null_rate else random_value(kind, rng) for name, kind in fields]
+
+    old = [(key, attributes(), (rng.uniform(0, 100), rng.uniform(0, 100))) for key in range(rows)]
+    new = []
+    for key, values, point in old:
+        draw = rng.random()
+        if draw < deleted:
+            continue
+        if draw < deleted + modified and fields:
+            values = list(values)
+            column = rng.randrange(len(fields))
+            values[column] = random_value(fields[column][1], rng)
+        new.append((key, values, point))
+    new.extend((key, attributes(), (rng.uniform(0, 100), rng.uniform(0, 100)))
+               for key in range(rows, rows + int(rows * added)))
+    return old, new
+
+
+def memory_layer(name, fields, rows, geometry=True):
+    """Build a memory layer with a join field, the given fields and rows"""
+    from qgis.PyQt.QtCore import QVariant
+    from qgis.core import QgsFeature, QgsField, QgsGeometry, QgsPointXY, QgsVectorLayer
+    from .exporters import qt_value
+
+    variant_types = {INTEGER: QVariant.LongLong, REAL: QVariant.Double, TEXT: QVariant.String,
+                     DATE: QVariant.Date, DATETIME: QVariant.DateTime, BOOL: QVariant.Bool}
+    layer = QgsVectorLayer("Point?crs=EPSG:4326" if geometry else "None", name, "memory")
+    provider = layer.dataProvider()
+    provider.addAttributes([QgsField(JOIN_FIELD, QVariant.LongLong)]
+                           + [QgsField(field, variant_types[kind]) for field, kind in fields])
+    layer.updateFields()
+
+    batch = []
+    for key, values, (x, y) in rows:
+        feature = QgsFeature(layer.fields())
+        feature.setAttributes([key] + [qt_value(value) for value in values])
+        if geometry:
+            feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+        batch.append(feature)
+        if len(batch) >= 10000:
+            provider.addFeatures(batch)
+            batch = []
+    provider.addFeatures(batch)
+    return layer
+
+
+def geopackage_layer(path, name, fields, rows, geometry=True):
+    """Write generated rows to a GeoPackage table and return it as a layer"""
+    from qgis.core import QgsCoordinateTransformContext, QgsVectorFileWriter, QgsVectorLayer
+
+    source = memory_layer(name, fields, rows, geometry)
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = name
+    if os.path.exists(path):
+        options.actionOnExistingFile = QgsVectorFileWriter.CreateOrOverwriteLayer
+    error = QgsVectorFileWriter.writeAsVectorFormatV2(source, path, QgsCoordinateTransformContext(), options)
+    if error[0] != QgsVectorFileWriter.NoError:
+        raise RuntimeError("Could not write {}: {}".format(path, error[1]))
+    return QgsVectorLayer("{}|layername={}".format(path, name), name, "ogr")
+
+
+class PhaseTimer:
+    """Record the wall time, or with trace the peak Python memory, and the rows of named phases"""
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.phases = []
+
+    def run(self, name, function, *args, rows):
+        """Run function(*args) as a phase and return its result; rows(result) is the number of rows processed"""
+        if self.trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            result = function(*args)
+        finally:
+            seconds = time.perf_counter() - started
+            peak = 0
+            if self.trace:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        self.phases.append({'phase': name, 'seconds': round(seconds, 4), 'peak_mb': round(peak / 2 ** 20, 2),
+                            'rows': rows(result)})
+        return result
+
+
+def run_phases(old_layer, new_layer, fields, output_dir, compare_geometry, export_formats, timer):
+    """Run the comparison phases of two layers, each through the timer"""
+    from qgis.PyQt.QtCore import Qt
+    from .compare_task import CompareTask
+    from .diff_engine import UNCHANGED, UnorderedKeysError, indexed_rows
+    from .exporters import ExportError, ResultExporter
+    from .results_model import ComparisonResultsModel, ResultsFilterProxyModel
+
+    names = [JOIN_FIELD] + [name for name, kind in fields]
+    task = CompareTask(old_layer, new_layer, [JOIN_FIELD], names, names[1:], compare_geometry=compare_geometry)
+
+    def fetch():
+        return list(task.source_rows(task.old_fetcher)), list(task.source_rows(task.new_fetcher))
+
+    def diff(old_rows, new_rows):
+        try:
+            task.diff(old_rows, new_rows)
+        except UnorderedKeysError:
+            task.diff(indexed_rows(old_rows), indexed_rows(new_rows))
+        return task.records
+
+    old_rows, new_rows = timer.run("fetch", fetch, rows=lambda rows: len(rows[0]) + len(rows[1]))
+    records = timer.run("diff", diff, old_rows, new_rows, rows=lambda records: task.rows_diffed)
+    del old_rows, new_rows
+
+    model = ComparisonResultsModel()
+    proxy = ResultsFilterProxyModel()
+    proxy.setSourceModel(model)
+    timer.run("model", model.set_records, records, task.fields, task.column_kinds, rows=lambda _: len(model.records))
+    del records
+    task.records = []
+    visible = [status for status in model.status_counts() if status != UNCHANGED]
+    timer.run("filter", proxy.set_visible_statuses, visible, rows=lambda _: len(model.records))
+    sort_column = model.columnCount() - 1 if model.columnCount() > 1 else 0
+    timer.run("sort", proxy.sort, sort_column, Qt.DescendingOrder, rows=lambda _: proxy.rowCount())
+
+    for export_format in export_formats:
+        path = os.path.join(output_dir, "benchmark.{}".format(export_format))
+        exporter = ResultExporter(model, proxy.source_rows(), task.column_kinds, task.layer_fields,
+                                  old_layer, new_layer)
+        try:
+            timer.run("export " + export_format, exporter.export, path, rows=lambda written: written)
+        except ExportError as e:
+            if not timer.trace:
+                print("Skipping {} export: {}".format(export_format, e), file=sys.stderr)
+
+
+def benchmark(old_layer, new_layer, fields, output_dir, compare_geometry=False, export_formats=("csv",)):
+    """Time the comparison phases of two layers and return the phase records.
+
+    The phases run twice: untraced for their time, then traced by
+    tracemalloc for their peak memory, since tracing every allocation
+    slows down the allocation-heavy fetch and diff phases.
+    """
+    timed, traced = PhaseTimer(), PhaseTimer(trace=True)
+    run_phases(old_layer, new_layer, fields, output_dir, compare_geometry, export_formats, timed)
+    run_phases(old_layer, new_layer, fields, output_dir, compare_geometry, export_formats, traced)
+    for phase, traced_phase in zip(timed.phases, traced.phases):
+        phase['peak_mb'] = traced_phase['peak_mb']
+    return timed.phases
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(prog='python -m table_compare.benchmark',
+                                     description="Time the comparison phases on generated layers")
+    parser.add_argument('--rows', type=int, default=100000, help="features of the old layer")
+    parser.add_argument('--columns', type=int, default=10, help="attribute fields besides the join field")
+    parser.add_argument('--types', default=",".join(FIELD_TYPES),
+                        help="comma separated field kinds cycled through: " + ", ".join(FIELD_TYPES))
+    parser.add_argument('--added', type=float, default=0.01, help="fraction of features added")
+    parser.add_argument('--deleted', type=float, default=0.01, help="fraction of features deleted")
+    parser.add_argument('--modified', type=float, default=0.05, help="fraction of features modified")
+    parser.add_argument('--provider', choices=(MEMORY, GEOPACKAGE), default=MEMORY)
+    parser.add_argument('--geometry', action='store_true', help="also compare point geometries")
+    parser.add_argument('--export', default="csv", help="comma separated export formats: csv, gpkg, parquet")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="file the phase records are written to")
+    options = parser.parse_args(arguments)
+
+    types = tuple(kind.strip() for kind in options.types.split(",") if kind.strip())
+    unknown = set(types) - set(FIELD_TYPES)
+    if unknown:
+        parser.error("unknown field types: " + ", ".join(sorted(unknown)))
+
+    application = start_qgis()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            fields = field_definitions(options.columns, types)
+            old, new = generate_rows(options.rows, fields, options.added, options.deleted, options.modified,
+                                     seed=options.seed)
+            started = time.perf_counter()
+            if options.provider == GEOPACKAGE:
+                path = os.path.join(directory, "benchmark.gpkg")
+                old_layer = geopackage_layer(path, "old", fields, old)
+                new_layer = geopackage_layer(path, "new", fields, new)
+            else:
+                old_layer = memory_layer("old", fields, old)
+                new_layer = memory_layer("new", fields, new)
+            generated = time.perf_counter() - started
+            del old, new
+
+            formats = [name.strip() for name in options.export.split(",") if name.strip()]
+            phases = benchmark(old_layer, new_layer, fields, directory, options.geometry, formats)
+            del old_layer, new_layer
+    finally:
+        application.exitQgis()
+
+    print("Generated {} {} layers in {:.2f} s".format(options.rows, options.provider, generated))
+    print("{:<16}{:>10}{:>12}{:>10}".format("phase", "seconds", "peak MB", "rows"))
+    for phase in phases:
+        print("{phase:<16}{seconds:>10.4f}{peak_mb:>12.2f}{rows:>10}".format(**phase))
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as file:
+            json.dump({'options': vars(options), 'phases': phases}, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
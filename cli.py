@@ -0,0 +1,95 @@
+# cli.py
+"""Command line entry point running the comparison without a display.
+
+Parameters are given like for qgis_process, as NAME=VALUE pairs after an
+optional "--"; a name given more than once collects a list of values:
+
+    python -m table_compare.cli -- OLD=old.gpkg NEW=new.gpkg JOIN_FIELDS=district JOIN_FIELDS=parcel_no OUTPUT=diff.gpkg
+
+With the plugin installed and enabled, the same algorithm also runs as
+"qgis_process run tablecompare:comparelayers -- ...". The results are
+printed as JSON: counts per status, the output path and the time, rows
+and memory of each phase.
+"""
+import json
+import os
+import sys
+
+
+def parse_parameters(arguments):
+    """Turn NAME=VALUE arguments into a parameters dict"""
+    parameters = {}
+    for argument in arguments:
+        if argument == '--':
+            continue
+        name, separator, value = argument.partition('=')
+        if not separator:
+            raise ValueError("Expected NAME=VALUE, got {!r}".format(argument))
+        if name in parameters:
+            previous = parameters[name]
+            parameters[name] = (previous if isinstance(previous, list) else [previous]) + [value]
+        else:
+            parameters[name] = value
+    return parameters
+
+
+def start_qgis():
+    """Initialise a QGIS application without a display and return it"""
+    # No widgets are built, so no display is needed
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from qgis.core import QgsApplication
+
+    application = QgsApplication([], False)
+    application.initQgis()
+    return application
+
+
+def run_algorithm(parameters, feedback=None):
+    """Run the comparison algorithm on a parameters dict and return its results.
+
+    Raises QgsProcessingException for invalid parameters or a failed run.
+    """
+    from qgis.core import QgsProcessingContext, QgsProcessingException, QgsProcessingFeedback, QgsProject
+    from .compare_algorithm import CompareLayersAlgorithm
+
+    algorithm = CompareLayersAlgorithm().create()
+    context = QgsProcessingContext()
+    context.setProject(QgsProject.instance())
+    feedback = feedback or QgsProcessingFeedback()
+    ok, message = algorithm.checkParameterValues(parameters, context)
+    if not ok:
+        raise QgsProcessingException(message)
+    results, ok = algorithm.run(parameters, context, feedback)
+    if not ok:
+        raise QgsProcessingException("The comparison did not finish")
+    return results
+
+
+def main(arguments=None):
+    arguments = sys.argv[1:] if arguments is None else arguments
+    if not arguments or arguments[0] in ('-h', '--help'):
+        print(__doc__.strip())
+        return 0
+    try:
+        parameters = parse_parameters(arguments)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    application = start_qgis()
+    try:
+        from qgis.core import QgsProcessingException
+        try:
+            results = run_algorithm(parameters)
+        except QgsProcessingException as e:
+            print(e, file=sys.stderr)
+            return 1
+        results = dict(results, STATS=json.loads(results.get('STATS') or '[]'))
+        print(json.dumps({'results': results}, indent=2, default=str))
+        return 0
+    finally:
+        application.exitQgis()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
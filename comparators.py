@@ -0,0 +1,170 @@
+# comparators.py
+"""Column-at-a-time value comparison for the diff engine.
+
+Matched rows are compared in chunks: the values of one field for all rows of
+a chunk are packed into a NumPy array according to the field type and
+compared in a single vectorized operation. Only columns without a usable
+type fall back to comparing cell by cell.
+
+Geometries are compared in stages: bounding boxes first, then WKB hashes,
+and only rows whose hashes differ are passed to a (costly) tolerance-based
+equality test.
+"""
+import hashlib
+
+import numpy as np
+
+INTEGER = "integer"
+REAL = "real"
+TEXT = "text"
+DATE = "date"
+DATETIME = "datetime"
+BOOL = "bool"
+GEOMETRY = "geometry"
+OTHER = "other"
+
+# Name under which geometries are stored next to the attributes of a row
+GEOMETRY_FIELD = "$geometry"
+
+# Name under which the feature id is stored next to the attributes of a row
+FID_FIELD = "$fid"
+
+NUMERIC_KINDS = (INTEGER, REAL)
+
+# Default absolute tolerance when comparing real values
+DEFAULT_TOLERANCE = 1e-10
+
+
+def values_equal(val1, val2):
+    """Compare two values for equality, handling different data types"""
+    # Handle None values
+    if val1 is None and val2 is None:
+        return True
+    if val1 is None or val2 is None:
+        return False
+
+    # Convert to strings for comparison to handle type differences
+    str1 = str(val1).strip()
+    str2 = str(val2).strip()
+
+    # Handle numeric comparison
+    try:
+        float1 = float(str1)
+        float2 = float(str2)
+        # Compare with small tolerance for floating point precision
+        return abs(float1 - float2) < DEFAULT_TOLERANCE
+    except (ValueError, TypeError):
+        # Not numeric, compare as strings
+        return str1 == str2
+
+
+class GeometryValue:
+    """WKB of a geometry with its bounding box and a hash of the WKB"""
+
+    __slots__ = ('wkb', 'bbox', 'digest')
+
+    def __init__(self, wkb, bbox):
+        self.wkb = wkb    # bytes
+        self.bbox = bbox  # (xmin, ymin, xmax, ymax)
+        self.digest = hashlib.blake2b(wkb, digest_size=16).digest()
+
+    def __str__(self):
+        return self.digest.hex()
+
+
+def common_kind(old_kind, new_kind):
+    """Return the kind used to compare a field typed differently on both sides"""
+    if old_kind == new_kind:
+        return old_kind
+    if old_kind in NUMERIC_KINDS and new_kind in NUMERIC_KINDS:
+        return REAL
+    return OTHER
+
+
+def null_mask(values):
+    return np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+
+
+def _typed_array(values, dtype, fill):
+    return np.array([fill if value is None else value for value in values], dtype=dtype)
+
+
+def _differs_exact(old_values, new_values, dtype, fill):
+    old_null, new_null = null_mask(old_values), null_mask(new_values)
+    old_array = _typed_array(old_values, dtype, fill)
+    new_array = _typed_array(new_values, dtype, fill)
+    return (old_null != new_null) | (~old_null & (old_array != new_array))
+
+
+def _differs_real(old_values, new_values, tolerance):
+    old_array = _typed_array(old_values, np.float64, np.nan)
+    new_array = _typed_array(new_values, np.float64, np.nan)
+    old_null, new_null = np.isnan(old_array), np.isnan(new_array)
+    with np.errstate(invalid='ignore'):
+        far = ~(np.abs(old_array - new_array) <= tolerance)
+    return (old_null != new_null) | (~old_null & ~new_null & far)
+
+
+def _differs_text(old_values, new_values):
+    old_array = np.array(old_values, dtype=object)
+    new_array = np.array(new_values, dtype=object)
+    return np.asarray(old_array != new_array, dtype=bool)
+
+
+def _differs_other(old_values, new_values):
+    return np.fromiter(
+        (not values_equal(old, new) for old, new in zip(old_values, new_values)),
+        dtype=bool, count=len(old_values))
+
+
+def _differs_geometry(old_values, new_values, tolerance, geometry_equal):
+    old_null, new_null = null_mask(old_values), null_mask(new_values)
+    differs = old_null != new_null
+    both = np.nonzero(~old_null & ~new_null)[0]
+    if not len(both):
+        return differs
+
+    # Stage 1: a bounding box that moved by more than the tolerance means a change
+    old_boxes = np.array([old_values[i].bbox for i in both], dtype=np.float64).reshape(-1, 4)
+    new_boxes = np.array([new_values[i].bbox for i in both], dtype=np.float64).reshape(-1, 4)
+    moved = np.any(np.abs(old_boxes - new_boxes) > tolerance, axis=1)
+    differs[both[moved]] = True
+
+    # Stage 2: identical WKB means no change
+    remaining = both[~moved]
+    same = np.fromiter((old_values[i].digest == new_values[i].digest for i in remaining),
+                       dtype=bool, count=len(remaining))
+
+    # Stage 3: tolerance-based equality for the few rows whose WKB differs
+    for i in remaining[~same]:
+        differs[i] = geometry_equal is None or not geometry_equal(old_values[i], new_values[i], tolerance)
+    return differs
+
+
+def column_differs(kind, old_values, new_values, tolerance=DEFAULT_TOLERANCE, geometry_equal=None):
+    """Return a boolean array flagging the positions where two value lists differ.
+
+    None is treated as NULL and only equals another NULL. Values that cannot
+    be packed into the array type of their kind are compared as untyped.
+    Geometry columns hold GeometryValue objects; geometry_equal(old, new,
+    tolerance) decides for those whose WKB differs, which otherwise count as
+    changed.
+    """
+    if kind == GEOMETRY:
+        return _differs_geometry(old_values, new_values, tolerance, geometry_equal)
+    try:
+        if kind == INTEGER:
+            return _differs_exact(old_values, new_values, np.int64, 0)
+        if kind == BOOL:
+            return _differs_exact(old_values, new_values, bool, False)
+        if kind == REAL:
+            return _differs_real(old_values, new_values, tolerance)
+        if kind == DATE:
+            return _differs_exact(old_values, new_values, 'datetime64[D]', 'NaT')
+        if kind == DATETIME:
+            return _differs_exact(old_values, new_values, 'datetime64[us]', 'NaT')
+        if kind == TEXT:
+            return _differs_text(old_values, new_values)
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return _differs_other(old_values, new_values)
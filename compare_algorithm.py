@@ -0,0 +1,176 @@
+# compare_algorithm.py
+"""Processing algorithm comparing two layers without the dialog.
+
+The algorithm runs the same fetch-and-diff phase as the dialog, in the
+calling thread, and writes the rows of the chosen statuses to a CSV,
+GeoPackage or Parquet file. Counts per status are returned as outputs, so
+the comparison can be run from the Processing toolbox, models, scripts and
+qgis_process.
+"""
+import numpy as np
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterBoolean,
+                       QgsProcessingParameterDefinition, QgsProcessingParameterEnum, QgsProcessingParameterField,
+                       QgsProcessingParameterFileDestination, QgsProcessingParameterNumber,
+                       QgsProcessingParameterVectorLayer, QgsProcessingOutputNumber, QgsProcessingOutputString)
+
+from .comparators import DEFAULT_TOLERANCE
+from .compare_task import CompareTask, default_columns_to_check, run_comparison
+from .diff_engine import UNCHANGED, STATUSES, STATUS_CODES
+from .exporters import FORMAT_FILTERS, ResultExporter
+from .instrumentation import MODEL, EXPORT
+from .keyless_match import KeylessMatcher
+from .results_model import ComparisonResultsModel
+from .spill_store import SPILL_ROWS
+
+
+class CompareLayersAlgorithm(QgsProcessingAlgorithm):
+    """Compare an old and a new layer on join fields and write the differences to a file"""
+
+    OLD = 'OLD'
+    NEW = 'NEW'
+    JOIN_FIELDS = 'JOIN_FIELDS'
+    CHECK_FIELDS = 'CHECK_FIELDS'
+    TOLERANCE = 'TOLERANCE'
+    COMPARE_GEOMETRY = 'COMPARE_GEOMETRY'
+    PUSHDOWN = 'PUSHDOWN'
+    SPILL_ROWS = 'SPILL_ROWS'
+    SUMMARY_ONLY = 'SUMMARY_ONLY'
+    KEYLESS = 'KEYLESS'
+    MATCH_DISTANCE = 'MATCH_DISTANCE'
+    STATUS_FILTER = 'STATUSES'
+    OUTPUT = 'OUTPUT'
+    STATS = 'STATS'
+    FIELD_COUNTS = 'FIELD_COUNTS'
+
+    def tr(self, message):
+        return QCoreApplication.translate('CompareLayersAlgorithm', message)
+
+    def createInstance(self):
+        return CompareLayersAlgorithm()
+
+    def name(self):
+        return 'comparelayers'
+
+    def displayName(self):
+        return self.tr('Compare layers')
+
+    def shortHelpString(self):
+        return self.tr(
+            'Compares an old and a new version of a layer or table. Features are matched on the join fields; '
+            'each feature is Added, Deleted, Modified (a checked field differs), Unchanged or Duplicate (its '
+            'join key is not unique). Rows of the selected statuses are written to a CSV, GeoPackage or Parquet '
+            'file and the number of rows per status is returned.\n\n'
+            'Checked fields default to all common fields except identifiers and timestamps such as fid, id '
+            'and modified_date.\n\n'
+            'With Summary only, rows are counted per status and per differing field in one pass and no file '
+            'is written.\n\n'
+            'With Match without key, features are paired by geometry proximity (within the match distance) and '
+            'by the share of equal checked fields, for layers whose identifiers differ; the join fields are then '
+            'optional and only pair features holding equal values.')
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.OLD, self.tr('Old layer'), [QgsProcessing.TypeVector]))
+        self.addParameter(QgsProcessingParameterVectorLayer(
+            self.NEW, self.tr('New layer'), [QgsProcessing.TypeVector]))
+        self.addParameter(QgsProcessingParameterField(
+            self.JOIN_FIELDS, self.tr('Join fields'), parentLayerParameterName=self.OLD, allowMultiple=True,
+            optional=True))
+        self.addParameter(QgsProcessingParameterField(
+            self.CHECK_FIELDS, self.tr('Fields to check for modifications'), parentLayerParameterName=self.OLD,
+            allowMultiple=True, optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TOLERANCE, self.tr('Tolerance for real number fields'), QgsProcessingParameterNumber.Double,
+            DEFAULT_TOLERANCE, minValue=0.0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.COMPARE_GEOMETRY, self.tr('Compare geometries'), False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.PUSHDOWN, self.tr('Compare in the database when both layers are tables of one database'), False))
+        spill_rows = QgsProcessingParameterNumber(
+            self.SPILL_ROWS, self.tr('Compare on disk above this many features (0: only when memory is short)'),
+            QgsProcessingParameterNumber.Integer, SPILL_ROWS, minValue=0)
+        spill_rows.setFlags(spill_rows.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(spill_rows)
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.KEYLESS, self.tr('Match without key, by geometry proximity and similar values'), False))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.MATCH_DISTANCE, self.tr('Match distance (layer units)'), QgsProcessingParameterNumber.Double,
+            0.0, minValue=0.0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.SUMMARY_ONLY, self.tr('Summary only: count the changes without writing rows'), False))
+        self.addParameter(QgsProcessingParameterEnum(
+            self.STATUS_FILTER, self.tr('Statuses to write'), options=list(STATUSES), allowMultiple=True,
+            defaultValue=[STATUS_CODES[status] for status in STATUSES if status != UNCHANGED]))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.OUTPUT, self.tr('Differences'), ';;'.join(FORMAT_FILTERS.values()), optional=True))
+
+        for status in STATUSES:
+            self.addOutput(QgsProcessingOutputNumber(status.upper(), self.tr('{} rows').format(status)))
+        self.addOutput(QgsProcessingOutputString(
+            self.FIELD_COUNTS, self.tr('Rows per differing field, with sample keys (JSON)')))
+        self.addOutput(QgsProcessingOutputString(self.STATS, self.tr('Time, rows and memory per phase (JSON)')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        old_layer = self.parameterAsVectorLayer(parameters, self.OLD, context)
+        new_layer = self.parameterAsVectorLayer(parameters, self.NEW, context)
+        if old_layer is None or new_layer is None:
+            raise QgsProcessingException(self.tr('Could not load the old and new layers'))
+        join_fields = self.parameterAsFields(parameters, self.JOIN_FIELDS, context)
+        keyless = self.parameterAsBoolean(parameters, self.KEYLESS, context)
+        if not join_fields and not keyless:
+            raise QgsProcessingException(self.tr('At least one join field is needed'))
+        fields = [field.name() for field in old_layer.fields()]
+        columns_to_check = (self.parameterAsFields(parameters, self.CHECK_FIELDS, context)
+                            or default_columns_to_check(fields))
+        matcher = None
+        if keyless:
+            matcher = KeylessMatcher(join_fields, columns_to_check,
+                                     self.parameterAsDouble(parameters, self.MATCH_DISTANCE, context))
+        statuses = [STATUSES[index] for index in self.parameterAsEnums(parameters, self.STATUS_FILTER, context)]
+        output = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+        summary_only = self.parameterAsBoolean(parameters, self.SUMMARY_ONLY, context)
+        if not output and not summary_only:
+            raise QgsProcessingException(self.tr('An output file is needed unless only a summary is asked for'))
+
+        task = CompareTask(
+            old_layer, new_layer, join_fields, fields, columns_to_check,
+            self.parameterAsDouble(parameters, self.TOLERANCE, context),
+            pushdown=self.parameterAsBoolean(parameters, self.PUSHDOWN, context),
+            compare_geometry=self.parameterAsBoolean(parameters, self.COMPARE_GEOMETRY, context),
+            spill_rows=self.parameterAsInt(parameters, self.SPILL_ROWS, context),
+            summary_only=summary_only, matcher=matcher)
+        if not run_comparison(task, feedback):
+            if task.exception is not None:
+                raise QgsProcessingException(self.tr('Comparison failed: {}').format(task.exception))
+            return {}
+
+        if task.summary is not None:
+            feedback.pushInfo(task.summary.report())
+            feedback.pushInfo(task.stats.report())
+            results = {status.upper(): task.summary.counts[status] for status in STATUSES}
+            results[self.FIELD_COUNTS] = task.summary.to_json()
+            results[self.STATS] = task.stats.to_json()
+            return results
+
+        model = ComparisonResultsModel()
+        with task.stats.phase(MODEL, len(task.records)):
+            model.set_records(task.records, task.fields, task.column_kinds)
+        task.records = []
+        counts = model.status_counts()
+        if task.unchanged_count is not None:
+            counts[UNCHANGED] += task.unchanged_count
+        for status in STATUSES:
+            feedback.pushInfo(self.tr('{}: {}').format(status, counts[status]))
+
+        rows = np.flatnonzero(model.rows_with_status(STATUS_CODES[status] for status in statuses))
+        exporter = ResultExporter(model, rows, task.column_kinds, task.layer_fields, old_layer, new_layer)
+        feedback.pushInfo(self.tr('Writing {} rows to {}').format(len(rows), output))
+        with task.stats.phase(EXPORT, len(rows)):
+            exporter.export(output, lambda done: not feedback.isCanceled())
+        feedback.pushInfo(task.stats.report())
+
+        results = {status.upper(): counts[status] for status in STATUSES}
+        results[self.OUTPUT] = output
+        results[self.STATS] = task.stats.to_json()
+        return results
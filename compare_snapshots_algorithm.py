@@ -0,0 +1,145 @@
+# compare_snapshots_algorithm.py
+"""Processing algorithm comparing an ordered series of snapshots of a layer.
+
+Each layer is read once and diffed against the previous one (see
+snapshots.py). A CSV file gets one row per feature with its status at
+each step, and the number of features per status and step is returned.
+"""
+import functools
+import time
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing, QgsProcessingAlgorithm, QgsProcessingException, QgsProcessingParameterBoolean,
+                       QgsProcessingParameterFileDestination, QgsProcessingParameterMultipleLayers,
+                       QgsProcessingParameterNumber, QgsProcessingParameterString, QgsProcessingOutputString)
+
+from .comparators import DEFAULT_TOLERANCE, GEOMETRY, GEOMETRY_FIELD, common_kind
+from .compare_task import default_columns_to_check
+from .feature_fetcher import FeatureFetcher, field_kind, geometries_equal
+from .instrumentation import FETCH, DIFF, ComparisonStats
+from .snapshots import compare_snapshots
+
+
+def snapshot_kinds(layers, fields):
+    """Map each field found in every layer to the kind used to compare it across all of them"""
+    kinds = {}
+    for name in fields:
+        indices = [layer.fields().lookupField(name) for layer in layers]
+        if min(indices) < 0:
+            continue
+        kinds[name] = functools.reduce(
+            common_kind, (field_kind(layer.fields().at(index)) for layer, index in zip(layers, indices)))
+    return kinds
+
+
+def field_names(text):
+    return [name.strip() for name in text.split(',') if name.strip()]
+
+
+class CompareSnapshotsAlgorithm(QgsProcessingAlgorithm):
+    """Compare each snapshot of a layer with the previous one and write the timeline of every feature"""
+
+    LAYERS = 'LAYERS'
+    JOIN_FIELDS = 'JOIN_FIELDS'
+    CHECK_FIELDS = 'CHECK_FIELDS'
+    TOLERANCE = 'TOLERANCE'
+    COMPARE_GEOMETRY = 'COMPARE_GEOMETRY'
+    CHANGED_ONLY = 'CHANGED_ONLY'
+    OUTPUT = 'OUTPUT'
+    STEPS = 'STEPS'
+    STATS = 'STATS'
+
+    def tr(self, message):
+        return QCoreApplication.translate('CompareSnapshotsAlgorithm', message)
+
+    def createInstance(self):
+        return CompareSnapshotsAlgorithm()
+
+    def name(self):
+        return 'comparesnapshots'
+
+    def displayName(self):
+        return self.tr('Compare snapshots')
+
+    def shortHelpString(self):
+        return self.tr(
+            'Compares a series of snapshots of a layer, given from oldest to newest. Each snapshot is read once '
+            'and compared with the previous one; features are matched on the join fields. The CSV file has one '
+            'row per feature with its status (Added, Deleted, Modified with the changed fields, Unchanged or '
+            'Duplicate) at each step, and the number of features per status and step is returned as JSON.\n\n'
+            'Join and checked fields are given as comma separated names; checked fields default to all fields '
+            'of the first snapshot except identifiers and timestamps.')
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterMultipleLayers(
+            self.LAYERS, self.tr('Snapshots, oldest first'), QgsProcessing.TypeVector))
+        self.addParameter(QgsProcessingParameterString(
+            self.JOIN_FIELDS, self.tr('Join fields (comma separated)')))
+        self.addParameter(QgsProcessingParameterString(
+            self.CHECK_FIELDS, self.tr('Fields to check for modifications (comma separated)'), optional=True))
+        self.addParameter(QgsProcessingParameterNumber(
+            self.TOLERANCE, self.tr('Tolerance for real number fields'), QgsProcessingParameterNumber.Double,
+            DEFAULT_TOLERANCE, minValue=0.0))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.COMPARE_GEOMETRY, self.tr('Compare geometries'), False))
+        self.addParameter(QgsProcessingParameterBoolean(
+            self.CHANGED_ONLY, self.tr('Leave out features unchanged at every step'), True))
+        self.addParameter(QgsProcessingParameterFileDestination(
+            self.OUTPUT, self.tr('Timeline'), 'CSV files (*.csv)'))
+
+        self.addOutput(QgsProcessingOutputString(self.STEPS, self.tr('Features per status and step (JSON)')))
+        self.addOutput(QgsProcessingOutputString(self.STATS, self.tr('Time, rows and memory per phase (JSON)')))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        layers = self.parameterAsLayerList(parameters, self.LAYERS, context)
+        if len(layers) < 2:
+            raise QgsProcessingException(self.tr('At least two snapshots are needed'))
+        join_fields = field_names(self.parameterAsString(parameters, self.JOIN_FIELDS, context))
+        fields = [field.name() for field in layers[0].fields()]
+        missing = [field for field in join_fields if any(layer.fields().lookupField(field) < 0 for layer in layers)]
+        if not join_fields or missing:
+            raise QgsProcessingException(
+                self.tr('Join fields must be found in every snapshot: {}').format(', '.join(missing)))
+        columns_to_check = (field_names(self.parameterAsString(parameters, self.CHECK_FIELDS, context))
+                            or default_columns_to_check(fields))
+        compare_geometry = (self.parameterAsBoolean(parameters, self.COMPARE_GEOMETRY, context)
+                            and all(layer.isSpatial() for layer in layers))
+        output = self.parameterAsFileOutput(parameters, self.OUTPUT, context)
+
+        kinds = snapshot_kinds(layers, fields)
+        fetched_fields = list(fields)
+        if compare_geometry:
+            fields.append(GEOMETRY_FIELD)
+            columns_to_check.append(GEOMETRY_FIELD)
+            kinds[GEOMETRY_FIELD] = GEOMETRY
+        compare_fields = [field for field in fields if field in kinds]
+        stats = ComparisonStats()
+
+        def snapshot_rows():
+            for number, layer in enumerate(layers):
+                feedback.pushInfo(self.tr('Reading {}').format(layer.name()))
+                fetcher = FeatureFetcher(layer, layer.fields(), fetched_fields, join_fields,
+                                         with_geometry=compare_geometry)
+                with stats.phase(FETCH) as phase:
+                    rows = [(key, values) for fid, key, values in fetcher.rows(ordered=False)]
+                    phase.rows += len(rows)
+                feedback.setProgress(100.0 * (number + 1) / len(layers))
+                yield rows
+
+        # Reading is counted as fetch, the rest as diff
+        started = time.perf_counter()
+        timeline = compare_snapshots(
+            [layer.name() for layer in layers], snapshot_rows(), columns_to_check, kinds,
+            self.parameterAsDouble(parameters, self.TOLERANCE, context), compare_fields, geometries_equal,
+            feedback.isCanceled)
+        stats.add(DIFF, time.perf_counter() - started - stats.get(FETCH).seconds, stats.get(FETCH).rows)
+        stats.finish(DIFF)
+        if timeline is None:
+            return {}
+
+        for name, counts in zip(timeline.step_names(), timeline.step_counts()):
+            feedback.pushInfo(self.tr('{}: {}').format(
+                name, ', '.join('{} {}'.format(status, count) for status, count in counts.items())))
+        timeline.write_csv(output, join_fields, self.parameterAsBoolean(parameters, self.CHANGED_ONLY, context))
+        feedback.pushInfo(stats.report())
+        return {self.OUTPUT: output, self.STEPS: timeline.to_json(), self.STATS: stats.to_json()}
@@ -0,0 +1,426 @@
+# compare_task.py
+"""Background task running the fetch-and-diff phase of a comparison.
+
+Layers must not be touched outside the main thread, so the task reads from
+QgsVectorLayerFeatureSource snapshots created when it is constructed.
+"""
+import os
+import time
+
+from qgis.core import QgsTask, QgsVectorLayerFeatureSource, QgsProviderRegistry, QgsDataSourceUri
+
+from .comparators import DEFAULT_TOLERANCE, INTEGER, REAL, GEOMETRY, GEOMETRY_FIELD
+from .diff_engine import CHUNK_SIZE, UnorderedKeysError, diff_rows, indexed_rows, row_fingerprint
+from .feature_fetcher import FeatureFetcher, column_kinds, field_kind, python_value, geometries_equal
+from .fingerprint_cache import cache_key
+from .instrumentation import FETCH, DIFF, DATABASE_DIFF, MATCH, ComparisonStats
+from .result_store import ResultStore
+from .spill_store import SPILL_ROWS, OLD_TABLE, NEW_TABLE, Spill, SpillDatabase, spill_needed
+from .summary import ComparisonSummary
+from .sql_pushdown import SQLITE, POSTGRES, PushdownPlan, SqliteExecutor, quote_table
+
+# File extensions of OGR datasources that can be queried with SQLite
+SQLITE_EXTENSIONS = ('.gpkg', '.sqlite', '.db')
+
+# Fields not checked by default: identifiers and timestamps maintained by the data source
+SYSTEM_FIELDS = ('fid', 'id', 'objectid', 'gid', 'created_date', 'modified_date', 'timestamp')
+
+
+def default_columns_to_check(fields):
+    """Return the fields checked for modifications unless chosen otherwise"""
+    return [field for field in fields if field.lower() not in SYSTEM_FIELDS]
+
+
+def source_version(layer):
+    """Return a token that changes whenever the data of a file based layer changes, or None.
+
+    Layers with unsaved edits or without a local file have no version, so
+    their fingerprints are never reused.
+    """
+    if layer.isModified():
+        return None
+    path = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source()).get('path')
+    if not path or not os.path.isfile(path):
+        return None
+    parts = [str(layer.featureCount())]
+    # SQLite based formats may hold recent writes in a write-ahead log next to the file
+    for file_path in (path, path + '-wal'):
+        if os.path.isfile(file_path):
+            stat = os.stat(file_path)
+            parts.append("{}:{}".format(stat.st_mtime_ns, stat.st_size))
+    return "|".join(parts)
+
+
+def database_table(layer):
+    """Return (dialect, database, schema, table) for a layer read directly from an SQL database, or None.
+
+    Layers with a subset filter or unsaved edits are not plain tables and return None.
+    """
+    if layer.subsetString() or layer.isModified():
+        return None
+    provider = layer.providerType()
+    if provider == 'ogr':
+        parts = QgsProviderRegistry.instance().decodeUri(provider, layer.source())
+        path, table = parts.get('path'), parts.get('layerName')
+        if not path or not table or os.path.splitext(path)[1].lower() not in SQLITE_EXTENSIONS:
+            return None
+        return SQLITE, os.path.normcase(os.path.abspath(path)), None, table
+    if provider == 'spatialite':
+        uri = QgsDataSourceUri(layer.source())
+        return SQLITE, os.path.normcase(os.path.abspath(uri.database())), None, uri.table()
+    if provider == 'postgres':
+        uri = QgsDataSourceUri(layer.source())
+        if uri.table().startswith('('):
+            return None  # Query layer
+        return POSTGRES, uri.connectionInfo(False), uri.schema(), uri.table()
+    return None
+
+
+def feature_id_column(layer):
+    """Return the column of a database table holding the layer's feature ids, or None if there is none.
+
+    An integer primary key gives the feature ids; otherwise SQLite tables
+    use their rowid, while PostgreSQL ids are not stored in the table.
+    """
+    keys = layer.primaryKeyAttributes()
+    if len(keys) == 1 and field_kind(layer.fields().at(keys[0])) == INTEGER:
+        return layer.fields().at(keys[0]).name()
+    return "rowid" if layer.providerType() != 'postgres' else None
+
+
+def pushdown_plan(old_layer, new_layer, join_fields, fields, kinds, tolerance):
+    """Return (PushdownPlan, database) if both layers are tables of the same database, otherwise None"""
+    old_table, new_table = database_table(old_layer), database_table(new_layer)
+    if old_table is None or new_table is None or old_table[:2] != new_table[:2]:
+        return None
+    # Geometries of results are fetched by feature id when applying decisions and exporting
+    id_columns = feature_id_column(old_layer), feature_id_column(new_layer)
+    if None in id_columns:
+        return None
+    # Only fields present in both tables can be selected from both sides
+    fields = [field for field in fields if field in kinds or field in join_fields]
+    compare_fields = [field for field in fields if field in kinds]
+    real_fields = [field for field in compare_fields if kinds[field] == REAL]
+    plan = PushdownPlan(old_table[0], quote_table(*old_table[2:]), quote_table(*new_table[2:]), join_fields,
+                        fields, compare_fields, real_fields, tolerance, id_columns)
+    return plan, old_table[1]
+
+
+def without_geometry(rows):
+    """Yield (key, values) rows with the values of every field but the geometry; fetched rows are read-only"""
+    for key, values in rows:
+        yield key, {field: value for field, value in values.items() if field != GEOMETRY_FIELD}
+
+
+class ConnectionExecutor:
+    """Callable running queries through a QGIS database provider connection"""
+
+    def __init__(self, provider, uri):
+        self.connection = QgsProviderRegistry.instance().providerMetadata(provider).createConnection(uri, {})
+
+    def __call__(self, sql):
+        return self.connection.executeSql(sql)
+
+    def close(self):
+        pass
+
+
+class CompareTask(QgsTask):
+    """Compare two layers in the background and keep the diff records for the dialog"""
+
+    def __init__(self, old_layer, new_layer, join_fields, fields, columns_to_check, tolerance=DEFAULT_TOLERANCE,
+                 fingerprint_cache=None, pushdown=False, compare_geometry=False, spill_rows=SPILL_ROWS,
+                 spill_memory_mb=None, summary_only=False, statuses=None, matcher=None):
+        super().__init__("Comparing {} and {}".format(old_layer.name(), new_layer.name()), QgsTask.CanCancel)
+        # Geometries are only fetched and compared when asked for, and only if both layers have them
+        compare_geometry = compare_geometry and old_layer.isSpatial() and new_layer.isSpatial()
+        # A KeylessMatcher pairs features instead of the join fields, by proximity when both layers have geometry
+        self.matcher = matcher
+        with_geometry = compare_geometry or (matcher is not None and old_layer.isSpatial() and new_layer.isSpatial())
+        self.old_fetcher = FeatureFetcher(QgsVectorLayerFeatureSource(old_layer), old_layer.fields(), fields,
+                                          join_fields, with_geometry=with_geometry)
+        self.new_fetcher = FeatureFetcher(QgsVectorLayerFeatureSource(new_layer), new_layer.fields(), fields,
+                                          join_fields, with_geometry=with_geometry)
+        self.layer_ids = (old_layer.id(), new_layer.id())
+        self.layer_fields = new_layer.fields()
+        self.join_fields = list(join_fields)
+        self.fields = list(fields)
+        self.columns_to_check = list(columns_to_check)
+        self.column_kinds = column_kinds(old_layer.fields(), new_layer.fields(), fields)
+        if compare_geometry:
+            # Geometry is shown and checked like one more column
+            self.fields.append(GEOMETRY_FIELD)
+            self.columns_to_check.append(GEOMETRY_FIELD)
+            self.column_kinds[GEOMETRY_FIELD] = GEOMETRY
+        self.compare_geometry = compare_geometry
+        # Every common field is compared so the checked columns can change without a re-run
+        self.compare_fields = [field for field in self.fields if field in self.column_kinds]
+        self.tolerance = tolerance
+        self.total_features = max(old_layer.featureCount(), 0) + max(new_layer.featureCount(), 0)
+
+        # Fingerprints of the old layer are reused while its source is unchanged
+        self.fingerprint_cache = fingerprint_cache
+        self.cache_key = cache_key(
+            old_layer.providerType(), old_layer.source(), self.join_fields, self.compare_fields,
+            [(field.name(), field.typeName()) for field in old_layer.fields()])
+        self.cache_version = source_version(old_layer)
+        self.used_cache = False
+
+        # Layers of one SQL database can be diffed inside the database
+        self.pushdown_plan = self.pushdown_database = None
+        if pushdown and not compare_geometry and matcher is None:
+            self.pushdown_plan, self.pushdown_database = (
+                pushdown_plan(old_layer, new_layer, self.join_fields, fields, self.column_kinds, tolerance) or (None, None))
+        self.unchanged_count = None  # Unchanged rows counted but not listed
+
+        # Summaries only count rows, so they never need more memory than a chunk
+        self.summary_only = summary_only
+        self.summary = None  # ComparisonSummary of a summary-only comparison
+        # Records of other statuses are counted but not kept; comparisons on disk keep them all
+        self.statuses = set(statuses) if statuses is not None else None
+
+        # Comparisons too large for memory run in a temporary SQLite database
+        self.spilled = not summary_only and matcher is None and spill_needed(
+            self.total_features, len(self.fields) + 2, spill_rows, spill_memory_mb)
+
+        self.features_read = 0
+        self.rows_diffed = 0
+        self.records = []  # ResultStore of the finished comparison
+        self.exception = None
+        self.stats = ComparisonStats()
+
+    def source_rows(self, fetcher, ordered=True, cache_writer=None):
+        """Yield (key, values) pairs for each feature fetched, optionally ordered by the join fields.
+
+        With a cache writer, the fingerprint of every row read is recorded for later runs.
+        """
+        batches = fetcher.batches(ordered)
+        while True:
+            with self.stats.phase(FETCH) as phase:
+                batch = next(batches, None)
+                if batch is not None:
+                    phase.rows += len(batch)
+            if batch is None:
+                return
+            if self.isCanceled():
+                return  # run() notices the cancellation and discards the partial result
+            for fid, key, values in batch.rows(self.join_fields):
+                if cache_writer is not None:
+                    cache_writer.add(key, fid, row_fingerprint(values, self.compare_fields))
+                yield key, values
+            self.features_read += len(batch)
+            if self.total_features:
+                self.setProgress(min(100.0, 100.0 * self.features_read / self.total_features))
+
+    def load_old(self, cached_rows):
+        """Fetch the values of old rows known only from the fingerprint cache"""
+        with self.stats.phase(FETCH, len(cached_rows)):
+            rows = self.old_fetcher.rows(ordered=False, fids=[row.fid for row in cached_rows])
+            values_by_fid = {fid: values for fid, key, values in rows}
+        return [values_by_fid.get(row.fid, {}) for row in cached_rows]
+
+    def collect(self, records):
+        """Store records chunk by chunk in a new ResultStore, counting them as they come.
+
+        In summary-only mode the records are only added to a ComparisonSummary.
+        """
+        self.rows_diffed = 0
+        if self.summary_only:
+            self.summary = ComparisonSummary(self.compare_fields, self.columns_to_check)
+            for record in records:
+                self.summary.add(record)
+                self.rows_diffed += 1
+                if self.rows_diffed % CHUNK_SIZE == 0 and self.isCanceled():
+                    break
+            return
+        self.records = ResultStore(self.fields, self.column_kinds, self.join_fields, self.columns_to_check)
+        chunk = []
+        for record in records:
+            self.rows_diffed += 1
+            if self.statuses is not None and record.status not in self.statuses:
+                continue
+            chunk.append(record)
+            if len(chunk) >= CHUNK_SIZE:
+                self.records.extend(chunk)
+                chunk = []
+                if self.isCanceled():
+                    break  # run() notices the cancellation and discards the partial result
+        self.records.extend(chunk)
+        self.records.finish()
+
+    def diff(self, old_rows, new_rows, cached=False):
+        """Collect the diff records of two row iterators.
+
+        Time spent reading rows is counted as fetch, the rest as diff.
+        """
+        fetch_seconds = self.stats.get(FETCH).seconds
+        started = time.perf_counter()
+        try:
+            self.collect(diff_rows(
+                old_rows, new_rows, self.columns_to_check, self.column_kinds, self.tolerance,
+                fingerprints=cached, load_old=self.load_old if cached else None, compare_fields=self.compare_fields,
+                geometry_equal=geometries_equal))
+        finally:
+            fetched = self.stats.get(FETCH).seconds - fetch_seconds
+            self.stats.add(DIFF, time.perf_counter() - started - fetched, self.rows_diffed)
+            self.stats.finish(DIFF)
+
+    def run_pushdown(self):
+        """Diff inside the database; only changed rows are fetched.
+
+        Return False, without a result, if a table repeats a join key.
+        """
+        plan = self.pushdown_plan
+        if plan.dialect == SQLITE:
+            execute = SqliteExecutor(self.pushdown_database)
+        else:
+            execute = ConnectionExecutor(plan.dialect, self.pushdown_database)
+        try:
+            with self.stats.phase(DATABASE_DIFF) as phase:
+                if plan.has_duplicate_keys(execute):
+                    return False
+                records, self.unchanged_count = plan.run(execute, self.columns_to_check, python_value)
+                self.collect(records)
+                if self.summary is not None:
+                    self.summary.add_unchanged(self.unchanged_count)
+                phase.rows = self.rows_diffed
+        finally:
+            execute.close()
+        return True
+
+    def run_spill(self):
+        """Copy both layers batch by batch to a temporary SQLite database and diff them there"""
+        database = SpillDatabase()
+        # Long queries stop when the task is canceled
+        database.connection.set_progress_handler(lambda: 1 if self.isCanceled() else 0, 100000)
+        spill = Spill(database, self.join_fields, self.fields, self.column_kinds, self.compare_fields, self.tolerance)
+        for fetcher, table in ((self.old_fetcher, OLD_TABLE), (self.new_fetcher, NEW_TABLE)):
+            batches = fetcher.batches(ordered=False)
+            while True:
+                with self.stats.phase(FETCH) as phase:
+                    batch = next(batches, None)
+                    if batch is not None:
+                        spill.insert(table, batch)
+                        phase.rows += len(batch)
+                if batch is None or self.isCanceled():
+                    break
+                self.features_read += len(batch)
+                if self.total_features:
+                    self.setProgress(min(100.0, 100.0 * self.features_read / self.total_features))
+        if self.isCanceled():
+            database.close()
+            return
+        with self.stats.phase(DIFF) as phase:
+            self.records = spill.run(self.columns_to_check, self.fields, geometries_equal)
+            self.rows_diffed = phase.rows = len(self.records)
+
+    def run_keyless(self):
+        """Pair the features of both layers with the matcher, then diff the pairs like matched keys"""
+        old_rows = [values for key, values in self.source_rows(self.old_fetcher, ordered=False)]
+        new_rows = [values for key, values in self.source_rows(self.new_fetcher, ordered=False)]
+        if self.isCanceled():
+            return
+        with self.stats.phase(MATCH, len(old_rows) + len(new_rows)):
+            old_rows, new_rows = self.matcher.keyed_rows(old_rows, new_rows, self.isCanceled)
+        if not self.compare_geometry:
+            # Fetched for matching only, and not kept in the results
+            self.diff(without_geometry(old_rows), without_geometry(new_rows))
+        else:
+            self.diff(iter(old_rows), iter(new_rows))
+
+    def run(self):
+        if self.matcher is not None:
+            try:
+                self.run_keyless()
+            except Exception as e:
+                self.exception = e
+                return False
+            if self.isCanceled():
+                self.records = []
+                return False
+            self.setProgress(100.0)
+            return True
+
+        if self.pushdown_plan is not None:
+            try:
+                pushed_down = self.run_pushdown()
+            except Exception as e:
+                self.exception = e
+                return False
+            if self.isCanceled():
+                self.records = []
+                return False
+            if pushed_down:
+                self.spilled = False
+                self.setProgress(100.0)
+                return True
+            # Duplicate keys are reported by the local diff
+            self.pushdown_plan = None
+
+        if self.spilled:
+            try:
+                self.run_spill()
+            except Exception as e:
+                if not self.isCanceled():
+                    self.exception = e
+                    return False
+            if self.isCanceled():
+                self.records = []
+                return False
+            self.setProgress(100.0)
+            return True
+
+        cached_rows = None
+        cache_writer = None
+        if self.fingerprint_cache is not None:
+            cached_rows = self.fingerprint_cache.rows(self.cache_key, self.cache_version)
+            if cached_rows is None:
+                cache_writer = self.fingerprint_cache.writer(self.cache_key, self.cache_version)
+        self.used_cache = cached_rows is not None
+
+        def old_rows(ordered=True):
+            if cached_rows is not None:
+                return cached_rows
+            if cache_writer is not None:
+                cache_writer.begin()
+            return self.source_rows(self.old_fetcher, ordered, cache_writer)
+
+        try:
+            try:
+                self.diff(old_rows(), self.source_rows(self.new_fetcher), self.used_cache)
+            except UnorderedKeysError:
+                # The provider ordered the keys differently (e.g. collation), index them by key here instead
+                self.features_read = 0
+                if cached_rows is not None:
+                    cached_rows = list(self.fingerprint_cache.rows(self.cache_key, self.cache_version))
+                self.diff(indexed_rows(old_rows(ordered=False)),
+                          indexed_rows(self.source_rows(self.new_fetcher, ordered=False)), self.used_cache)
+        except Exception as e:
+            if cache_writer is not None:
+                cache_writer.discard()
+            self.exception = e
+            return False
+
+        if self.isCanceled():
+            if cache_writer is not None:
+                cache_writer.discard()
+            self.records = []
+            return False
+        if cache_writer is not None:
+            cache_writer.commit()
+        self.setProgress(100.0)
+        return True
+
+
+def run_comparison(task, feedback=None):
+    """Run a CompareTask in the calling thread instead of the task manager.
+
+    Progress is reported to an optional QgsFeedback, whose cancellation
+    cancels the task. Return True if the comparison finished.
+    """
+    if feedback is not None:
+        task.progressChanged.connect(feedback.setProgress)
+        feedback.canceled.connect(task.cancel)
+        if feedback.isCanceled():
+            task.cancel()
+    return task.run()
@@ -0,0 +1,90 @@
+# decision_store.py
+"""Accept/reject decisions of comparison results.
+
+Decisions are kept as small integer codes in one array per result row, plus
+one array per field for decisions taken on individual changed fields, so
+bulk operations are single array fills and exports read the state directly.
+"""
+import numpy as np
+
+PENDING = 0
+ACCEPTED = 1
+REJECTED = 2
+
+DECISION_LABELS = {
+    PENDING: "Pending",
+    ACCEPTED: "Accepted",
+    REJECTED: "Rejected",
+}
+
+
+class DecisionStore:
+    """Row and per-field decision codes for a fixed number of result rows"""
+
+    def __init__(self, count=0):
+        self.reset(count)
+
+    def reset(self, count):
+        """Forget all decisions and size the store for count rows"""
+        self.rows = np.zeros(count, dtype=np.int8)
+        self.fields = {}  # Field -> decision per row, overriding the row decision for that field
+
+    def __len__(self):
+        return len(self.rows)
+
+    def append(self, count):
+        """Add count pending rows at the end"""
+        self.rows = np.concatenate([self.rows, np.zeros(count, dtype=np.int8)])
+        for field, field_decisions in self.fields.items():
+            self.fields[field] = np.concatenate([field_decisions, np.zeros(count, dtype=np.int8)])
+
+    def remove(self, rows):
+        """Drop the decisions of rows, shifting the following rows up"""
+        self.rows = np.delete(self.rows, rows)
+        for field, field_decisions in self.fields.items():
+            self.fields[field] = np.delete(field_decisions, rows)
+
+    def set_rows(self, rows, decision):
+        """Set the decision of rows (indices or boolean mask), replacing their field decisions"""
+        self.rows[rows] = decision
+        for field_decisions in self.fields.values():
+            field_decisions[rows] = PENDING
+
+    def set_field(self, rows, field, decision):
+        """Set the decision of one field for rows (indices or boolean mask)"""
+        field_decisions = self.fields.get(field)
+        if field_decisions is None:
+            field_decisions = self.fields[field] = np.zeros(len(self.rows), dtype=np.int8)
+        field_decisions[rows] = decision
+
+    def decided(self):
+        """Return a boolean mask of the rows with a decision on the row or on any of its fields"""
+        mask = self.rows != PENDING
+        for field_decisions in self.fields.values():
+            mask |= field_decisions != PENDING
+        return mask
+
+    def row(self, row):
+        """Return the decision code of a row"""
+        return int(self.rows[row])
+
+    def field(self, row, field):
+        """Return the decision code of a field of a row, falling back to the row decision"""
+        field_decisions = self.fields.get(field)
+        if field_decisions is not None and field_decisions[row] != PENDING:
+            return int(field_decisions[row])
+        return int(self.rows[row])
+
+    def label(self, row):
+        """Return the decision of a row as text, followed by the fields decided otherwise.
+
+        For example "Accepted; name: Rejected" when all changes but the name
+        were accepted.
+        """
+        decision = self.row(row)
+        labels = [DECISION_LABELS[decision]]
+        for field, field_decisions in self.fields.items():
+            field_decision = int(field_decisions[row])
+            if field_decision not in (PENDING, decision):
+                labels.append("{}: {}".format(field, DECISION_LABELS[field_decision]))
+        return "; ".join(labels)
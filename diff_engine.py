@@ -0,0 +1,389 @@
+# diff_engine.py
+"""Qt-free comparison engine for Table Compare.
+
+The engine consumes two iterators of ``(key, values)`` pairs, both ordered by
+key, and yields one DiffRecord per key using a streaming sort-merge join;
+keys found more than once on a side yield a Duplicate record per row.
+Matched rows are buffered in chunks so their values can be compared column
+at a time (see comparators.py); memory is bounded by the chunk size, not by
+the size of the layers.
+
+Rows can also be compared by fingerprint: a hash over the compared columns.
+Matched rows with equal fingerprints are Unchanged without comparing any
+field, and the old side may be given as CachedRow placeholders (feature id
+and fingerprint only) whose values are loaded on demand for the few rows
+that need them.
+"""
+import hashlib
+import operator
+from collections.abc import Mapping
+
+import numpy as np
+
+from .comparators import (DEFAULT_TOLERANCE, INTEGER, REAL, TEXT, DATE, DATETIME, BOOL, OTHER, FID_FIELD,
+                          column_differs, null_mask)
+
+ADDED = "Added"
+DELETED = "Deleted"
+MODIFIED = "Modified"
+UNCHANGED = "Unchanged"
+DUPLICATE = "Duplicate"
+
+STATUSES = (ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE)
+
+# Compact status codes used by result arrays
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+# Number of records buffered before the matched rows are compared
+CHUNK_SIZE = 10000
+
+
+class UnorderedKeysError(ValueError):
+    """Raised when an input iterator is not ordered by key"""
+
+
+class DiffRecord:
+    """Result of comparing one key between the old and the new table"""
+
+    __slots__ = ('key', 'status', 'old', 'new', 'changed', 'differing')
+
+    def __init__(self, key, status, old=None, new=None, changed=(), differing=()):
+        self.key = key
+        self.status = status
+        self.old = old              # mapping of field -> value, None for added rows
+        self.new = new              # mapping of field -> value, None for deleted rows
+        self.changed = changed      # checked fields whose values differ
+        self.differing = differing  # all compared fields whose values differ
+
+    def recheck(self, columns_to_check):
+        """Derive changed fields and status of a matched record for another set of checked columns"""
+        self.changed = tuple(field for field in self.differing if field in columns_to_check)
+        self.status = MODIFIED if self.changed else UNCHANGED
+
+    @property
+    def side(self):
+        """"old" or "new": the table a record's values come from, "new" for matched rows"""
+        return "old" if self.new is None else "new"
+
+    @property
+    def data(self):
+        """Values shown for this record (new values unless deleted)"""
+        return self.new if self.new is not None else self.old
+
+    def __repr__(self):
+        return "DiffRecord({!r}, {!r}, changed={!r})".format(self.key, self.status, self.changed)
+
+
+class CachedRow:
+    """Placeholder for an old row known only by its feature id and fingerprint"""
+
+    __slots__ = ('fid', 'fingerprint')
+
+    def __init__(self, fid, fingerprint):
+        self.fid = fid
+        self.fingerprint = fingerprint
+
+
+class ColumnRow(Mapping):
+    """Read-only values of one row of a batch kept as columns: field -> list of values.
+
+    Rows share the column lists of their batch instead of holding a dict
+    each, and compare_chunk() reads a field of consecutive rows of a batch
+    as a slice of its column.
+    """
+
+    __slots__ = ('columns', 'row')
+
+    def __init__(self, columns, row):
+        self.columns = columns
+        self.row = row
+
+    def __getitem__(self, field):
+        return self.columns[field][self.row]
+
+    def __contains__(self, field):
+        return field in self.columns
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __repr__(self):
+        return "ColumnRow({!r})".format(dict(self))
+
+
+def column_values(rows, field):
+    """Return the values of a field in a list of rows, taken from the batch columns of ColumnRow runs"""
+    values = []
+    columns, positions = None, []
+
+    def take():
+        column = columns[field]
+        if positions[-1] - positions[0] + 1 == len(positions):
+            values.extend(column[positions[0]:positions[-1] + 1])
+        elif len(positions) == 1:
+            values.append(column[positions[0]])
+        else:
+            values.extend(operator.itemgetter(*positions)(column))
+
+    for row in rows:
+        if isinstance(row, ColumnRow):
+            if row.columns is not columns:
+                if positions:
+                    take()
+                columns, positions = row.columns, []
+            positions.append(row.row)
+        else:
+            if positions:
+                take()
+                columns, positions = None, []
+            values.append(row[field])
+    if positions:
+        take()
+    return values
+
+
+def _canonical(value):
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    if isinstance(value, float):
+        # Integral reals hash like integers so 1 and 1.0 share a fingerprint
+        return int(value) if value.is_integer() else value
+    return (type(value).__name__, str(value))
+
+
+def row_fingerprint(values, columns):
+    """Return a 16 byte hash over the values of the given columns of a row"""
+    canonical = repr(tuple(_canonical(values.get(column)) for column in columns))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).digest()
+
+
+def join_key(values, join_fields):
+    """Return the join key of a row: the value of a single join field or a tuple for composite keys"""
+    if len(join_fields) == 1:
+        return values.get(join_fields[0])
+    return tuple(values.get(field) for field in join_fields)
+
+
+def sort_key(value):
+    """Total ordering key for join values of mixed type, NULLs first"""
+    if isinstance(value, tuple):
+        return (4, tuple(sort_key(part) for part in value))
+    if value is None:
+        return (0, 0)
+    if isinstance(value, bool):
+        return (1, int(value))
+    if isinstance(value, (int, float)):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, str(value))
+
+
+# Array types used to sort the values of each kind
+SORT_DTYPES = {
+    INTEGER: (np.int64, 0),
+    REAL: (np.float64, 0.0),
+    BOOL: (np.int8, 0),
+    DATE: ('datetime64[D]', 'NaT'),
+    DATETIME: ('datetime64[us]', 'NaT'),
+    TEXT: (str, ""),
+}
+
+
+def sort_order(values, kind=OTHER):
+    """Return the rows of values in ascending order, NULLs first, as a stable argsort.
+
+    Values of a typed kind are packed into a NumPy array and sorted on that
+    array, so numbers and dates sort by value rather than by text. Values
+    that do not fit the array type of their kind fall back to sort_key.
+    """
+    if kind in SORT_DTYPES:
+        dtype, fill = SORT_DTYPES[kind]
+        nulls = null_mask(values)
+        try:
+            typed = np.array([fill if value is None else value for value in values], dtype=dtype)
+        except (TypeError, ValueError, OverflowError):
+            pass
+        else:
+            # Last key is the primary one: NULLs (True) before values
+            return np.lexsort((typed, ~nulls))
+    return np.array(sorted(range(len(values)), key=lambda row: sort_key(values[row])), dtype=np.int64)
+
+
+def _fingerprint(values, compare_fields):
+    if isinstance(values, CachedRow):
+        return values.fingerprint
+    return row_fingerprint(values, compare_fields)
+
+
+def resolve_chunk(records, compare_fields, load_old=None, fingerprints=False):
+    """Settle the matched records of a chunk whose fingerprints are equal.
+
+    Old rows given as CachedRow are replaced with their values through
+    load_old(cached_rows) when they are still needed, i.e. for deleted rows
+    and for matched rows whose fingerprints differ.
+    """
+    if not fingerprints and load_old is None:
+        return
+
+    pending = []
+    for record in records:
+        if record.status is None and (fingerprints or isinstance(record.old, CachedRow)):
+            if _fingerprint(record.old, compare_fields) == row_fingerprint(record.new, compare_fields):
+                record.status = UNCHANGED
+                if isinstance(record.old, CachedRow):
+                    # Equal in every compared column, but the old feature keeps its own id
+                    fid = record.old.fid
+                    record.old = dict(record.new)
+                    if FID_FIELD in record.old:
+                        record.old[FID_FIELD] = fid
+                continue
+        if isinstance(record.old, CachedRow):
+            pending.append(record)
+
+    if pending:
+        for record, values in zip(pending, load_old([record.old for record in pending])):
+            record.old = values
+
+
+def compare_chunk(records, columns_to_check, column_kinds=None, tolerance=DEFAULT_TOLERANCE, compare_fields=None,
+                  geometry_equal=None):
+    """Set status, changed and differing fields of the matched records in a chunk.
+
+    Each compared field (the checked ones unless compare_fields is given) is
+    compared for all matched records at once; fields missing from
+    column_kinds are compared as untyped values. Differences in unchecked
+    fields are kept in DiffRecord.differing so the checked columns can be
+    changed later without comparing again.
+    """
+    matched = [record for record in records if record.status is None]
+    if not matched:
+        return
+    column_kinds = column_kinds or {}
+
+    changed = [[] for _ in matched]
+    old_rows = [record.old for record in matched]
+    new_rows = [record.new for record in matched]
+    for field in (columns_to_check if compare_fields is None else compare_fields):
+        rows = [i for i, (old, new) in enumerate(zip(old_rows, new_rows)) if field in old and field in new]
+        if not rows:
+            continue
+        if len(rows) == len(matched):
+            old_values, new_values = column_values(old_rows, field), column_values(new_rows, field)
+        else:
+            old_values = column_values([old_rows[i] for i in rows], field)
+            new_values = column_values([new_rows[i] for i in rows], field)
+        differs = column_differs(column_kinds.get(field, OTHER), old_values, new_values, tolerance, geometry_equal)
+        for position in differs.nonzero()[0]:
+            changed[rows[position]].append(field)
+
+    columns_to_check = set(columns_to_check)
+    for record, fields in zip(matched, changed):
+        record.differing = tuple(fields)
+        record.recheck(columns_to_check)
+
+
+def _grouped(rows, side):
+    """Yield (sort key, key, values list) for each run of rows sharing a key, checking the key order"""
+    previous = None
+    group = []
+    for key, values in rows:
+        current = sort_key(key)
+        if group:
+            if current < previous[0]:
+                raise UnorderedKeysError(
+                    "{} rows are not ordered by key ({!r} after {!r})".format(side, key, previous[1]))
+            if current != previous[0]:
+                yield previous[0], previous[1], group
+                group = []
+        previous = (current, key)
+        group.append(values)
+    if group:
+        yield previous[0], previous[1], group
+
+
+def diff_rows(old_rows, new_rows, columns_to_check, column_kinds=None, tolerance=DEFAULT_TOLERANCE,
+              chunk_size=CHUNK_SIZE, fingerprints=False, load_old=None, compare_fields=None,
+              geometry_equal=None):
+    """Yield a DiffRecord per key from two key-ordered (key, values) iterators.
+
+    Keys are compared with sort_key(), so both iterators must be ordered
+    consistently with it; UnorderedKeysError is raised as soon as a key is
+    found out of order. column_kinds maps field names to comparator kinds
+    and tolerance applies to real fields.
+
+    A key found more than once on either side cannot be matched: every row
+    with that key, from both sides, is reported as DUPLICATE instead.
+
+    compare_fields lists the fields compared (and fingerprinted); it
+    defaults to the checked columns and may include more, so the checked
+    set can later be changed with DiffRecord.recheck().
+
+    With fingerprints, matched rows with equal fingerprints skip the field
+    comparison. Old values may be CachedRow placeholders, in which case
+    load_old(cached_rows) must return their values in the same order.
+
+    geometry_equal is passed to column_differs() for geometry columns.
+    """
+    if compare_fields is None:
+        compare_fields = list(columns_to_check)
+    old_iter = _grouped(old_rows, "Old")
+    new_iter = _grouped(new_rows, "New")
+    old_group = next(old_iter, None)
+    new_group = next(new_iter, None)
+    chunk = []
+
+    while old_group is not None or new_group is not None:
+        if new_group is None or (old_group is not None and old_group[0] < new_group[0]):
+            old_values, new_values = old_group[2], ()
+            key = old_group[1]
+            old_group = next(old_iter, None)
+        elif old_group is None or new_group[0] < old_group[0]:
+            old_values, new_values = (), new_group[2]
+            key = new_group[1]
+            new_group = next(new_iter, None)
+        else:
+            old_values, new_values = old_group[2], new_group[2]
+            key = new_group[1]
+            old_group = next(old_iter, None)
+            new_group = next(new_iter, None)
+
+        if len(old_values) > 1 or len(new_values) > 1:
+            chunk.extend(DiffRecord(key, DUPLICATE, old=values) for values in old_values)
+            chunk.extend(DiffRecord(key, DUPLICATE, new=values) for values in new_values)
+        elif not new_values:
+            chunk.append(DiffRecord(key, DELETED, old=old_values[0]))
+        elif not old_values:
+            chunk.append(DiffRecord(key, ADDED, new=new_values[0]))
+        else:
+            # Status is decided when the chunk is compared
+            chunk.append(DiffRecord(key, None, old=old_values[0], new=new_values[0]))
+
+        if len(chunk) >= chunk_size:
+            resolve_chunk(chunk, compare_fields, load_old, fingerprints)
+            compare_chunk(chunk, columns_to_check, column_kinds, tolerance, compare_fields, geometry_equal)
+            yield from chunk
+            chunk = []
+
+    resolve_chunk(chunk, compare_fields, load_old, fingerprints)
+    compare_chunk(chunk, columns_to_check, column_kinds, tolerance, compare_fields, geometry_equal)
+    yield from chunk
+
+
+def key_index(rows):
+    """Build a hash index of (key, values) rows: key -> list of the values sharing it"""
+    index = {}
+    for key, values in rows:
+        index.setdefault(key, []).append(values)
+    return index
+
+
+def indexed_rows(rows):
+    """Materialise (key, values) rows in a hash index and yield them in key order for diff_rows()"""
+    index = key_index(rows)
+    for key in sorted(index, key=sort_key):
+        for values in index[key]:
+            yield key, values
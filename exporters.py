@@ -0,0 +1,262 @@
+# exporters.py
+"""Writing comparison results to CSV, GeoPackage and Parquet files.
+
+Rows are written in chunks straight from the typed diff records, with
+accept/reject decisions applied (rejected changes export the old value),
+so files keep the field types of the compared layers.
+"""
+import csv
+import datetime
+
+from qgis.PyQt.QtCore import QDate, QDateTime, QTime, QVariant
+from qgis.core import (QgsFeature, QgsFeatureRequest, QgsField, QgsFields, QgsGeometry, QgsVectorFileWriter,
+                       QgsCoordinateReferenceSystem, QgsCoordinateTransformContext, QgsWkbTypes)
+
+from .comparators import INTEGER, REAL, TEXT, DATE, DATETIME, BOOL, OTHER, GEOMETRY_FIELD, FID_FIELD, GeometryValue
+from .diff_engine import DELETED
+from .results_model import GEOMETRY_HEADER
+
+# Rows written per chunk
+EXPORT_CHUNK = 10000
+
+CSV = "csv"
+GPKG = "gpkg"
+PARQUET = "parquet"
+
+FORMAT_FILTERS = {
+    CSV: "CSV files (*.csv)",
+    GPKG: "GeoPackage (*.gpkg)",
+    PARQUET: "Parquet files (*.parquet)",
+}
+
+STATUS_COLUMN = "Status"
+DECISION_COLUMN = "Decision"
+GEOMETRY_CHANGED_COLUMN = "geometry_changed"
+# Column the GeoPackage writer keeps the feature ids in; a compared field of that name is renamed
+GPKG_FID_COLUMN = "fid"
+SOURCE_FID_PREFIX = "source_"
+
+
+class ExportError(Exception):
+    """Raised when results cannot be exported in the requested format"""
+
+
+def export_format(filename):
+    """Return the export format matching the extension of a file name"""
+    lowered = filename.lower()
+    for name in (GPKG, PARQUET):
+        if lowered.endswith("." + name):
+            return name
+    return CSV
+
+
+def qt_value(value):
+    """Convert plain Python values back to the Qt types expected by QgsFeature"""
+    if isinstance(value, datetime.datetime):
+        return QDateTime(QDate(value.year, value.month, value.day),
+                         QTime(value.hour, value.minute, value.second, value.microsecond // 1000))
+    if isinstance(value, datetime.date):
+        return QDate(value.year, value.month, value.day)
+    if isinstance(value, datetime.time):
+        return QTime(value.hour, value.minute, value.second, value.microsecond // 1000)
+    return value
+
+
+def chunks(rows, size=EXPORT_CHUNK):
+    """Split an iterable of source rows into lists of at most size rows"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ResultExporter:
+    """Write the given rows of a results model to a file, chunk by chunk.
+
+    rows are source rows of the model in the order they should be written;
+    progress(done) is called after each chunk and may return False to stop.
+    """
+
+    def __init__(self, model, rows, column_kinds=None, layer_fields=None, old_layer=None, new_layer=None):
+        self.model = model
+        self.rows = rows
+        self.column_kinds = column_kinds or {}
+        self.layer_fields = layer_fields  # QgsFields describing the compared attributes
+        self.old_layer = old_layer
+        self.new_layer = new_layer
+        self.attribute_fields = [field for field in model.fields if field != GEOMETRY_FIELD]
+        self.geometry_compared = GEOMETRY_FIELD in model.fields
+
+    def export(self, filename, progress=None):
+        """Write the file in the format given by its extension and return the number of rows written"""
+        writer = {CSV: self.write_csv, GPKG: self.write_gpkg, PARQUET: self.write_parquet}[export_format(filename)]
+        return writer(filename, progress or (lambda done: True))
+
+    def value_kind(self, field):
+        """Return the kind of the values the results hold for a field.
+
+        Fields whose values did not fit their type are untyped in the store.
+        Booleans a database returned as 0 and 1 are booleans again.
+        """
+        store = self.model.records
+        kind = store.column_kinds.get(field, self.column_kinds.get(field))
+        if kind == OTHER and self.column_kinds.get(field) == BOOL:
+            dictionary = store.dictionaries.get(field)
+            if dictionary is not None and all(value in (0, 1) for value in dictionary.values):
+                return BOOL
+        return kind
+
+    def records(self, chunk):
+        """Return (status, values, decision label, record) for each row of a chunk, with decisions applied"""
+        return [(self.model.status(row), self.model.export_record(row), self.model.decisions.label(row),
+                 self.model.records[row]) for row in chunk]
+
+    def write_csv(self, filename, progress):
+        header = [STATUS_COLUMN] + [self.model.header(field) for field in self.model.fields] + [DECISION_COLUMN]
+        done = 0
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(header)
+            for chunk in chunks(self.rows):
+                writer.writerows(
+                    [self.model.status(row)] + self.model.export_values(row) + [self.model.decisions.label(row)]
+                    for row in chunk)
+                done += len(chunk)
+                if not progress(done):
+                    break
+        return done
+
+    def output_fields(self):
+        """QgsFields of vector exports: status, compared attributes, geometry flag and decision"""
+        fields = QgsFields()
+        fields.append(QgsField(STATUS_COLUMN, QVariant.String))
+        for name in self.attribute_fields:
+            index = self.layer_fields.lookupField(name) if self.layer_fields is not None else -1
+            field = QgsField(self.layer_fields.at(index)) if index >= 0 else QgsField(name, QVariant.String)
+            if name.lower() == GPKG_FID_COLUMN:
+                # Values shared by several rows would clash as feature ids
+                field.setName(SOURCE_FID_PREFIX + name)
+            fields.append(field)
+        if self.geometry_compared:
+            fields.append(QgsField(GEOMETRY_CHANGED_COLUMN, QVariant.Bool))
+        fields.append(QgsField(DECISION_COLUMN, QVariant.String))
+        return fields
+
+    def geometries(self, records):
+        """Return the WKB of each record, from the compared geometries or fetched by feature id"""
+        if self.geometry_compared:
+            return [self.record_geometry(record) for record in records]
+
+        wanted = {}
+        for position, record in enumerate(records):
+            layer = self.old_layer if record.status == DELETED else self.new_layer
+            fid = record.data.get(FID_FIELD)
+            if layer is not None and fid is not None:
+                wanted.setdefault(layer.id(), (layer, {}))[1][fid] = position
+        wkbs = [None] * len(records)
+        for layer, positions in wanted.values():
+            request = QgsFeatureRequest().setFilterFids(list(positions)).setNoAttributes()
+            for feature in layer.getFeatures(request):
+                if feature.hasGeometry():
+                    wkbs[positions[feature.id()]] = bytes(feature.geometry().asWkb())
+        return wkbs
+
+    def record_geometry(self, record):
+        geometry = record.data.get(GEOMETRY_FIELD)
+        return geometry.wkb if isinstance(geometry, GeometryValue) else None
+
+    def write_gpkg(self, filename, progress):
+        layer = self.new_layer or self.old_layer
+        has_geometry = layer is not None and layer.isSpatial()
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.fileEncoding = "UTF-8"
+        writer = QgsVectorFileWriter.create(
+            filename, self.output_fields(), layer.wkbType() if has_geometry else QgsWkbTypes.NoGeometry,
+            layer.crs() if has_geometry else QgsCoordinateReferenceSystem(), QgsCoordinateTransformContext(), options)
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise ExportError(writer.errorMessage())
+
+        done = 0
+        try:
+            for chunk in chunks(self.rows):
+                records = self.records(chunk)
+                wkbs = self.geometries([record for _, _, _, record in records]) if has_geometry else [None] * len(records)
+                features = []
+                for (status, values, decision, record), wkb in zip(records, wkbs):
+                    feature = QgsFeature()
+                    attributes = [status]
+                    changed = None
+                    for field, value in zip(self.model.fields, values):
+                        if field == GEOMETRY_FIELD:
+                            changed = value
+                        else:
+                            attributes.append(qt_value(value))
+                    if self.geometry_compared:
+                        attributes.append(changed)
+                    attributes.append(decision)
+                    feature.setAttributes(attributes)
+                    if wkb is not None:
+                        geometry = QgsGeometry()
+                        geometry.fromWkb(wkb)
+                        feature.setGeometry(geometry)
+                    features.append(feature)
+                if not writer.addFeatures(features):
+                    raise ExportError(writer.errorMessage())
+                done += len(chunk)
+                if not progress(done):
+                    break
+        finally:
+            del writer  # Flushes and closes the file
+        return done
+
+    def write_parquet(self, filename, progress):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ExportError("Parquet export needs the pyarrow Python package")
+
+        arrow_types = {INTEGER: pa.int64(), REAL: pa.float64(), TEXT: pa.string(), DATE: pa.date32(),
+                       DATETIME: pa.timestamp('us'), BOOL: pa.bool_()}
+        columns = [(STATUS_COLUMN, pa.string(), None)]
+        for position, field in enumerate(self.model.fields):
+            if field == GEOMETRY_FIELD:
+                columns.append((GEOMETRY_CHANGED_COLUMN, pa.bool_(), position))
+            else:
+                columns.append((field, arrow_types.get(self.value_kind(field)), position))
+        columns.append((DECISION_COLUMN, pa.string(), None))
+        if self.geometry_compared:
+            columns.append((GEOMETRY_HEADER.lower(), pa.binary(), None))
+        schema = pa.schema([(name, arrow_type or pa.string()) for name, arrow_type, position in columns])
+
+        def column_values(name, arrow_type, position, records):
+            if name == STATUS_COLUMN:
+                return [status for status, _, _, _ in records]
+            if name == DECISION_COLUMN:
+                return [decision for _, _, decision, _ in records]
+            if position is None:
+                return [self.record_geometry(record) for _, _, _, record in records]
+            values = [values[position] for _, values, _, _ in records]
+            if arrow_type is None:
+                # Untyped columns are stored as text
+                return [None if value is None else str(value) for value in values]
+            if arrow_type == pa.bool_():
+                return [None if value is None else bool(value) for value in values]
+            return values
+
+        done = 0
+        with pq.ParquetWriter(filename, schema) as writer:
+            for chunk in chunks(self.rows):
+                records = self.records(chunk)
+                arrays = [pa.array(column_values(name, arrow_type, position, records), type=schema.field(i).type)
+                          for i, (name, arrow_type, position) in enumerate(columns)]
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+                done += len(chunk)
+                if not progress(done):
+                    break
+        return done
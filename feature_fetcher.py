@@ -0,0 +1,197 @@
+# feature_fetcher.py
+"""Reading the attributes needed for a comparison from a feature source.
+
+Features are requested with only the compared attributes and, unless
+geometries are compared, without geometry. Their values are collected into
+per-column buffers, one batch at a time. Each column is converted to plain
+Python values with a converter chosen once from its field type. Rows are
+handed out as views over these columns, which the diff engine compares a
+column slice at a time.
+"""
+from qgis.PyQt.QtCore import QVariant, QDate, QDateTime, QTime
+from qgis.core import QgsFeatureRequest, QgsExpression, QgsGeometry
+
+from .comparators import (INTEGER, REAL, TEXT, DATE, DATETIME, BOOL, OTHER, GEOMETRY_FIELD, FID_FIELD,
+                          GeometryValue, common_kind)
+from .diff_engine import ColumnRow
+
+# Number of features collected per batch
+BATCH_SIZE = 1000
+
+FIELD_KINDS = {
+    QVariant.Int: INTEGER,
+    QVariant.UInt: INTEGER,
+    QVariant.LongLong: INTEGER,
+    QVariant.ULongLong: INTEGER,
+    QVariant.Double: REAL,
+    QVariant.String: TEXT,
+    QVariant.Date: DATE,
+    QVariant.DateTime: DATETIME,
+    QVariant.Bool: BOOL,
+}
+
+
+def field_kind(field):
+    """Return the comparator kind for a QgsField"""
+    return FIELD_KINDS.get(field.type(), OTHER)
+
+
+def column_kinds(old_fields, new_fields, fields):
+    """Map each field name to the kind used to compare it between two layers"""
+    kinds = {}
+    for name in fields:
+        old_index, new_index = old_fields.lookupField(name), new_fields.lookupField(name)
+        if old_index < 0 or new_index < 0:
+            continue
+        kinds[name] = common_kind(field_kind(old_fields.at(old_index)), field_kind(new_fields.at(new_index)))
+    return kinds
+
+
+def plain_value(value):
+    """Convert NULL variants to None"""
+    if isinstance(value, QVariant) and value.isNull():
+        return None
+    return value
+
+
+def python_value(value):
+    """Convert NULL variants and Qt date/time values to plain Python values for the engine"""
+    if isinstance(value, QVariant) and value.isNull():
+        return None
+    if isinstance(value, (QDate, QDateTime, QTime)):
+        if value.isNull() or not value.isValid():
+            return None
+        if isinstance(value, QDate):
+            return value.toPyDate()
+        if isinstance(value, QDateTime):
+            return value.toPyDateTime()
+        return value.toPyTime()
+    return value
+
+
+def geometry_value(geometry):
+    """Return a GeometryValue for a QgsGeometry, or None for a missing or empty geometry"""
+    if geometry is None or geometry.isNull() or geometry.isEmpty():
+        return None
+    box = geometry.boundingBox()
+    return GeometryValue(bytes(geometry.asWkb()),
+                         (box.xMinimum(), box.yMinimum(), box.xMaximum(), box.yMaximum()))
+
+
+def geometries_equal(old, new, tolerance):
+    """Tolerance-based equality of two GeometryValues whose WKB differs"""
+    old_geometry, new_geometry = QgsGeometry(), QgsGeometry()
+    old_geometry.fromWkb(old.wkb)
+    new_geometry.fromWkb(new.wkb)
+    if old_geometry.isGeosEqual(new_geometry):
+        return True
+    if tolerance <= 0 or old_geometry.wkbType() != new_geometry.wkbType():
+        return False
+    distance = old_geometry.hausdorffDistance(new_geometry)
+    return 0 <= distance <= tolerance
+
+
+def column_converter(kind):
+    """Return the function converting the raw values of a column of the given kind"""
+    return plain_value if kind in (INTEGER, REAL, TEXT, BOOL) else python_value
+
+
+class FeatureBatch:
+    """Feature ids and per-column value buffers of consecutive features"""
+
+    __slots__ = ('fids', 'columns')
+
+    def __init__(self, fids, columns):
+        self.fids = fids        # list of feature ids
+        self.columns = columns  # dict of field -> list of values, aligned with fids
+
+    def __len__(self):
+        return len(self.fids)
+
+    def keys(self, join_fields):
+        """Return the join key of each feature, built from the join field columns"""
+        missing = [None] * len(self.fids)
+        if len(join_fields) == 1:
+            return self.columns.get(join_fields[0], missing)
+        return list(zip(*(self.columns.get(field, missing) for field in join_fields)))
+
+    def rows(self, join_fields):
+        """Yield (fid, key, values) for each feature of the batch, keyed on the join fields.
+
+        values are ColumnRow views sharing the column buffers of the batch.
+        """
+        for row, (fid, key) in enumerate(zip(self.fids, self.keys(join_fields))):
+            yield fid, key, ColumnRow(self.columns, row)
+
+
+class FeatureFetcher:
+    """Fetch the join fields and compared attributes of a feature source in batches.
+
+    Each row also holds its feature id under FID_FIELD and, with
+    with_geometry, a GeometryValue under GEOMETRY_FIELD.
+    """
+
+    def __init__(self, source, layer_fields, fields, join_fields, batch_size=BATCH_SIZE, with_geometry=False):
+        self.source = source
+        self.join_fields = list(join_fields)
+        self.batch_size = batch_size
+        self.with_geometry = with_geometry
+
+        # Fields missing from this source are left out of its rows
+        self.fields = []
+        self.indices = []
+        self.converters = []
+        for name in fields:
+            index = layer_fields.lookupField(name)
+            if index >= 0:
+                self.fields.append(name)
+                self.indices.append(index)
+                self.converters.append(column_converter(field_kind(layer_fields.at(index))))
+
+    def request(self, ordered=True, fids=None):
+        """Build a request for the needed attributes only, without geometry unless it is compared"""
+        request = QgsFeatureRequest()
+        if not self.with_geometry:
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(self.indices)
+        if fids is not None:
+            request.setFilterFids(list(fids))
+        if ordered:
+            for field in self.join_fields:
+                request.addOrderBy(QgsExpression.quotedColumnRef(field), True, True)
+        return request
+
+    def batches(self, ordered=True, fids=None):
+        """Yield FeatureBatch objects, optionally ordered by the join fields or limited to feature ids"""
+        batch_fids = []
+        buffers = [[] for _ in self.indices]
+        geometries = []
+        for feature in self.source.getFeatures(self.request(ordered, fids)):
+            attributes = feature.attributes()
+            batch_fids.append(feature.id())
+            for buffer, index in zip(buffers, self.indices):
+                buffer.append(attributes[index])
+            if self.with_geometry:
+                geometries.append(geometry_value(feature.geometry()) if feature.hasGeometry() else None)
+            if len(batch_fids) >= self.batch_size:
+                yield self.batch(batch_fids, buffers, geometries)
+                batch_fids = []
+                buffers = [[] for _ in self.indices]
+                geometries = []
+        if batch_fids:
+            yield self.batch(batch_fids, buffers, geometries)
+
+    def batch(self, fids, buffers, geometries):
+        columns = {
+            name: [convert(value) for value in buffer]
+            for name, convert, buffer in zip(self.fields, self.converters, buffers)
+        }
+        columns[FID_FIELD] = fids
+        if self.with_geometry:
+            columns[GEOMETRY_FIELD] = geometries
+        return FeatureBatch(fids, columns)
+
+    def rows(self, ordered=True, fids=None):
+        """Yield (fid, key, values) for each feature"""
+        for batch in self.batches(ordered, fids):
+            yield from batch.rows(self.join_fields)
@@ -0,0 +1,142 @@
+# fingerprint_cache.py
+"""Persistent (key -> feature id, fingerprint) tables for repeat comparisons.
+
+When the old layer of a comparison has not changed since the last run, its
+rows are taken from this cache as CachedRow placeholders instead of being
+read again; only rows whose fingerprint differs from the new layer are then
+fetched by feature id. Entries are stored in one SQLite file and keyed by a
+hash of the layer source, schema, join fields and checked columns, with a
+version token describing the state of the source they were built from.
+"""
+import hashlib
+import json
+import sqlite3
+
+from .diff_engine import CachedRow
+
+# Rows inserted per executemany() call while writing an entry
+WRITE_BATCH = 10000
+
+
+def cache_key(*parts):
+    """Return a stable key for the JSON-serialisable parts describing a cache entry"""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _encode_key(key):
+    return json.dumps(key)
+
+
+def _decode_key(text):
+    key = json.loads(text)
+    return tuple(key) if isinstance(key, list) else key
+
+
+class FingerprintCache:
+    """SQLite store of fingerprint tables, one entry per layer and comparison setup"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, cache_key TEXT UNIQUE, version TEXT)")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS rows (entry_id INTEGER, seq INTEGER, key TEXT, fid INTEGER, "
+            "fingerprint BLOB, PRIMARY KEY (entry_id, seq))")
+        return connection
+
+    def rows(self, key, version):
+        """Return an iterator of (key, CachedRow) in stored order, or None if there is no valid entry"""
+        if version is None:
+            return None
+        connection = self.connect()
+        entry = connection.execute(
+            "SELECT id FROM entries WHERE cache_key = ? AND version = ?", (key, version)).fetchone()
+        if entry is None:
+            connection.close()
+            return None
+        return self._iter_rows(connection, entry[0])
+
+    def _iter_rows(self, connection, entry_id):
+        try:
+            cursor = connection.execute(
+                "SELECT key, fid, fingerprint FROM rows WHERE entry_id = ? ORDER BY seq", (entry_id,))
+            for key, fid, fingerprint in cursor:
+                yield _decode_key(key), CachedRow(fid, fingerprint)
+        finally:
+            connection.close()
+
+    def writer(self, key, version):
+        """Return a CacheWriter replacing the entry for key, or None if the source has no version"""
+        if version is None:
+            return None
+        return CacheWriter(self, key, version)
+
+
+class CacheWriter:
+    """Collect the rows of one cache entry and store them on commit()"""
+
+    def __init__(self, cache, key, version):
+        self.cache = cache
+        self.key = key
+        self.version = version
+        self.connection = None
+        self.entry_id = None
+        self.batch = []
+        self.seq = 0
+        self.valid = True
+
+    def begin(self):
+        """Start (or restart) writing the entry"""
+        self.discard()
+        self.connection = self.cache.connect()
+        self.connection.execute(
+            "INSERT OR IGNORE INTO entries (cache_key, version) VALUES (?, NULL)", (self.key,))
+        self.entry_id = self.connection.execute(
+            "SELECT id FROM entries WHERE cache_key = ?", (self.key,)).fetchone()[0]
+        # Invalidate the entry until the new rows are complete
+        self.connection.execute("UPDATE entries SET version = NULL WHERE id = ?", (self.entry_id,))
+        self.connection.execute("DELETE FROM rows WHERE entry_id = ?", (self.entry_id,))
+        self.batch = []
+        self.seq = 0
+        self.valid = True
+
+    def add(self, key, fid, fingerprint):
+        if not self.valid:
+            return
+        try:
+            encoded = _encode_key(key)
+        except (TypeError, ValueError):
+            self.valid = False  # Keys that do not survive JSON (e.g. dates) are not cached
+            return
+        self.batch.append((self.entry_id, self.seq, encoded, fid, fingerprint))
+        self.seq += 1
+        if len(self.batch) >= WRITE_BATCH:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.connection.executemany("INSERT INTO rows VALUES (?, ?, ?, ?, ?)", self.batch)
+            self.batch = []
+
+    def commit(self):
+        """Store the rows written since begin() as the valid entry"""
+        if self.connection is None:
+            return
+        if self.valid:
+            self.flush()
+            self.connection.execute("UPDATE entries SET version = ? WHERE id = ?", (self.version, self.entry_id))
+        else:
+            self.connection.execute("DELETE FROM rows WHERE entry_id = ?", (self.entry_id,))
+        self.connection.commit()
+        self.connection.close()
+        self.connection = None
+
+    def discard(self):
+        """Drop the rows written since begin()"""
+        if self.connection is not None:
+            self.connection.rollback()
+            self.connection.close()
+            self.connection = None
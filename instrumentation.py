@@ -0,0 +1,134 @@
+# instrumentation.py
+"""Per-phase timing and counters of a comparison.
+
+Each phase (fetch, diff, model, filter, sort, export, ...) records its wall
+time, the number of rows it processed and the memory of the process when
+it ended. Phases that run interleaved, like fetching and diffing in the
+streaming join, accumulate time over many short intervals.
+"""
+import json
+import time
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+LOG_TAG = "Table Compare"
+
+FETCH = "fetch"
+DIFF = "diff"
+DATABASE_DIFF = "database diff"
+MODEL = "model"
+FILTER = "filter"
+SORT = "sort"
+EXPORT = "export"
+LIVE_UPDATE = "live update"
+APPLY = "apply"
+MATCH = "match"
+
+
+def memory_mb():
+    """Return the resident memory of the process in MB, its peak where only that is known, or None"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2 ** 20
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+    return None
+
+
+class PhaseStats:
+    """Wall time, rows and memory of one phase"""
+
+    __slots__ = ('name', 'seconds', 'rows', 'memory_mb')
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = 0
+        self.memory_mb = None
+
+    def as_dict(self):
+        return {'phase': self.name, 'seconds': round(self.seconds, 4), 'rows': self.rows,
+                'memory_mb': None if self.memory_mb is None else round(self.memory_mb, 1)}
+
+
+class ComparisonStats:
+    """Phases of a comparison in the order they first ran.
+
+    on_phase, if set, is called with the PhaseStats of each timed block.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.on_phase = None
+
+    def get(self, name):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = PhaseStats(name)
+        return phase
+
+    def add(self, name, seconds, rows=0):
+        """Add time and rows to a phase"""
+        phase = self.get(name)
+        phase.seconds += seconds
+        phase.rows += rows
+        return phase
+
+    def finish(self, name):
+        """Record the memory of the process at the end of a phase"""
+        self.get(name).memory_mb = memory_mb()
+
+    @contextmanager
+    def phase(self, name, rows=0):
+        """Time a block as (one more interval of) a phase; rows can be set on the yielded PhaseStats"""
+        phase = self.get(name)
+        phase.rows += rows
+        started = time.perf_counter()
+        try:
+            yield phase
+        finally:
+            phase.seconds += time.perf_counter() - started
+            self.finish(name)
+            if self.on_phase is not None:
+                self.on_phase(phase)
+
+    def as_list(self):
+        return [phase.as_dict() for phase in self.phases.values()]
+
+    def to_json(self):
+        return json.dumps(self.as_list())
+
+    def report(self, names=None):
+        """Return one text line per phase, for all phases or the named ones"""
+        lines = []
+        for phase in self.phases.values():
+            if names is not None and phase.name not in names:
+                continue
+            line = "{}: {:.3f} s, {} rows".format(phase.name, phase.seconds, phase.rows)
+            if phase.memory_mb is not None:
+                line += ", {:.0f} MB".format(phase.memory_mb)
+            lines.append(line)
+        return "\n".join(lines)
+
+    def log(self, names=None):
+        """Write the report to the QGIS message log"""
+        from qgis.core import Qgis, QgsMessageLog
+        QgsMessageLog.logMessage(self.report(names), LOG_TAG, Qgis.Info)
+
+
+@contextmanager
+def timed(stats, name, rows=0):
+    """Time a block as a phase of stats, or just run it when stats is None"""
+    if stats is None:
+        yield None
+    else:
+        with stats.phase(name, rows) as phase:
+            yield phase
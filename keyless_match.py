@@ -0,0 +1,135 @@
+# keyless_match.py
+"""Matching the features of two layers that share no identifier.
+
+Features are paired by geometry proximity and attribute similarity. To
+avoid scoring all pairs, candidates are found by blocking: a spatial
+index over the bounding boxes of the new features returns only those
+within the match distance, and blocking fields, when given, must hold
+equal values. Candidate pairs are scored and accepted greedily from the
+best score down, each feature being matched at most once.
+
+Matched pairs get a shared synthetic key, so the usual diff reports them
+as Modified or Unchanged; unmatched features are Deleted or Added.
+"""
+from qgis.core import QgsGeometry, QgsRectangle, QgsSpatialIndex
+
+from .comparators import GEOMETRY_FIELD, GeometryValue, values_equal
+from .diff_engine import join_key
+
+# Lowest score, between 0 and 1, of a pair that is matched
+MIN_SCORE = 0.5
+
+
+def row_geometry(values):
+    """Return the QgsGeometry of a row fetched with geometry, or None"""
+    value = values.get(GEOMETRY_FIELD)
+    if not isinstance(value, GeometryValue):
+        return None
+    geometry = QgsGeometry()
+    geometry.fromWkb(value.wkb)
+    return None if geometry.isEmpty() else geometry
+
+
+class KeylessMatcher:
+    """Pair old and new rows without a join key.
+
+    blocking_fields must be equal in a pair; similarity_fields give the
+    share of equal values in the score. Rows fetched with geometry are
+    only paired within max_distance, and the closer they are the higher
+    their score.
+    """
+
+    def __init__(self, blocking_fields=(), similarity_fields=(), max_distance=0.0, min_score=MIN_SCORE):
+        self.blocking_fields = list(blocking_fields)
+        self.similarity_fields = [field for field in similarity_fields
+                                  if field not in self.blocking_fields and field != GEOMETRY_FIELD]
+        self.max_distance = max(float(max_distance), 0.0)
+        self.min_score = min_score
+        self.candidates = 0  # Pairs scored by the last match
+        self.matched = 0  # Pairs accepted by the last match
+
+    def score(self, old, new, distance=None):
+        parts = []
+        if self.similarity_fields:
+            equal = sum(values_equal(old.get(field), new.get(field)) for field in self.similarity_fields)
+            parts.append(equal / len(self.similarity_fields))
+        if distance is not None:
+            parts.append(1.0 - distance / self.max_distance if self.max_distance > 0 else 1.0)
+        return sum(parts) / len(parts) if parts else 1.0
+
+    def candidate_pairs(self, old_rows, new_rows, is_canceled=None):
+        """Yield (score, old row, new row) of the pairs passing blocking and the minimum score"""
+        blocks = {}
+        if self.blocking_fields:
+            for new_row, values in enumerate(new_rows):
+                blocks.setdefault(join_key(values, self.blocking_fields), set()).add(new_row)
+
+        new_geometries = [row_geometry(values) for values in new_rows]
+        spatial = any(geometry is not None for geometry in new_geometries)
+        if not spatial and not self.blocking_fields:
+            raise ValueError("Matching without a key needs geometries or blocking fields")
+        index = QgsSpatialIndex()
+        for new_row, geometry in enumerate(new_geometries):
+            if geometry is not None:
+                index.insertFeature(new_row, geometry.boundingBox())
+
+        for old_row, values in enumerate(old_rows):
+            if is_canceled is not None and old_row % 1000 == 0 and is_canceled():
+                return
+            block = blocks.get(join_key(values, self.blocking_fields)) if self.blocking_fields else None
+            if self.blocking_fields and not block:
+                continue
+            geometry = row_geometry(values) if spatial else None
+            if geometry is None:
+                # Without a geometry only the blocking fields bring candidates
+                candidates = [(new_row, None) for new_row in block or ()]
+            else:
+                area = QgsRectangle(geometry.boundingBox())
+                area.grow(self.max_distance)
+                candidates = []
+                for new_row in index.intersects(area):
+                    if block is not None and new_row not in block:
+                        continue
+                    distance = geometry.distance(new_geometries[new_row])
+                    if distance <= self.max_distance:
+                        candidates.append((new_row, distance))
+            for new_row, distance in candidates:
+                self.candidates += 1
+                score = self.score(values, new_rows[new_row], distance)
+                if score >= self.min_score:
+                    yield score, old_row, new_row
+
+    def match(self, old_rows, new_rows, is_canceled=None):
+        """Return (old row, new row) pairs, best scores first, each row in at most one pair"""
+        self.candidates = 0
+        pairs = sorted(self.candidate_pairs(old_rows, new_rows, is_canceled), key=lambda pair: -pair[0])
+        matched_old, matched_new, matched = set(), set(), []
+        for score, old_row, new_row in pairs:
+            if old_row not in matched_old and new_row not in matched_new:
+                matched_old.add(old_row)
+                matched_new.add(new_row)
+                matched.append((old_row, new_row))
+        self.matched = len(matched)
+        return matched
+
+    def keyed_rows(self, old_rows, new_rows, is_canceled=None):
+        """Return key-ordered (key, values) lists of both sides, matched pairs sharing a key.
+
+        Pairs are keyed 0, 1, ...; unmatched old rows and then unmatched
+        new rows follow with keys of their own.
+        """
+        pairs = self.match(old_rows, new_rows, is_canceled)
+        old_keyed = [(key, old_rows[old_row]) for key, (old_row, new_row) in enumerate(pairs)]
+        new_keyed = [(key, new_rows[new_row]) for key, (old_row, new_row) in enumerate(pairs)]
+        matched_old = {old_row for old_row, new_row in pairs}
+        matched_new = {new_row for old_row, new_row in pairs}
+        key = len(pairs)
+        for old_row, values in enumerate(old_rows):
+            if old_row not in matched_old:
+                old_keyed.append((key, values))
+                key += 1
+        for new_row, values in enumerate(new_rows):
+            if new_row not in matched_new:
+                new_keyed.append((key, values))
+                key += 1
+        return old_keyed, new_keyed
@@ -0,0 +1,178 @@
+# live_compare.py
+"""Keeping comparison results up to date while the layers are edited.
+
+Edits are collected from the edit signals of both layers and, once the
+edits pause, only the join keys they touched are compared again: the rows
+of those keys are fetched by feature id from both layers, diffed like in a
+full comparison and the matching result rows are replaced, appended or
+removed. All other rows, and the decisions made on them, are left alone.
+"""
+from qgis.PyQt.QtCore import QObject, QTimer, pyqtSignal
+
+from .comparators import GEOMETRY_FIELD
+from .diff_engine import diff_rows, indexed_rows
+from .feature_fetcher import FeatureFetcher, geometries_equal
+from .instrumentation import LIVE_UPDATE, timed
+
+OLD = "old"
+NEW = "new"
+
+# Milliseconds without edits before the touched keys are compared
+UPDATE_DELAY = 300
+
+
+class LiveComparison(QObject):
+    """Re-compare the keys touched by edits of the layers of a finished comparison.
+
+    The comparison settings (fields, checked columns, kinds, tolerance and
+    geometry) are taken from the CompareTask that produced the results.
+    """
+
+    # Emitted after the results model was updated
+    updated = pyqtSignal()
+
+    def __init__(self, model, old_layer, new_layer, task, stats=None, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.layers = {OLD: old_layer, NEW: new_layer}
+        self.join_fields = task.join_fields
+        self.columns_to_check = list(task.columns_to_check)
+        self.column_kinds = task.column_kinds
+        self.compare_fields = task.compare_fields
+        self.tolerance = task.tolerance
+        self.stats = stats
+
+        fields = [field for field in task.fields if field != GEOMETRY_FIELD]
+        self.fetchers = {
+            side: FeatureFetcher(layer, layer.fields(), fields, self.join_fields, with_geometry=task.compare_geometry)
+            for side, layer in self.layers.items()}
+        # Join fields only, to follow the key of each feature
+        self.key_fetchers = {
+            side: FeatureFetcher(layer, layer.fields(), self.join_fields, self.join_fields)
+            for side, layer in self.layers.items()}
+
+        self.keys = {OLD: {}, NEW: {}}  # fid -> key
+        self.fids = {OLD: {}, NEW: {}}  # key -> set of fids
+        self.pending = {OLD: set(), NEW: set()}  # fids edited since the last update
+        self.edited_keys = {OLD: set(), NEW: set()}  # keys updated during the current edit session
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(UPDATE_DELAY)
+        self.timer.timeout.connect(self.update)
+
+        self.connections = []
+        for side, layer in self.layers.items():
+            self.index_keys(side)
+            on_edit = lambda fid, *args, side=side: self.on_feature_edited(side, fid)
+            for signal in (layer.featureAdded, layer.featureDeleted, layer.attributeValueChanged,
+                           layer.geometryChanged):
+                self.connect(signal, on_edit)
+            self.connect(layer.beforeCommitChanges, self.update)
+            self.connect(layer.afterCommitChanges, lambda side=side: self.on_committed(side))
+            self.connect(layer.afterRollBack, lambda side=side: self.index_keys(side))
+            self.connect(layer.willBeDeleted, self.stop)
+
+    def connect(self, signal, slot):
+        signal.connect(slot)
+        self.connections.append((signal, slot))
+
+    def stop(self):
+        """Stop following the layers"""
+        self.timer.stop()
+        for signal, slot in self.connections:
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass  # Layer already deleted
+        self.connections = []
+
+    def index_keys(self, side):
+        """Read the key of every feature of a layer"""
+        keys, fids = {}, {}
+        for fid, key, values in self.key_fetchers[side].rows(ordered=False):
+            keys[fid] = key
+            fids.setdefault(key, set()).add(fid)
+        self.keys[side], self.fids[side] = keys, fids
+
+    def set_columns_to_check(self, columns_to_check):
+        self.columns_to_check = list(columns_to_check)
+
+    def on_feature_edited(self, side, fid):
+        self.pending[side].add(fid)
+        self.timer.start()
+
+    def on_committed(self, side):
+        """Compare the keys edited in the session again, as committing assigns new feature ids"""
+        self.index_keys(side)
+        keys = self.edited_keys[side]
+        self.edited_keys[side] = set()
+        if keys:
+            self.compare_keys(keys)
+
+    def touched_keys(self, side):
+        """Return the keys of the pending fids of a side before and after their edits"""
+        fids = self.pending[side]
+        self.pending[side] = set()
+        keys, fids_by_key = self.keys[side], self.fids[side]
+        touched = set()
+        for fid in fids:
+            if fid in keys:
+                key = keys.pop(fid)
+                touched.add(key)
+                fids_by_key[key].discard(fid)
+                if not fids_by_key[key]:
+                    del fids_by_key[key]
+        # Deleted features are not returned
+        for fid, key, values in self.key_fetchers[side].rows(ordered=False, fids=fids):
+            keys[fid] = key
+            fids_by_key.setdefault(key, set()).add(fid)
+            touched.add(key)
+        self.edited_keys[side].update(touched)
+        return touched
+
+    def update(self):
+        """Compare the keys touched since the last update"""
+        self.timer.stop()
+        keys = set()
+        for side in (OLD, NEW):
+            if self.pending[side]:
+                keys.update(self.touched_keys(side))
+        if keys:
+            self.compare_keys(keys)
+
+    def key_rows(self, side, keys):
+        """Yield (key, values) of the features of a side with one of keys"""
+        fids = set()
+        for key in keys:
+            fids.update(self.fids[side].get(key, ()))
+        if fids:
+            for fid, key, values in self.fetchers[side].rows(ordered=False, fids=fids):
+                yield key, values
+
+    def compare_keys(self, keys):
+        """Diff the rows of keys again and put the records in place of their current rows"""
+        with timed(self.stats, LIVE_UPDATE) as phase:
+            records = list(diff_rows(
+                indexed_rows(self.key_rows(OLD, keys)), indexed_rows(self.key_rows(NEW, keys)),
+                self.columns_to_check, self.column_kinds, self.tolerance, compare_fields=self.compare_fields,
+                geometry_equal=geometries_equal))
+            if phase is not None:
+                phase.rows += len(records)
+            self.apply(keys, records)
+        self.updated.emit()
+
+    def apply(self, keys, records):
+        """Replace, append and remove model rows so each key has exactly its new records"""
+        records_by_key = {}
+        for record in records:
+            records_by_key.setdefault(record.key, []).append(record)
+
+        replaced, added, removed = {}, [], []
+        for key in keys:
+            rows = self.model.records.rows_of_key(key)
+            key_records = records_by_key.get(key, [])
+            replaced.update(zip(rows, key_records))
+            added.extend(key_records[len(rows):])
+            removed.extend(rows[len(key_records):])
+        self.model.apply_changes(replaced, added, removed)
@@ -0,0 +1,25 @@
+# processing_provider.py
+"""Processing provider exposing the Table Compare algorithms"""
+import os
+
+from qgis.PyQt.QtGui import QIcon
+from qgis.core import QgsProcessingProvider
+
+from .compare_algorithm import CompareLayersAlgorithm
+from .compare_snapshots_algorithm import CompareSnapshotsAlgorithm
+
+
+class TableCompareProvider(QgsProcessingProvider):
+
+    def id(self):
+        return 'tablecompare'
+
+    def name(self):
+        return 'Table Compare'
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(__file__), 'icon.png'))
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(CompareLayersAlgorithm())
+        self.addAlgorithm(CompareSnapshotsAlgorithm())
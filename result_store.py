@@ -0,0 +1,482 @@
+# result_store.py
+"""Columnar storage of comparison results.
+
+Rows are not kept as DiffRecords holding two dicts each. Each field is
+kept, per side, as a column instead:
+
+- a typed NumPy array with a NULL mask for numbers, booleans and dates,
+- an array of codes into a dictionary of distinct values shared by both
+  sides for text and untyped values,
+- a plain object array for geometries.
+
+Statuses are a byte array and the fields in which matched rows differ are
+boolean masks. Filters, sorting, re-checking other columns and exports
+therefore work on arrays rather than Python objects. Single rows are
+still available as DiffRecords built on demand.
+
+Records are added a chunk at a time with extend() and the chunks are
+joined into single arrays by finish(), so building a store costs one copy
+of the data.
+"""
+import itertools
+
+import numpy as np
+
+from .comparators import INTEGER, REAL, DATE, DATETIME, BOOL, GEOMETRY, OTHER
+from .diff_engine import DiffRecord, STATUSES, STATUS_CODES, MODIFIED, UNCHANGED, DUPLICATE, CHUNK_SIZE, sort_key
+
+OLD = 0
+NEW = 1
+
+# Array types of the typed kinds; values of other kinds are dictionary encoded
+ARRAY_DTYPES = {
+    INTEGER: (np.int64, 0),
+    REAL: (np.float64, 0.0),
+    BOOL: (np.bool_, False),
+    DATE: ('datetime64[D]', 'NaT'),
+    DATETIME: ('datetime64[us]', 'NaT'),
+}
+
+
+class Dictionary:
+    """Distinct values of a field, shared by the columns of both sides so codes compare equal"""
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value):
+        # Typed keys keep True, 1 and 1.0 apart
+        try:
+            key = (type(value), value)
+            hash(key)
+        except TypeError:
+            key = (type(value), repr(value))
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def ranks(self):
+        """Return the position of each value in sort_key order"""
+        ranks = np.empty(len(self.values), dtype=np.int64)
+        ranks[sorted(range(len(self.values)), key=lambda code: sort_key(self.values[code]))] = np.arange(len(ranks))
+        return ranks
+
+
+class TypedColumn:
+    """Values of a typed kind as a NumPy array and a NULL mask"""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.dtype, self.fill = ARRAY_DTYPES[kind]
+        self.values = np.zeros(0, dtype=self.dtype)
+        self.nulls = np.zeros(0, dtype=bool)
+        self.segments = []
+
+    def encode(self, values):
+        """Return (array, nulls) of values; raises TypeError, ValueError or OverflowError if they do not fit"""
+        nulls = np.fromiter((value is None for value in values), dtype=bool, count=len(values))
+        if self.kind == BOOL and not all(value is None or isinstance(value, (bool, np.bool_)) for value in values):
+            raise TypeError("Not a boolean")
+        array = np.array([self.fill if value is None else value for value in values], dtype=self.dtype)
+        return array, nulls
+
+    def extend(self, values):
+        self.segments.append(self.encode(values))
+
+    def finish(self):
+        if self.segments:
+            self.values = np.concatenate([self.values] + [values for values, nulls in self.segments])
+            self.nulls = np.concatenate([self.nulls] + [nulls for values, nulls in self.segments])
+            self.segments = []
+
+    def get(self, row):
+        return None if self.nulls[row] else self.values[row].item()
+
+    def set(self, row, value):
+        array, nulls = self.encode([value])
+        self.values[row], self.nulls[row] = array[0], nulls[0]
+
+    def delete(self, rows):
+        self.values = np.delete(self.values, rows)
+        self.nulls = np.delete(self.nulls, rows)
+
+    def tolist(self):
+        return [None if null else value for value, null in zip(self.values.tolist(), self.nulls.tolist())]
+
+
+class DictionaryColumn:
+    """Values as int32 codes into a Dictionary, -1 for NULL"""
+
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        self.codes = np.zeros(0, dtype=np.int32)
+        self.segments = []
+
+    def encode(self, values):
+        code = self.dictionary.code
+        return np.fromiter((-1 if value is None else code(value) for value in values),
+                           dtype=np.int32, count=len(values))
+
+    def extend(self, values):
+        self.segments.append(self.encode(values))
+
+    def finish(self):
+        if self.segments:
+            self.codes = np.concatenate([self.codes] + self.segments)
+            self.segments = []
+
+    def get(self, row):
+        code = self.codes[row]
+        return None if code < 0 else self.dictionary.values[code]
+
+    def set(self, row, value):
+        self.codes[row] = self.encode([value])[0]
+
+    def delete(self, rows):
+        self.codes = np.delete(self.codes, rows)
+
+    def tolist(self):
+        values = self.dictionary.values
+        return [None if code < 0 else values[code] for code in self.codes.tolist()]
+
+
+class ObjectColumn:
+    """Values kept as Python objects, for geometries"""
+
+    def __init__(self):
+        self.values = np.empty(0, dtype=object)
+        self.segments = []
+
+    def encode(self, values):
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+
+    def extend(self, values):
+        self.segments.append(self.encode(values))
+
+    def finish(self):
+        if self.segments:
+            self.values = np.concatenate([self.values] + self.segments)
+            self.segments = []
+
+    def get(self, row):
+        return self.values[row]
+
+    def set(self, row, value):
+        self.values[row] = value
+
+    def delete(self, rows):
+        self.values = np.delete(self.values, rows)
+
+    def tolist(self):
+        return self.values.tolist()
+
+
+class ResultStore:
+    """Comparison results of all rows, column by column.
+
+    fields are the result fields; rows may hold further values (such as the
+    feature id) which are stored the same way. checked lists the fields
+    deciding Modified, so a row's changed fields are its differing fields
+    among them.
+    """
+
+    read_only = False  # Whether rows can be replaced, appended and deleted
+
+    def __init__(self, fields, column_kinds=None, join_fields=(), checked=()):
+        self.fields = list(fields)
+        self.column_kinds = dict(column_kinds or {})
+        self.checked = set(checked)
+        self.count = 0
+        self.status_codes = np.zeros(0, dtype=np.int8)
+        self.present = (np.zeros(0, dtype=bool), np.zeros(0, dtype=bool))  # Rows with old, new values
+        self.columns = ({}, {})  # Per side: field -> column, for the fields found on that side
+        self.dictionaries = {}  # Field -> Dictionary shared by both sides
+        self.differing = {}  # Field -> rows where the field differs, for fields with differences
+        join_fields = list(join_fields)
+        self.keys = self.new_column(
+            None, self.column_kinds.get(join_fields[0], OTHER) if len(join_fields) == 1 else OTHER)
+        self.segments = []  # (status codes, old present, new present, differing) of chunks not yet joined
+        self.key_index = None  # Key -> rows, built when first needed
+
+    @classmethod
+    def from_records(cls, records, fields, column_kinds=None, join_fields=()):
+        """Build a finished store from DiffRecords; the checked fields are those found changed"""
+        store = cls(fields, column_kinds, join_fields)
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, CHUNK_SIZE))
+            if not chunk:
+                break
+            store.extend(chunk)
+            store.checked.update(field for record in chunk for field in record.changed)
+        store.finish()
+        return store
+
+    def new_column(self, field, kind):
+        if kind in ARRAY_DTYPES:
+            return TypedColumn(kind)
+        if kind == GEOMETRY:
+            return ObjectColumn()
+        dictionary = self.dictionaries.get(field) if field is not None else None
+        if dictionary is None:
+            dictionary = Dictionary()
+            if field is not None:
+                self.dictionaries[field] = dictionary
+        return DictionaryColumn(dictionary)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        return self.record(row)
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield self.record(row)
+
+    # Building
+
+    def extend(self, records):
+        """Append a chunk of DiffRecords; finish() must be called before reading"""
+        records = list(records)
+        if not records:
+            return
+        count = len(records)
+        sides = ([record.old for record in records], [record.new for record in records])
+        for side, values in enumerate(sides):
+            # All rows of a side hold the same fields
+            first = next((row_values for row_values in values if row_values is not None), {})
+            columns = self.columns[side]
+            for field in list(columns) + [field for field in first if field not in columns]:
+                self.extend_column(side, field, [None if row_values is None else row_values.get(field)
+                                                 for row_values in values])
+        self.extend_keys([record.key for record in records])
+
+        differing = {}
+        for row, record in enumerate(records):
+            for field in record.differing:
+                mask = differing.get(field)
+                if mask is None:
+                    mask = differing[field] = np.zeros(count, dtype=bool)
+                mask[row] = True
+        self.segments.append((
+            np.fromiter((STATUS_CODES[record.status] for record in records), dtype=np.int8, count=count),
+            np.fromiter((record.old is not None for record in records), dtype=bool, count=count),
+            np.fromiter((record.new is not None for record in records), dtype=bool, count=count),
+            differing))
+        self.count += count
+
+    def extend_column(self, side, field, values):
+        column = self.columns[side].get(field)
+        if column is None:
+            # Rows added before the field was seen on this side have no value
+            column = self.columns[side][field] = self.new_column(field, self.column_kinds.get(field, OTHER))
+            if self.count:
+                column.extend([None] * self.count)
+        try:
+            column.extend(values)
+        except (TypeError, ValueError, OverflowError):
+            self.untype(field)
+            self.columns[side][field].extend(values)
+
+    def extend_keys(self, keys):
+        try:
+            self.keys.extend(keys)
+        except (TypeError, ValueError, OverflowError):
+            self.untype_keys()
+            self.keys.extend(keys)
+
+    def untype_keys(self):
+        """Switch the keys to dictionary encoding when they do not fit their array type"""
+        self.keys.finish()
+        column = self.new_column(None, OTHER)
+        column.extend(self.keys.tolist())
+        column.finish()
+        self.keys = column
+
+    def untype(self, field):
+        """Switch a field to dictionary encoding on both sides when its values do not fit its array type"""
+        self.column_kinds[field] = OTHER
+        for columns in self.columns:
+            column = columns.get(field)
+            if column is not None:
+                column.finish()
+                encoded = self.new_column(field, OTHER)
+                encoded.extend(column.tolist())
+                encoded.finish()
+                columns[field] = encoded
+
+    def finish(self):
+        """Join the chunks added since the last call into single arrays"""
+        for columns in self.columns:
+            for column in columns.values():
+                column.finish()
+        self.keys.finish()
+        if not self.segments:
+            return
+        previous = len(self.status_codes)
+        self.status_codes = np.concatenate([self.status_codes] + [segment[0] for segment in self.segments])
+        self.present = tuple(np.concatenate([self.present[side]] + [segment[side + 1] for segment in self.segments])
+                             for side in (OLD, NEW))
+        fields = set(self.differing).union(*(segment[3] for segment in self.segments))
+        for field in fields:
+            parts = [self.differing.get(field, np.zeros(previous, dtype=bool))]
+            parts.extend(segment[3].get(field, np.zeros(len(segment[0]), dtype=bool)) for segment in self.segments)
+            self.differing[field] = np.concatenate(parts)
+        self.segments = []
+
+    # Reading
+
+    def status(self, row):
+        return STATUSES[self.status_codes[row]]
+
+    def side(self, row):
+        """The side whose values a row shows: NEW unless the row has only old values"""
+        return NEW if self.present[NEW][row] else OLD
+
+    def value(self, row, field, side=None):
+        """Return the value of a field of a row on a side, by default the side it shows"""
+        column = self.columns[self.side(row) if side is None else side].get(field)
+        return None if column is None else column.get(row)
+
+    def key(self, row):
+        return self.keys.get(row)
+
+    def differs(self, row, field):
+        mask = self.differing.get(field)
+        return mask is not None and bool(mask[row])
+
+    def changed(self, row, field):
+        """Whether a checked field differs in a row"""
+        return field in self.checked and self.differs(row, field)
+
+    def changed_mask(self, field):
+        """Return the rows whose checked field differs as a boolean mask"""
+        mask = self.differing.get(field)
+        if mask is None or field not in self.checked:
+            return np.zeros(self.count, dtype=bool)
+        return mask
+
+    def values(self, row, side):
+        """Return the values of a side of a row as a dict, or None if the row has no such side"""
+        if not self.present[side][row]:
+            return None
+        return {field: column.get(row) for field, column in self.columns[side].items()}
+
+    def record(self, row):
+        """Build the DiffRecord of a row"""
+        differing = tuple(field for field, mask in self.differing.items() if mask[row])
+        return DiffRecord(self.key(row), self.status(row), self.values(row, OLD), self.values(row, NEW),
+                          tuple(field for field in differing if field in self.checked), differing)
+
+    def rows_of_key(self, key):
+        """Return the rows of a join key"""
+        if self.key_index is None:
+            self.key_index = {}
+            for row, row_key in enumerate(self.keys.tolist()):
+                self.key_index.setdefault(row_key, []).append(row)
+        return self.key_index.get(key, [])
+
+    def sort_order(self, field):
+        """Return the rows in ascending order of the values a field shows, NULLs first, or None if not sortable here"""
+        old, new = self.columns[OLD].get(field), self.columns[NEW].get(field)
+        columns = [column for column in (old, new) if column is not None]
+        if not columns or len({type(column) for column in columns}) > 1:
+            return None
+        shown = self.present[NEW]
+        if isinstance(columns[0], TypedColumn):
+            if len({column.dtype for column in columns}) > 1:
+                return None
+            values = np.where(shown, new.values, old.values) if len(columns) == 2 else columns[0].values
+            nulls = np.where(shown, new.nulls, old.nulls) if len(columns) == 2 else columns[0].nulls.copy()
+            if len(columns) == 1:
+                # Rows without this side show NULL
+                nulls |= ~shown if new is not None else shown
+            return np.lexsort((values, ~nulls))
+        if isinstance(columns[0], DictionaryColumn):
+            codes = np.where(shown, new.codes, old.codes) if len(columns) == 2 else columns[0].codes.copy()
+            if len(columns) == 1:
+                codes[~shown if new is not None else shown] = -1
+            nulls = codes < 0
+            ranks = columns[0].dictionary.ranks()
+            return np.lexsort((np.where(nulls, 0, ranks[codes]) if len(ranks) else codes, ~nulls))
+        return None
+
+    # Updating
+
+    def recheck(self, checked):
+        """Make another set of fields decide Modified/Unchanged.
+
+        Return the matched rows with any difference and whether each is now
+        Modified.
+        """
+        self.checked = set(checked)
+        modified = np.zeros(self.count, dtype=bool)
+        differing = np.zeros(self.count, dtype=bool)
+        for field, mask in self.differing.items():
+            differing |= mask
+            if field in self.checked:
+                modified |= mask
+        differing &= self.status_codes != STATUS_CODES[DUPLICATE]
+        rows = np.flatnonzero(differing)
+        self.status_codes[rows] = np.where(modified[rows], STATUS_CODES[MODIFIED], STATUS_CODES[UNCHANGED])
+        return rows, modified[rows]
+
+    def replace(self, row, record):
+        """Put a record in place of a row"""
+        if self.key_index is not None:
+            rows = self.key_index[self.key(row)]
+            rows.remove(row)
+            self.key_index.setdefault(record.key, []).append(row)
+        self.status_codes[row] = STATUS_CODES[record.status]
+        for side, values in ((OLD, record.old), (NEW, record.new)):
+            self.present[side][row] = values is not None
+            values = values or {}
+            for field in values.keys() - self.columns[side].keys():
+                column = self.columns[side][field] = self.new_column(field, self.column_kinds.get(field, OTHER))
+                column.extend([None] * self.count)
+                column.finish()
+            for field, column in self.columns[side].items():
+                try:
+                    column.set(row, values.get(field))
+                except (TypeError, ValueError, OverflowError):
+                    self.untype(field)
+                    self.columns[side][field].set(row, values.get(field))
+        try:
+            self.keys.set(row, record.key)
+        except (TypeError, ValueError, OverflowError):
+            self.untype_keys()
+            self.keys.finish()
+            self.keys.set(row, record.key)
+        for field, mask in self.differing.items():
+            mask[row] = field in record.differing
+        for field in set(record.differing) - self.differing.keys():
+            mask = self.differing[field] = np.zeros(self.count, dtype=bool)
+            mask[row] = True
+
+    def append(self, records):
+        """Add records after the last row"""
+        records = list(records)
+        if self.key_index is not None:
+            for row, record in enumerate(records, self.count):
+                self.key_index.setdefault(record.key, []).append(row)
+        self.extend(records)
+        self.finish()
+
+    def delete(self, rows):
+        """Remove rows, moving the following rows up"""
+        self.key_index = None
+        self.status_codes = np.delete(self.status_codes, rows)
+        self.present = tuple(np.delete(present, rows) for present in self.present)
+        for columns in self.columns:
+            for column in columns.values():
+                column.delete(rows)
+        self.keys.delete(rows)
+        for field, mask in self.differing.items():
+            self.differing[field] = np.delete(mask, rows)
+        self.count = len(self.status_codes)
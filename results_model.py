@@ -0,0 +1,480 @@
+# results_model.py
+"""Item models backing the comparison results view.
+
+The results model keeps the records produced by the diff engine and builds
+display text and colors on demand in data(), so only the rows the view
+actually paints cost anything.
+"""
+import datetime
+
+import numpy as np
+from qgis.PyQt.QtCore import Qt, QAbstractTableModel, QAbstractProxyModel, QModelIndex, QDate, QDateTime, pyqtSignal
+from qgis.PyQt.QtGui import QColor
+
+from .comparators import GEOMETRY_FIELD, OTHER
+from .decision_store import ACCEPTED, REJECTED, PENDING, DecisionStore
+from .instrumentation import FILTER, SORT, timed
+from .diff_engine import ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE, STATUSES, STATUS_CODES, sort_order
+from .result_store import OLD, NEW, ResultStore
+
+# Only rows with these statuses can be accepted or rejected
+DECIDABLE_CODES = (STATUS_CODES[ADDED], STATUS_CODES[DELETED], STATUS_CODES[MODIFIED])
+
+GEOMETRY_HEADER = "Geometry"
+GEOMETRY_CHANGED = "Geometry changed"
+
+# Colors for different states - more distinguishable colors
+STATUS_COLORS = {
+    ADDED: QColor(144, 238, 144),      # Light green
+    DELETED: QColor(255, 99, 99),      # Bright red (more distinct)
+    MODIFIED: QColor(255, 255, 150),   # Bright yellow (more distinct)
+    UNCHANGED: QColor(255, 255, 255),  # White
+    DUPLICATE: QColor(255, 190, 110),  # Orange
+}
+CHANGED_FIELD_COLOR = QColor(255, 150, 150)  # Darker red for changed fields
+DECISION_COLORS = {
+    ACCEPTED: QColor(200, 255, 200),  # Light green for accepted
+    REJECTED: QColor(255, 200, 200),  # Light red for rejected
+}
+
+# Role returning the raw value of a cell, used for sorting
+RawValueRole = Qt.UserRole + 1
+
+
+def format_value(value):
+    """Format values for display, handling special types like dates"""
+    if isinstance(value, QDate):
+        return value.toString("yyyy-MM-dd")
+    elif isinstance(value, QDateTime):
+        return value.toString("yyyy-MM-dd hh:mm:ss")
+    elif isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    elif isinstance(value, datetime.date):
+        return value.strftime("%Y-%m-%d")
+    elif value is None:
+        return ""
+    else:
+        return str(value)
+
+
+class ComparisonResultsModel(QAbstractTableModel):
+    """Table model serving comparison results: a status column followed by one column per field.
+
+    Rows live in a columnar ResultStore; model.records[row] builds the
+    DiffRecord of a single row when one is needed.
+    """
+
+    # Emitted when rows moved between statuses without a model reset
+    statusesChanged = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.fields = []
+        self.records = ResultStore([])
+        self.status_rows = {}  # STATUS_CODES -> ascending rows with that status
+        self.column_kinds = {}  # Field -> comparator kind, for typed sorting
+        self.sort_orders = {}  # Column -> cached ascending order of the rows
+        self.decisions = DecisionStore()
+
+    @property
+    def status_codes(self):
+        """STATUS_CODES of each row"""
+        return self.records.status_codes
+
+    @property
+    def difference_masks(self):
+        """Field -> rows where the field differs, for fields with differences"""
+        return self.records.differing
+
+    def set_records(self, records, fields, column_kinds=None):
+        """Replace the model contents with the results of a new comparison.
+
+        records is a ResultStore or an iterable of DiffRecords, which is
+        drained into a store before the view is touched.
+        """
+        if not isinstance(records, ResultStore):
+            records = ResultStore.from_records(records, fields, column_kinds)
+        records.finish()
+        self.beginResetModel()
+        self.fields = list(fields)
+        self.records = records
+        self.column_kinds = dict(column_kinds or {})
+        self.sort_orders = {}
+        self.build_status_rows()
+        self.decisions.reset(len(records))
+        self.endResetModel()
+
+    def build_status_rows(self, codes=STATUS_CODES.values()):
+        """Index the rows of each status, so filters select rows without visiting them"""
+        for code in codes:
+            self.status_rows[code] = np.flatnonzero(self.status_codes == code)
+
+    def rows_with_status(self, codes):
+        """Return a boolean mask of the rows whose status is one of codes"""
+        mask = np.zeros(len(self.records), dtype=bool)
+        for code in codes:
+            mask[self.status_rows.get(code, [])] = True
+        return mask
+
+    def sort_order(self, column):
+        """Return the rows in ascending order of a column, NULLs first, computed once per column"""
+        order = self.sort_orders.get(column)
+        if order is None:
+            if column == 0:
+                order = np.argsort(self.status_codes, kind='stable')
+            else:
+                field = self.fields[column - 1]
+                if field == GEOMETRY_FIELD:
+                    order = np.argsort(self.records.changed_mask(field), kind='stable')
+                else:
+                    order = self.records.sort_order(field)
+                    if order is None:
+                        order = sort_order([self.raw_value(row, column) for row in range(len(self.records))],
+                                           self.column_kinds.get(field, OTHER))
+            order = self.sort_orders[column] = np.asarray(order, dtype=np.int64)
+        return order
+
+    def status_counts(self):
+        """Return the number of rows of each status"""
+        return {status: len(self.status_rows.get(code, ())) for status, code in STATUS_CODES.items()}
+
+    def duplicate_key_count(self):
+        """Return the number of distinct join keys reported as duplicates"""
+        return len({self.records.key(row) for row in self.status_rows.get(STATUS_CODES[DUPLICATE], ())})
+
+    def status(self, row):
+        return self.records.status(row)
+
+    def changed(self, row, field):
+        """Whether a checked field differs in a row"""
+        return self.records.changed(row, field)
+
+    def apply_changes(self, replaced=None, added=(), removed=()):
+        """Update rows after parts of the layers were compared again.
+
+        replaced maps rows to their new record, added records are appended
+        and removed rows are dropped. Changed rows lose their decisions;
+        all other rows keep their state and only the changed rows are
+        signalled to views. Read-only results cannot be updated.
+        """
+        if self.records.read_only:
+            raise ValueError("These results cannot be updated")
+        replaced = replaced or {}
+        for row, record in replaced.items():
+            self.records.replace(row, record)
+        if replaced:
+            rows = list(replaced)
+            self.decisions.set_rows(rows, PENDING)
+            self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), self.columnCount() - 1))
+
+        for row in sorted(removed, reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.records.delete(row)
+            self.decisions.remove(row)
+            self.endRemoveRows()
+
+        added = list(added)
+        if added:
+            first = len(self.records)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            self.records.append(added)
+            self.decisions.append(len(added))
+            self.endInsertRows()
+
+        if replaced or removed or added:
+            self.sort_orders = {}
+            self.build_status_rows()
+            self.statusesChanged.emit()
+
+    def set_columns_to_check(self, columns_to_check):
+        """Re-evaluate Modified/Unchanged for another set of checked columns without comparing again"""
+        # Matched rows without any difference stay Unchanged, only the others are updated
+        rows, modified = self.records.recheck(columns_to_check)
+        self.build_status_rows((STATUS_CODES[MODIFIED], STATUS_CODES[UNCHANGED]))
+        # Status and geometry cells follow the checked columns, attribute values do not
+        self.sort_orders.pop(0, None)
+        if GEOMETRY_FIELD in self.fields:
+            self.sort_orders.pop(self.fields.index(GEOMETRY_FIELD) + 1, None)
+        self.decisions.set_rows(rows[~modified], PENDING)
+        self.statusesChanged.emit()
+
+        if len(rows):
+            self.dataChanged.emit(
+                self.index(int(rows[0]), 0),
+                self.index(int(rows[-1]), self.columnCount() - 1),
+                [Qt.DisplayRole, Qt.BackgroundRole, RawValueRole])
+
+    def clear(self):
+        self.set_records([], [])
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or not self.fields else len(self.fields) + 1  # +1 for status column
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return "Status" if section == 0 else self.header(self.fields[section - 1])
+        return str(section + 1)
+
+    def header(self, field):
+        """Return the column title of a field"""
+        return GEOMETRY_HEADER if field == GEOMETRY_FIELD else field
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        store = self.records
+        row = index.row()
+        column = index.column()
+        field = self.fields[column - 1] if column else None
+
+        if role == Qt.DisplayRole:
+            if column == 0:
+                status = store.status(row)
+                if status == DUPLICATE:
+                    return f"{DUPLICATE} ({'new' if store.side(row) == NEW else 'old'})"
+                return status
+            if field == GEOMETRY_FIELD:
+                return GEOMETRY_CHANGED if store.changed(row, field) else ""
+            if store.changed(row, field):
+                return f"{format_value(store.value(row, field, OLD))} → {format_value(store.value(row, field, NEW))}"
+            return format_value(store.value(row, field))
+
+        if role == Qt.BackgroundRole:
+            decision = self.decisions.field(row, field) if field else self.decisions.row(row)
+            if decision != PENDING:
+                return DECISION_COLORS[decision]
+            if field and store.changed(row, field):
+                return CHANGED_FIELD_COLOR
+            return STATUS_COLORS[store.status(row)]
+
+        if role == RawValueRole:
+            return self.raw_value(row, column)
+
+        return None
+
+    def raw_value(self, row, column):
+        """Return the value a cell is sorted on"""
+        if column == 0:
+            return self.records.status(row)
+        field = self.fields[column - 1]
+        if field == GEOMETRY_FIELD:
+            return self.records.changed(row, field)
+        return self.records.value(row, field)
+
+    def decidable(self, rows):
+        """Return the Added/Deleted/Modified rows among the given source rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        return rows[np.isin(self.status_codes[rows], DECIDABLE_CODES)]
+
+    def set_decision(self, rows, decision):
+        """Record a decision for the Added/Deleted/Modified rows among the given source rows"""
+        rows = self.decidable(rows)
+        if len(rows):
+            self.decisions.set_rows(rows, decision)
+            self.emit_background_changed(int(rows.min()), int(rows.max()))
+
+    def set_decision_all(self, decision):
+        """Record a decision for every Added/Deleted/Modified row with a single array fill"""
+        self.decisions.set_rows(np.isin(self.status_codes, DECIDABLE_CODES), decision)
+        if self.records:
+            self.emit_background_changed(0, len(self.records) - 1)
+
+    def set_field_decision(self, rows, field, decision):
+        """Record a decision for one changed field of the given Modified source rows"""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[self.status_codes[rows] == STATUS_CODES[MODIFIED]]
+        if len(rows):
+            self.decisions.set_field(rows, field, decision)
+            self.emit_background_changed(int(rows.min()), int(rows.max()))
+
+    def emit_background_changed(self, first_row, last_row):
+        self.dataChanged.emit(
+            self.index(first_row, 0), self.index(last_row, self.columnCount() - 1), [Qt.BackgroundRole])
+
+    def export_record(self, row):
+        """Return the typed field values of a source row as they should be exported.
+
+        Geometry columns hold whether the geometry changed.
+        """
+        store = self.records
+        values = []
+        for field in self.fields:
+            if field == GEOMETRY_FIELD:
+                values.append(store.changed(row, field))
+            elif store.changed(row, field):
+                # Rejected changes keep the old value, accepted or pending ones the new value
+                rejected = self.decisions.field(row, field) == REJECTED
+                values.append(store.value(row, field, OLD if rejected else NEW))
+            else:
+                values.append(store.value(row, field))
+        return values
+
+    def export_values(self, row):
+        """Return the field values of a source row formatted as text for export"""
+        return [
+            (GEOMETRY_CHANGED if value else "") if field == GEOMETRY_FIELD else format_value(value)
+            for field, value in zip(self.fields, self.export_record(row))
+        ]
+
+
+class ResultsFilterProxyModel(QAbstractProxyModel):
+    """Proxy showing the rows of the visible statuses in key or sorted order.
+
+    The visible rows are kept as an array of source rows built from the
+    per-status row indices of the source model, so toggling a status never
+    visits rows one by one. Row numbers are the visible positions.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.visible_statuses = set(STATUSES)
+        self.sort_column = -1
+        self.sort_direction = Qt.AscendingOrder
+        self.order = None  # Source rows in sorted order, None for key order
+        self.rows = np.zeros(0, dtype=np.int64)       # Proxy row -> source row
+        self.positions = np.zeros(0, dtype=np.int64)  # Source row -> proxy row, -1 when hidden
+        self.stats = None  # ComparisonStats receiving the filter and sort phases
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.modelReset.connect(self.on_source_reset)
+        model.dataChanged.connect(self.on_source_data_changed)
+        model.statusesChanged.connect(self.on_source_statuses_changed)
+        model.rowsAboutToBeRemoved.connect(self.on_source_rows_about_to_be_removed)
+        model.rowsRemoved.connect(self.on_source_rows_removed)
+        model.rowsInserted.connect(self.on_source_rows_inserted)
+        self.on_source_reset()
+
+    def set_visible_statuses(self, statuses):
+        self.visible_statuses = set(statuses)
+        with timed(self.stats, FILTER, len(self.positions)):
+            self.refilter()
+
+    def select_rows(self):
+        """Pick the visible source rows, keeping the current order"""
+        model = self.sourceModel()
+        visible = model.rows_with_status(STATUS_CODES[status] for status in self.visible_statuses)
+        if self.order is None:
+            self.rows = np.flatnonzero(visible)
+        else:
+            self.rows = self.order[visible[self.order]]
+        self.update_positions(len(model.records))
+
+    def on_source_reset(self):
+        self.beginResetModel()
+        self.order = self.sorted_order()
+        self.select_rows()
+        self.endResetModel()
+
+    def on_source_statuses_changed(self):
+        self.order = self.sorted_order()
+        self.refilter()
+
+    def update_positions(self, count):
+        self.positions = np.full(count, -1, dtype=np.int64)
+        self.positions[self.rows] = np.arange(len(self.rows))
+
+    def on_source_rows_about_to_be_removed(self, parent, first, last):
+        """Remove the visible rows among source rows first to last"""
+        for row in sorted((int(row) for row in self.positions[first:last + 1] if row >= 0), reverse=True):
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.rows = np.delete(self.rows, row)
+            self.endRemoveRows()
+        self.update_positions(len(self.positions))
+
+    def on_source_rows_removed(self, parent, first, last):
+        """Renumber the source rows following the removed ones"""
+        count = last - first + 1
+        self.rows[self.rows > last] -= count
+        if self.order is not None:
+            self.order = self.order[(self.order < first) | (self.order > last)]
+            self.order[self.order > last] -= count
+        self.update_positions(len(self.positions) - count)
+
+    def on_source_rows_inserted(self, parent, first, last):
+        """Append inserted source rows of a visible status after the current rows"""
+        model = self.sourceModel()
+        new_rows = np.arange(first, last + 1, dtype=np.int64)
+        if self.order is not None:
+            self.order = np.concatenate([self.order, new_rows])
+        codes = [STATUS_CODES[status] for status in self.visible_statuses]
+        visible = new_rows[np.isin(model.status_codes[first:last + 1], codes)]
+        if len(visible):
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(visible) - 1)
+            self.rows = np.concatenate([self.rows, visible])
+            self.update_positions(len(model.records))
+            self.endInsertRows()
+        else:
+            self.update_positions(len(model.records))
+
+    def refilter(self):
+        """Re-select the visible rows while keeping selected and current rows that stay visible"""
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        sources = [self.mapToSource(index) for index in persistent]
+        self.select_rows()
+        self.changePersistentIndexList(persistent, [self.mapFromSource(index) for index in sources])
+        self.layoutChanged.emit()
+
+    def on_source_data_changed(self, top_left, bottom_right, roles=()):
+        if len(self.rows):
+            self.dataChanged.emit(self.index(0, top_left.column()),
+                                  self.index(len(self.rows) - 1, bottom_right.column()), roles)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Order the rows by a column; a negative column restores key order.
+
+        NULLs come first in ascending and last in descending order.
+        """
+        self.sort_column, self.sort_direction = column, order
+        with timed(self.stats, SORT, len(self.positions)):
+            self.order = self.sorted_order()
+            self.refilter()
+
+    def sorted_order(self):
+        """Return the source rows in the current sort order, or None when keeping key order"""
+        model = self.sourceModel()
+        if self.sort_column < 0 or self.sort_column >= model.columnCount():
+            return None
+        order = model.sort_order(self.sort_column)
+        return order[::-1] if self.sort_direction == Qt.DescendingOrder else order
+
+    def mapToSource(self, proxy_index):
+        if not proxy_index.isValid():
+            return QModelIndex()
+        return self.sourceModel().index(int(self.rows[proxy_index.row()]), proxy_index.column())
+
+    def mapFromSource(self, source_index):
+        if not source_index.isValid() or source_index.row() >= len(self.positions):
+            return QModelIndex()
+        row = int(self.positions[source_index.row()])
+        return self.index(row, source_index.column()) if row >= 0 else QModelIndex()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not 0 <= row < len(self.rows) or not 0 <= column < self.columnCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.sourceModel() is None else self.sourceModel().columnCount()
+
+    def source_rows(self):
+        """Return the visible source rows in displayed order"""
+        return self.rows
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Vertical and role == Qt.DisplayRole:
+            # Dynamic row numbering: rows are numbered by their visible position
+            return str(section + 1)
+        return self.sourceModel().headerData(section, orientation, role)
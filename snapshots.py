@@ -0,0 +1,137 @@
+# snapshots.py
+"""Comparing an ordered series of snapshots of one layer.
+
+Each snapshot is read once and diffed against the previous one with the
+same engine as a two-layer comparison; only the rows of the previous
+snapshot are kept meanwhile. The status of every join key at every step
+is recorded against one key index shared by all steps. This gives each
+feature a timeline: when it appeared, which fields changed at which step
+and when it disappeared. The work grows linearly with the number of
+snapshots.
+"""
+import csv
+import json
+
+import numpy as np
+
+from .comparators import DEFAULT_TOLERANCE
+from .diff_engine import STATUSES, STATUS_CODES, MODIFIED, UNCHANGED, diff_rows, indexed_rows, sort_key
+
+# Status code of a key found in neither snapshot of a step
+ABSENT = -1
+
+
+class SnapshotTimeline:
+    """Status of every join key at every step of a series of snapshots.
+
+    Step i goes from snapshot i to snapshot i + 1.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.keys = []  # Key of each key id
+        self.index = {}  # Key -> key id
+        self.steps = []  # Per step, status codes of the key ids known by then
+        self.changed = []  # Per step, key id -> checked fields changed by Modified keys
+
+    def key_id(self, key):
+        key_id = self.index.get(key)
+        if key_id is None:
+            key_id = self.index[key] = len(self.keys)
+            self.keys.append(key)
+        return key_id
+
+    def add_step(self, records):
+        """Record the DiffRecords of the next step"""
+        codes, changed = {}, {}
+        for record in records:
+            key_id = self.key_id(record.key)
+            # All rows of a repeated key are Duplicate
+            codes[key_id] = STATUS_CODES[record.status]
+            if record.status == MODIFIED:
+                changed[key_id] = record.changed
+        step = np.full(len(self.keys), ABSENT, dtype=np.int8)
+        step[list(codes)] = list(codes.values())
+        self.steps.append(step)
+        self.changed.append(changed)
+
+    def codes(self):
+        """Return the status codes as a (keys, steps) array, ABSENT where a key is in neither snapshot"""
+        matrix = np.full((len(self.keys), len(self.steps)), ABSENT, dtype=np.int8)
+        for step, codes in enumerate(self.steps):
+            matrix[:len(codes), step] = codes
+        return matrix
+
+    def step_names(self):
+        return ["{} -> {}".format(old, new) for old, new in zip(self.names, self.names[1:])]
+
+    def timeline(self, key):
+        """Return (step name, status, changed fields) of each step a key took part in"""
+        key_id = self.index.get(key)
+        if key_id is None:
+            return []
+        events = []
+        for step, (name, codes) in enumerate(zip(self.step_names(), self.steps)):
+            if key_id < len(codes) and codes[key_id] != ABSENT:
+                events.append((name, STATUSES[codes[key_id]], self.changed[step].get(key_id, ())))
+        return events
+
+    def step_counts(self):
+        """Return, per step, the number of keys of each status"""
+        counts = []
+        for codes in self.steps:
+            found = np.bincount(codes[codes != ABSENT], minlength=len(STATUSES))
+            counts.append({status: int(found[code]) for status, code in STATUS_CODES.items()})
+        return counts
+
+    def to_json(self):
+        return json.dumps([dict(counts, step=name) for name, counts in zip(self.step_names(), self.step_counts())])
+
+    def write_csv(self, filename, join_fields, changed_only=True):
+        """Write one row per key: its join field values and its status at each step.
+
+        Modified steps list the changed fields. With changed_only, keys that
+        stayed Unchanged at every step are left out.
+        """
+        matrix = self.codes()
+        quiet = (matrix == ABSENT) | (matrix == STATUS_CODES[UNCHANGED])
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(list(join_fields) + self.step_names())
+            for key_id in sorted(range(len(self.keys)), key=lambda key_id: sort_key(self.keys[key_id])):
+                if changed_only and quiet[key_id].all():
+                    continue
+                key = self.keys[key_id]
+                row = list(key) if len(join_fields) > 1 else [key]
+                for step, code in enumerate(matrix[key_id].tolist()):
+                    if code == ABSENT:
+                        row.append("")
+                    elif code == STATUS_CODES[MODIFIED]:
+                        row.append("{}: {}".format(MODIFIED, ", ".join(self.changed[step].get(key_id, ()))))
+                    else:
+                        row.append(STATUSES[code])
+                writer.writerow(row)
+
+
+def compare_snapshots(names, snapshot_rows, columns_to_check, column_kinds=None, tolerance=DEFAULT_TOLERANCE,
+                      compare_fields=None, geometry_equal=None, is_canceled=None):
+    """Diff each snapshot against the previous one and return their SnapshotTimeline.
+
+    snapshot_rows yields, in the order of names, an iterator of (key,
+    values) rows per snapshot; each is consumed once, in any order, when
+    its step is reached. Return None if is_canceled() becomes true
+    between snapshots.
+    """
+    timeline = SnapshotTimeline(names)
+    previous = None
+    for rows in snapshot_rows:
+        # Kept in key order for the next step
+        current = list(indexed_rows(rows))
+        if is_canceled is not None and is_canceled():
+            return None
+        if previous is not None:
+            timeline.add_step(diff_rows(
+                iter(previous), iter(current), columns_to_check, column_kinds, tolerance,
+                compare_fields=compare_fields, geometry_equal=geometry_equal))
+        previous = current
+    return timeline
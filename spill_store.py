@@ -0,0 +1,320 @@
+# spill_store.py
+"""Out-of-core comparisons through a temporary SQLite database.
+
+Layers too large to diff in memory are copied, one fetch batch at a time,
+into two tables of a temporary SQLite file. The join and the change flags
+are then computed there by the same SQL as the database pushdown, and
+written in key order to a results table on disk. Only statuses and
+difference flags are loaded into memory, as arrays. The values the view
+shows are read a page of rows at a time, and sorting is done by SQLite.
+The file is deleted when the results are no longer referenced.
+"""
+import datetime
+import os
+import sqlite3
+import tempfile
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from .comparators import INTEGER, REAL, DATE, DATETIME, BOOL, GEOMETRY, OTHER, GEOMETRY_FIELD, FID_FIELD, GeometryValue
+from .diff_engine import ADDED, DELETED, UNCHANGED, DUPLICATE, STATUS_CODES, join_key
+from .result_store import ResultStore
+from .sql_pushdown import SQLITE, DELETED_MARK, ADDED_MARK, PushdownPlan, quote_identifier
+
+OLD_TABLE = "old_rows"
+NEW_TABLE = "new_rows"
+RESULTS_TABLE = "results"
+
+# Marks of rows whose join key is not unique, next to those of PushdownPlan
+DUPLICATE_OLD_MARK = "O"
+DUPLICATE_NEW_MARK = "N"
+
+# Rows read from disk at once by the view, and pages kept in memory
+PAGE_SIZE = 1000
+CACHED_PAGES = 64
+
+# Rows of the results table turned into status arrays at once
+READ_CHUNK = 100000
+
+# Compare on disk above this many features of both layers together
+SPILL_ROWS = 5000000
+
+# Rough size in memory of one value of a result row, in bytes
+VALUE_BYTES = 24
+
+SQL_TYPES = {INTEGER: "INTEGER", REAL: "REAL", BOOL: "INTEGER", GEOMETRY: "BLOB", DATE: "TEXT", DATETIME: "TEXT"}
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def spill_needed(features, values_per_feature, spill_rows=SPILL_ROWS, spill_memory_mb=None):
+    """Tell whether comparing this many features is better done on disk.
+
+    Either threshold can be disabled with 0. Without a memory threshold,
+    half the memory available when asked is used if psutil is installed.
+    """
+    if spill_rows and features > spill_rows:
+        return True
+    if spill_memory_mb is None and psutil is not None:
+        spill_memory_mb = psutil.virtual_memory().available / 2 ** 21
+    return bool(spill_memory_mb) and features * values_per_feature * VALUE_BYTES / 2 ** 20 > spill_memory_mb
+
+
+def sql_value(value, kind):
+    """Convert a Python value of a field to a value SQLite stores and orders the same way"""
+    if value is None:
+        return None
+    if kind == GEOMETRY:
+        return value.wkb if isinstance(value, GeometryValue) else None
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    if isinstance(value, datetime.date):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def stored_value(value, kind):
+    """Convert a value read back from SQLite to the Python value of its field"""
+    if value is None:
+        return None
+    if kind == GEOMETRY:
+        return GeometryValue(value, None)
+    if kind == DATE and isinstance(value, str):
+        return datetime.datetime.strptime(value, DATE_FORMAT).date()
+    if kind == DATETIME and isinstance(value, str):
+        return datetime.datetime.strptime(value, DATETIME_FORMAT)
+    if kind == BOOL:
+        return bool(value)
+    return value
+
+
+class SpillDatabase:
+    """Temporary SQLite file, deleted when closed or garbage collected.
+
+    Calling it runs a query, so it can serve as the executor of a PushdownPlan.
+    """
+
+    def __init__(self, directory=None):
+        handle, self.path = tempfile.mkstemp(prefix="table_compare_", suffix=".sqlite", dir=directory)
+        os.close(handle)
+        # Filled by the comparison task, read by the view in the main thread
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        # The file is thrown away after use, so nothing needs to survive a crash
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("PRAGMA temp_store = FILE")
+        self.finalizer = weakref.finalize(self, SpillDatabase.remove, self.connection, self.path)
+
+    @staticmethod
+    def remove(connection, path):
+        connection.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __call__(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def close(self):
+        self.finalizer()
+
+
+class Spill:
+    """Copy the rows of two layers into a SpillDatabase and diff them there.
+
+    Only fields present in both layers (and the join fields) are stored,
+    together with the feature id.
+    """
+
+    def __init__(self, database, join_fields, fields, column_kinds, compare_fields, tolerance):
+        self.database = database
+        self.join_fields = list(join_fields)
+        self.kinds = dict(column_kinds)
+        self.fields = [field for field in fields if field in column_kinds or field in join_fields] + [FID_FIELD]
+        self.kinds[FID_FIELD] = INTEGER
+        compare_fields = [field for field in compare_fields if field in column_kinds]
+        self.plan = PushdownPlan(
+            SQLITE, quote_identifier(OLD_TABLE), quote_identifier(NEW_TABLE), self.join_fields, self.fields,
+            compare_fields, [field for field in compare_fields if column_kinds[field] == REAL], tolerance)
+        columns = ", ".join("{} {}".format(quote_identifier(field), SQL_TYPES.get(self.kinds.get(field), ""))
+                            for field in self.fields)
+        for table in (OLD_TABLE, NEW_TABLE):
+            database("CREATE TABLE {} ({})".format(quote_identifier(table), columns))
+        self.insert_sql = "INSERT INTO {{}} VALUES ({})".format(", ".join("?" * len(self.fields)))
+
+    def insert(self, table, batch):
+        """Store a FeatureBatch in the old or new table"""
+        columns = [[sql_value(value, self.kinds.get(field)) for value in batch.columns[field]]
+                   if field in batch.columns else [None] * len(batch) for field in self.fields]
+        self.database.connection.executemany(self.insert_sql.format(quote_identifier(table)), zip(*columns))
+
+    def join_sql(self, left, right):
+        """Join condition of aliases left and right on the join fields, NULL matching NULL"""
+        return " AND ".join("{0}.{2} IS {1}.{2}".format(left, right, quote_identifier(field))
+                            for field in self.join_fields)
+
+    def set_aside_duplicates(self):
+        """Move rows whose join key is repeated on either side to tables of their own; return whether any were"""
+        execute = self.database
+        keys = ", ".join(quote_identifier(field) for field in self.join_fields)
+        execute("CREATE TABLE dup_keys AS "
+                "SELECT {0} FROM {1} GROUP BY {0} HAVING COUNT(*) > 1 UNION "
+                "SELECT {0} FROM {2} GROUP BY {0} HAVING COUNT(*) > 1".format(
+                    keys, quote_identifier(OLD_TABLE), quote_identifier(NEW_TABLE)))
+        if execute("SELECT 1 FROM dup_keys LIMIT 1").fetchone() is None:
+            return False
+        for table in (OLD_TABLE, NEW_TABLE):
+            execute("CREATE TABLE {0} AS SELECT t.* FROM {1} t JOIN dup_keys k ON {2}".format(
+                quote_identifier(table + "_dups"), quote_identifier(table), self.join_sql("t", "k")))
+            execute("DELETE FROM {0} WHERE rowid IN (SELECT t.rowid FROM {0} t JOIN dup_keys k ON {1})".format(
+                quote_identifier(table), self.join_sql("t", "k")))
+        return True
+
+    def run(self, columns_to_check, result_fields, geometry_equal=None):
+        """Diff the stored rows into a results table and return a SpilledResultStore over it"""
+        execute = self.database
+        for table in (OLD_TABLE, NEW_TABLE):
+            execute("CREATE INDEX {} ON {} ({})".format(
+                quote_identifier(table + "_key"), quote_identifier(table),
+                ", ".join(quote_identifier(field) for field in self.join_fields)))
+        has_duplicates = self.set_aside_duplicates()
+
+        execute("CREATE TABLE staging AS " + self.plan.diff_sql(include_unchanged=True, ordered=False))
+        if has_duplicates:
+            nulls = ", ".join(["NULL"] * len(self.fields))
+            flags = "".join(", 0" for field in self.plan.compare_fields)
+            columns = ", ".join("t." + quote_identifier(field) for field in self.fields)
+            execute("INSERT INTO staging SELECT '{}', {}, {}{} FROM {} t".format(
+                DUPLICATE_OLD_MARK, columns, nulls, flags, quote_identifier(OLD_TABLE + "_dups")))
+            execute("INSERT INTO staging SELECT '{}', {}, {}{} FROM {} t".format(
+                DUPLICATE_NEW_MARK, nulls, columns, flags, quote_identifier(NEW_TABLE + "_dups")))
+        # Row ids of the results follow the key order
+        execute("CREATE TABLE {} AS SELECT * FROM staging d ORDER BY {}".format(
+            RESULTS_TABLE, self.plan.key_order("d")))
+        for table in ("staging", OLD_TABLE, NEW_TABLE, OLD_TABLE + "_dups", NEW_TABLE + "_dups", "dup_keys"):
+            execute("DROP TABLE IF EXISTS " + quote_identifier(table))
+        self.database.connection.commit()
+
+        store = SpilledResultStore(self.database, result_fields, self.kinds, self.join_fields, columns_to_check,
+                                   self.fields, self.plan.compare_fields)
+        store.load(geometry_equal, self.plan.tolerance)
+        return store
+
+
+class SpilledResultStore(ResultStore):
+    """ResultStore whose values stay in the results table of a SpillDatabase.
+
+    Statuses, sides and difference masks are arrays like in memory; values
+    are read PAGE_SIZE rows at a time and the last CACHED_PAGES pages are
+    kept. The store is read-only, so live updates are not available.
+    """
+
+    read_only = True
+
+    def __init__(self, database, fields, column_kinds, join_fields, checked, stored_fields, compare_fields):
+        super().__init__(fields, column_kinds, join_fields, checked)
+        self.database = database
+        self.join_fields = list(join_fields)
+        self.stored_fields = list(stored_fields)
+        self.positions = {field: position for position, field in enumerate(self.stored_fields)}
+        self.compare_fields = list(compare_fields)
+        self.pages = OrderedDict()  # First row -> list of (old values, new values) tuples
+
+    def load(self, geometry_equal=None, tolerance=0.0):
+        """Read statuses and difference flags of all rows"""
+        flag_columns = ["f_{}".format(i) for i in range(len(self.compare_fields))]
+        cursor = self.database("SELECT {} FROM {} ORDER BY rowid".format(
+            ", ".join(["mark"] + flag_columns), RESULTS_TABLE))
+        marks, flags = [], []
+        while True:
+            rows = cursor.fetchmany(READ_CHUNK)
+            if not rows:
+                break
+            marks.append(np.array([row[0] for row in rows]))
+            flags.append(np.array([row[1:] for row in rows], dtype=bool).reshape(len(rows), len(flag_columns)))
+        marks = np.concatenate(marks) if marks else np.zeros(0, dtype='<U1')
+        flags = np.concatenate(flags) if flags else np.zeros((0, len(flag_columns)), dtype=bool)
+
+        if GEOMETRY_FIELD in self.compare_fields and geometry_equal is not None:
+            # SQLite compared the WKB bytes; equal shapes written differently are not changes
+            column = self.compare_fields.index(GEOMETRY_FIELD)
+            position = self.positions[GEOMETRY_FIELD]
+            for rowid, old, new in self.database("SELECT rowid, o_{0}, n_{0} FROM {1} WHERE f_{2} = 1".format(
+                    position, RESULTS_TABLE, column)):
+                if old is not None and new is not None and geometry_equal(
+                        GeometryValue(old, None), GeometryValue(new, None), tolerance):
+                    flags[rowid - 1, column] = False
+
+        self.count = len(marks)
+        old_only = (marks == DELETED_MARK) | (marks == DUPLICATE_OLD_MARK)
+        new_only = (marks == ADDED_MARK) | (marks == DUPLICATE_NEW_MARK)
+        self.present = (~new_only, ~old_only)
+        self.differing = {field: flags[:, i].copy() for i, field in enumerate(self.compare_fields)
+                          if flags[:, i].any()}
+        codes = np.full(self.count, STATUS_CODES[UNCHANGED], dtype=np.int8)
+        codes[marks == DELETED_MARK] = STATUS_CODES[DELETED]
+        codes[marks == ADDED_MARK] = STATUS_CODES[ADDED]
+        codes[(marks == DUPLICATE_OLD_MARK) | (marks == DUPLICATE_NEW_MARK)] = STATUS_CODES[DUPLICATE]
+        self.status_codes = codes
+        self.recheck(self.checked)
+
+    def page(self, row):
+        """Return the converted (old values, new values) of the rows of the page holding row"""
+        first = row - row % PAGE_SIZE
+        page = self.pages.get(first)
+        if page is not None:
+            self.pages.move_to_end(first)
+            return first, page
+        count = len(self.stored_fields)
+        kinds = [self.column_kinds.get(field, OTHER) for field in self.stored_fields]
+        kinds[self.positions[FID_FIELD]] = INTEGER
+        page = []
+        columns = ", ".join(["o_{}".format(i) for i in range(count)] + ["n_{}".format(i) for i in range(count)])
+        for values in self.database("SELECT {} FROM {} WHERE rowid > ? AND rowid <= ? ORDER BY rowid".format(
+                columns, RESULTS_TABLE), (first, first + PAGE_SIZE)):
+            page.append((tuple(stored_value(value, kind) for value, kind in zip(values[:count], kinds)),
+                         tuple(stored_value(value, kind) for value, kind in zip(values[count:], kinds))))
+        self.pages[first] = page
+        if len(self.pages) > CACHED_PAGES:
+            self.pages.popitem(last=False)
+        return first, page
+
+    def value(self, row, field, side=None):
+        position = self.positions.get(field)
+        if position is None:
+            return None
+        first, page = self.page(row)
+        return page[row - first][self.side(row) if side is None else side][position]
+
+    def values(self, row, side):
+        if not self.present[side][row]:
+            return None
+        first, page = self.page(row)
+        return dict(zip(self.stored_fields, page[row - first][side]))
+
+    def key(self, row):
+        return join_key(self.values(row, self.side(row)), self.join_fields)
+
+    def sort_order(self, field):
+        """Sort the rows on the values a field shows, NULLs first, in SQLite"""
+        position = self.positions.get(field)
+        if position is None or field == GEOMETRY_FIELD:
+            return None
+        shown = "(CASE WHEN mark IN ('{0}', '{1}') THEN o_{2} ELSE n_{2} END)".format(
+            DELETED_MARK, DUPLICATE_OLD_MARK, position)
+        cursor = self.database("SELECT rowid - 1 FROM {} ORDER BY {} IS NOT NULL, {}, rowid".format(
+            RESULTS_TABLE, shown, shown))
+        return np.fromiter((row[0] for row in cursor), dtype=np.int64, count=self.count)
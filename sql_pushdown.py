@@ -0,0 +1,178 @@
+# sql_pushdown.py
+"""Diffing two tables of the same database inside the database.
+
+When both layers live in one GeoPackage/SpatiaLite file or PostgreSQL
+database, the full outer join on the join fields and the per-column change
+flags are computed by a single SQL query. Only Added, Deleted and matched
+rows with a difference are returned; Unchanged rows are only counted.
+Tables with duplicate join keys cannot be joined this way and are left to
+the local diff, which reports the duplicates.
+"""
+import pathlib
+import sqlite3
+
+from .comparators import FID_FIELD
+from .diff_engine import ADDED, DELETED, DiffRecord, join_key
+
+SQLITE = "sqlite"
+POSTGRES = "postgres"
+
+DELETED_MARK = "D"
+ADDED_MARK = "A"
+MATCHED_MARK = "M"
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_table(schema, table):
+    """Return a quoted, optionally schema qualified table name"""
+    if schema:
+        return quote_identifier(schema) + "." + quote_identifier(table)
+    return quote_identifier(table)
+
+
+class PushdownPlan:
+    """SQL diffing an old and a new table of one database on one or more join fields.
+
+    id_columns, when given, names the old and the new column holding the
+    feature ids; they are read as FID_FIELD, after the fields.
+    """
+
+    def __init__(self, dialect, old_table, new_table, join_fields, fields, compare_fields,
+                 real_fields=(), tolerance=0.0, id_columns=None):
+        self.dialect = dialect
+        self.old_table = old_table  # Quoted table names
+        self.new_table = new_table
+        self.join_fields = list(join_fields)
+        self.fields = list(fields)
+        self.id_columns = None
+        if id_columns is not None:
+            self.id_columns = {"o": id_columns[0], "n": id_columns[1]}
+            self.fields.append(FID_FIELD)
+        self.compare_fields = list(compare_fields)
+        self.real_fields = set(real_fields)
+        self.tolerance = float(tolerance)
+
+    def column(self, alias, field):
+        if field == FID_FIELD and self.id_columns is not None:
+            field = self.id_columns[alias]
+        return "{}.{}".format(alias, quote_identifier(field))
+
+    def differs(self, field):
+        """Boolean SQL expression, never NULL, telling whether a field differs between o and n"""
+        old, new = self.column("o", field), self.column("n", field)
+        if self.dialect == POSTGRES:
+            distinct = "{} IS DISTINCT FROM {}".format(old, new)
+        else:
+            distinct = "{} IS NOT {}".format(old, new)
+        if field in self.real_fields:
+            return "(CASE WHEN {o} IS NULL OR {n} IS NULL THEN {d} ELSE ABS({o} - {n}) > {t!r} END)".format(
+                o=old, n=new, d=distinct, t=self.tolerance)
+        return "({})".format(distinct)
+
+    def any_difference(self):
+        if not self.compare_fields:
+            return "(1 = 0)"
+        return "(" + " OR ".join(self.differs(field) for field in self.compare_fields) + ")"
+
+    def join_condition(self):
+        """Condition matching o and n on the join fields, NULL matching NULL like in the local diff"""
+        template = "{} IS NOT DISTINCT FROM {}" if self.dialect == POSTGRES else "{} IS {}"
+        return " AND ".join(template.format(self.column("o", field), self.column("n", field))
+                            for field in self.join_fields)
+
+    def duplicate_keys_sql(self, table):
+        """Query returning a row if a join key occurs more than once in a table"""
+        keys = ", ".join(quote_identifier(field) for field in self.join_fields)
+        return "SELECT 1 FROM {} GROUP BY {} HAVING COUNT(*) > 1 LIMIT 1".format(table, keys)
+
+    def has_duplicate_keys(self, execute):
+        """Tell whether either table repeats a join key, using execute(sql) -> rows"""
+        return any(next(iter(execute(self.duplicate_keys_sql(table))), None) is not None
+                   for table in (self.old_table, self.new_table))
+
+    def diff_sql(self, include_unchanged=False, ordered=True):
+        """Query returning a mark, the old values, the new values and one 0/1 flag per compared field.
+
+        Matched rows without differences are left out unless include_unchanged.
+        """
+        old_columns = [self.column("o", field) for field in self.fields]
+        new_columns = [self.column("n", field) for field in self.fields]
+        nulls = ["NULL"] * len(self.fields)
+        flags = ["CASE WHEN {} THEN 1 ELSE 0 END".format(self.differs(field)) for field in self.compare_fields]
+        zeros = ["0"] * len(self.compare_fields)
+
+        def select(mark, old, new, flag_columns):
+            aliases = (["mark"] + ["o_{}".format(i) for i in range(len(self.fields))]
+                       + ["n_{}".format(i) for i in range(len(self.fields))]
+                       + ["f_{}".format(i) for i in range(len(self.compare_fields))])
+            columns = ["'{}'".format(mark)] + old + new + flag_columns
+            return "SELECT " + ", ".join("{} AS {}".format(c, a) for c, a in zip(columns, aliases))
+
+        sql = (
+            "SELECT * FROM ("
+            "{matched} FROM {old} o JOIN {new} n ON {join}{changed} "
+            "UNION ALL "
+            "{deleted} FROM {old} o WHERE NOT EXISTS (SELECT 1 FROM {new} n WHERE {join}) "
+            "UNION ALL "
+            "{added} FROM {new} n WHERE NOT EXISTS (SELECT 1 FROM {old} o WHERE {join})"
+            ") d"
+        ).format(
+            matched=select(MATCHED_MARK, old_columns, new_columns, flags),
+            deleted=select(DELETED_MARK, old_columns, nulls, zeros),
+            added=select(ADDED_MARK, nulls, new_columns, zeros),
+            old=self.old_table, new=self.new_table, join=self.join_condition(),
+            changed="" if include_unchanged else " WHERE " + self.any_difference())
+        return sql + " ORDER BY " + self.key_order("d") if ordered else sql
+
+    def key_order(self, alias):
+        """ORDER BY terms sorting rows of diff_sql() by join key"""
+        return ", ".join("COALESCE({1}.n_{0}, {1}.o_{0})".format(self.fields.index(field), alias)
+                         for field in self.join_fields)
+
+    def unchanged_count_sql(self):
+        """Query counting the matched rows without any difference"""
+        return "SELECT COUNT(*) FROM {} o JOIN {} n ON {} WHERE NOT {}".format(
+            self.old_table, self.new_table, self.join_condition(), self.any_difference())
+
+    def records(self, rows, columns_to_check, convert=None):
+        """Turn the rows of diff_sql() into DiffRecords; convert maps raw database values"""
+        checked = set(columns_to_check)
+        count = len(self.fields)
+        for row in rows:
+            if convert is not None:
+                row = [convert(value) for value in row]
+            mark = row[0]
+            old = dict(zip(self.fields, row[1:1 + count]))
+            new = dict(zip(self.fields, row[1 + count:1 + 2 * count]))
+            if mark == DELETED_MARK:
+                yield DiffRecord(join_key(old, self.join_fields), DELETED, old=old)
+            elif mark == ADDED_MARK:
+                yield DiffRecord(join_key(new, self.join_fields), ADDED, new=new)
+            else:
+                flags = row[1 + 2 * count:]
+                record = DiffRecord(join_key(new, self.join_fields), None, old=old, new=new)
+                record.differing = tuple(field for field, flag in zip(self.compare_fields, flags) if flag)
+                record.recheck(checked)
+                yield record
+
+    def run(self, execute, columns_to_check, convert=None):
+        """Run the plan with execute(sql) -> rows; return (records iterator, unchanged count)"""
+        unchanged = execute(self.unchanged_count_sql())
+        unchanged_count = next(iter(unchanged))[0]
+        return self.records(execute(self.diff_sql()), columns_to_check, convert), unchanged_count
+
+
+class SqliteExecutor:
+    """Callable running queries on an SQLite/GeoPackage file opened read-only"""
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(pathlib.Path(path).resolve().as_uri() + "?mode=ro", uri=True)
+
+    def __call__(self, sql):
+        return self.connection.execute(sql)
+
+    def close(self):
+        self.connection.close()
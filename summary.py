@@ -0,0 +1,79 @@
+# summary.py
+"""Counting the differences of a comparison without keeping its rows.
+
+A ComparisonSummary takes the DiffRecords of a comparison as they are
+produced and keeps only counts: rows per status, rows per differing field
+and the first keys of each. Memory does not grow with the layers and no
+result rows or views are built. The rows of a status can be listed
+afterwards by comparing again and keeping only that status.
+"""
+import json
+
+from .diff_engine import STATUSES, ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE
+
+# Keys remembered per status and per differing field
+SAMPLE_SIZE = 10
+
+
+class ComparisonSummary:
+    """Rows per status and per differing field of a comparison, with sample keys"""
+
+    def __init__(self, compare_fields=(), checked=(), sample_size=SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.checked = set(checked)
+        self.counts = dict.fromkeys(STATUSES, 0)
+        self.samples = {status: [] for status in STATUSES}
+        # Matched rows in which each compared field differs, whether it is checked or not
+        self.field_counts = dict.fromkeys(compare_fields, 0)
+        self.field_samples = {field: [] for field in compare_fields}
+        self.unlisted_unchanged = 0  # Unchanged rows only counted, by the database
+
+    def add(self, record):
+        self.counts[record.status] += 1
+        samples = self.samples[record.status]
+        if len(samples) < self.sample_size:
+            samples.append(record.key)
+        for field in record.differing:
+            self.field_counts[field] = self.field_counts.get(field, 0) + 1
+            samples = self.field_samples.setdefault(field, [])
+            if len(samples) < self.sample_size:
+                samples.append(record.key)
+
+    def add_unchanged(self, count):
+        """Count unchanged rows that were not returned as records"""
+        self.counts[UNCHANGED] += count
+        self.unlisted_unchanged += count
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def changed_fields(self):
+        """Return (field, rows) of the fields differing in any row, most often first"""
+        return sorted(((field, count) for field, count in self.field_counts.items() if count),
+                      key=lambda item: -item[1])
+
+    def report(self):
+        """Return the counts as text, one line per status and per differing field"""
+        lines = ["{}: {}".format(status, self.counts[status]) for status in STATUSES]
+        changed = self.changed_fields()
+        if changed:
+            lines.append("Rows per differing field:")
+            lines.extend("  {}: {}{}".format(field, count, "" if field in self.checked else " (not checked)")
+                         for field, count in changed)
+        for status in (ADDED, DELETED, MODIFIED, DUPLICATE):
+            if self.samples[status]:
+                lines.append("{} keys: {}{}".format(status, ", ".join(str(key) for key in self.samples[status]),
+                                                    ", ..." if self.counts[status] > self.sample_size else ""))
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {
+            'counts': dict(self.counts),
+            'fields': dict(self.changed_fields()),
+            'samples': {status: [str(key) for key in keys] for status, keys in self.samples.items() if keys},
+            'field_samples': {field: [str(key) for key in keys]
+                              for field, keys in self.field_samples.items() if keys},
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
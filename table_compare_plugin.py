@@ -1,13 +1,27 @@
 # table_compare_plugin.py
 import os
-from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt, QDate, QDateTime
-from qgis.PyQt.QtGui import QIcon, QColor
+from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
+from qgis.PyQt.QtGui import QIcon, QDoubleValidator
 from qgis.PyQt.QtWidgets import (QAction, QDialog, QVBoxLayout, QHBoxLayout, QComboBox, QLabel, 
-                                QPushButton, QTableWidget, QTableWidgetItem, QHeaderView, QCheckBox, 
-                                QGroupBox, QFileDialog, QMessageBox, QAbstractItemView)
-from qgis.core import QgsProject, QgsVectorLayer, QgsFeature
-import qgis.utils
-import csv
+                                QPushButton, QTableView, QCheckBox, QProgressBar, QLineEdit, QMenu,
+                                QGroupBox, QFileDialog, QMessageBox, QAbstractItemView, QProgressDialog,
+                                QToolButton, QInputDialog)
+from qgis.core import QgsApplication, QgsProject, QgsVectorLayer
+from qgis.gui import QgsCollapsibleGroupBox
+
+from .diff_engine import ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE
+from .comparators import DEFAULT_TOLERANCE, GEOMETRY_FIELD
+from .compare_task import CompareTask, default_columns_to_check
+from .fingerprint_cache import FingerprintCache
+from .decision_store import ACCEPTED, REJECTED
+from .exporters import FORMAT_FILTERS, ResultExporter
+from .results_model import ComparisonResultsModel, ResultsFilterProxyModel
+from .processing_provider import TableCompareProvider
+from .instrumentation import MODEL, EXPORT, APPLY, timed
+from .apply_decisions import plan_changes, apply_plan
+from .live_compare import LiveComparison
+from .spill_store import SPILL_ROWS
+from .keyless_match import KeylessMatcher
 
 class TableComparePlugin:
     def __init__(self, iface):
@@ -29,6 +43,7 @@ class TableComparePlugin:
         self.actions = []
         self.menu = self.tr(u'&Table Compare')
         self.first_start = None
+        self.provider = None
 
     def tr(self, message):
         return QCoreApplication.translate('TableComparePlugin', message)
@@ -67,7 +82,13 @@ class TableComparePlugin:
         self.actions.append(action)
         return action
 
+    def initProcessing(self):
+        """Register the Processing provider; also called by qgis_process, without a GUI"""
+        self.provider = TableCompareProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
+
     def initGui(self):
+        self.initProcessing()
         icon_path = ':/plugins/table_compare/icon.png'
         self.add_action(
             icon_path,
@@ -78,6 +99,7 @@ class TableComparePlugin:
         self.first_start = True
 
     def unload(self):
+        QgsApplication.processingRegistry().removeProvider(self.provider)
         for action in self.actions:
             self.iface.removePluginMenu(
                 self.tr(u'&Table Compare'),
@@ -90,7 +112,7 @@ class TableComparePlugin:
             self.dlg = TableCompareDialog()
 
         self.dlg.show()
-        result = self.dlg.exec_()
+        self.dlg.exec_()
 
 
 class TableCompareDialog(QDialog):
@@ -115,21 +137,93 @@ class TableCompareDialog(QDialog):
         self.new_table_combo = QComboBox()
         selection_layout.addWidget(self.new_table_combo)
         
-        selection_layout.addWidget(QLabel("Join Field:"))
-        self.join_field_combo = QComboBox()
-        self.join_field_combo.setMinimumWidth(120)
-        selection_layout.addWidget(self.join_field_combo)
+        selection_layout.addWidget(QLabel("Join Fields:"))
+        self.join_fields_button = QToolButton()
+        self.join_fields_button.setPopupMode(QToolButton.InstantPopup)
+        self.join_fields_button.setMinimumWidth(120)
+        self.join_fields_button.setToolTip("Fields whose combined values identify a feature in both tables")
+        self.join_fields_menu = QMenu(self.join_fields_button)
+        self.join_fields_menu.triggered.connect(self.update_join_fields_text)
+        self.join_fields_button.setMenu(self.join_fields_menu)
+        selection_layout.addWidget(self.join_fields_button)
+        
+        selection_layout.addWidget(QLabel("Tolerance:"))
+        self.tolerance_edit = QLineEdit(str(DEFAULT_TOLERANCE))
+        self.tolerance_edit.setValidator(QDoubleValidator(0.0, 1e12, 15))
+        self.tolerance_edit.setToolTip("Absolute tolerance when comparing real number fields")
+        self.tolerance_edit.setMaximumWidth(80)
+        selection_layout.addWidget(self.tolerance_edit)
+        
+        self.fingerprint_cache_check = QCheckBox("Fingerprint Cache")
+        self.fingerprint_cache_check.setToolTip(
+            "Remember row fingerprints of the old table so it is not read again while its file is unchanged")
+        selection_layout.addWidget(self.fingerprint_cache_check)
+        
+        self.pushdown_check = QCheckBox("Compare in Database")
+        self.pushdown_check.setToolTip(
+            "When both tables are in the same GeoPackage, SpatiaLite or PostgreSQL database, "
+            "compute the differences there and only list changed rows")
+        selection_layout.addWidget(self.pushdown_check)
+        
+        self.geometry_check = QCheckBox("Compare Geometry")
+        self.geometry_check.setToolTip(
+            "Also mark features whose geometry changed (bounding box and WKB hash first, "
+            "tolerance-based equality only where those differ)")
+        selection_layout.addWidget(self.geometry_check)
+        
+        self.live_check = QCheckBox("Live Update")
+        self.live_check.setToolTip(
+            "Keep the results up to date while either table is edited, comparing only the edited features again")
+        self.live_check.toggled.connect(self.update_live_comparison)
+        selection_layout.addWidget(self.live_check)
+        
+        self.keyless_check = QCheckBox("Match Without Key")
+        self.keyless_check.setToolTip(
+            "Pair features by geometry proximity and similar values instead of join keys, for tables whose "
+            "identifiers were renumbered; join fields picked afterwards must then be equal in a pair")
+        self.keyless_check.toggled.connect(self.keyless_toggled)
+        selection_layout.addWidget(self.keyless_check)
+        
+        self.match_distance_edit = QLineEdit("0")
+        self.match_distance_edit.setValidator(QDoubleValidator(0.0, 1e12, 15))
+        self.match_distance_edit.setToolTip(
+            "Largest distance between the geometries of matched features, in layer units")
+        self.match_distance_edit.setMaximumWidth(80)
+        self.match_distance_edit.setEnabled(False)
+        selection_layout.addWidget(self.match_distance_edit)
+        
+        self.summary_check = QCheckBox("Summary Only")
+        self.summary_check.setToolTip(
+            "Only count the rows per status and per changed field; list the rows of a status afterwards on demand")
+        selection_layout.addWidget(self.summary_check)
         
         self.refresh_button = QPushButton("Refresh Layers")
         self.refresh_button.clicked.connect(self.populate_layer_combos)
         selection_layout.addWidget(self.refresh_button)
         
         self.compare_button = QPushButton("Compare Tables")
-        self.compare_button.clicked.connect(self.compare_tables)
+        self.compare_button.clicked.connect(lambda: self.compare_tables())
         selection_layout.addWidget(self.compare_button)
         
         layout.addLayout(selection_layout)
         
+        # Progress of a running comparison
+        progress_layout = QHBoxLayout()
+        
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        progress_layout.addWidget(self.progress_bar)
+        
+        self.progress_label = QLabel("")
+        progress_layout.addWidget(self.progress_label)
+        
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.clicked.connect(self.cancel_comparison)
+        progress_layout.addWidget(self.cancel_button)
+        
+        layout.addLayout(progress_layout)
+        self.set_comparison_running(False)
+        
         # Color legend
         legend_layout = QHBoxLayout()
         legend_layout.addWidget(QLabel("Legend:"))
@@ -151,6 +245,10 @@ class TableCompareDialog(QDialog):
         unchanged_label.setStyleSheet("background-color: rgb(255, 255, 255); padding: 2px 8px; border: 1px solid gray;")
         legend_layout.addWidget(unchanged_label)
         
+        duplicate_label = QLabel("Duplicate")
+        duplicate_label.setStyleSheet("background-color: rgb(255, 190, 110); padding: 2px 8px; border: 1px solid gray;")
+        legend_layout.addWidget(duplicate_label)
+        
         changed_field_label = QLabel("Changed Field")
         changed_field_label.setStyleSheet("background-color: rgb(255, 150, 150); padding: 2px 8px; border: 1px solid gray;")
         legend_layout.addWidget(changed_field_label)
@@ -182,6 +280,11 @@ class TableCompareDialog(QDialog):
         self.filter_unchanged.stateChanged.connect(self.apply_filters)
         filter_layout.addWidget(self.filter_unchanged)
         
+        self.filter_duplicate = QCheckBox("Duplicate")
+        self.filter_duplicate.setChecked(True)
+        self.filter_duplicate.stateChanged.connect(self.apply_filters)
+        filter_layout.addWidget(self.filter_duplicate)
+        
         filter_group.setLayout(filter_layout)
         layout.addWidget(filter_group)
         
@@ -205,6 +308,11 @@ class TableCompareDialog(QDialog):
         self.reject_all_btn.clicked.connect(self.reject_all_changes)
         actions_layout.addWidget(self.reject_all_btn)
         
+        self.apply_btn = QPushButton("Apply Decisions")
+        self.apply_btn.setToolTip("Write accepted changes, and revert rejected ones, in a layer of your choice")
+        self.apply_btn.clicked.connect(self.apply_decisions)
+        actions_layout.addWidget(self.apply_btn)
+        
         self.export_btn = QPushButton("Export Results")
         self.export_btn.clicked.connect(self.export_results)
         actions_layout.addWidget(self.export_btn)
@@ -217,14 +325,48 @@ class TableCompareDialog(QDialog):
         layout.addWidget(actions_group)
         
         # Results table
-        self.results_table = QTableWidget()
-        self.results_table.setSortingEnabled(True)  # Enable sorting
-        self.results_table.setSelectionBehavior(QAbstractItemView.SelectRows)  # Select entire rows
-        self.results_table.setSelectionMode(QAbstractItemView.MultiSelection)  # Allow multiple selection
-        layout.addWidget(self.results_table)
-        
-        # Connect sorting signal to update row numbers after sort
-        self.results_table.horizontalHeader().sectionClicked.connect(self.on_column_sort)
+        # Results are served lazily by a model; the proxy filters by status and sorts
+        self.results_model = ComparisonResultsModel(self)
+        self.results_proxy = ResultsFilterProxyModel(self)
+        self.results_proxy.setSourceModel(self.results_model)
+        
+        self.results_view = QTableView()
+        self.results_view.setModel(self.results_proxy)
+        self.results_view.setSortingEnabled(True)  # Enable sorting
+        self.results_view.sortByColumn(-1, Qt.AscendingOrder)  # Keep key order until a header is clicked
+        self.results_view.setSelectionBehavior(QAbstractItemView.SelectRows)  # Select entire rows
+        self.results_view.setSelectionMode(QAbstractItemView.MultiSelection)  # Allow multiple selection
+        self.results_view.setContextMenuPolicy(Qt.CustomContextMenu)  # Accept/reject single field changes
+        self.results_view.customContextMenuRequested.connect(self.show_field_decision_menu)
+        layout.addWidget(self.results_view)
+        
+        summary_layout = QHBoxLayout()
+        self.summary_label = QLabel("")
+        self.summary_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        summary_layout.addWidget(self.summary_label, 1)
+        
+        # Rows of a summary-only comparison are listed per status on demand
+        self.load_rows_button = QToolButton()
+        self.load_rows_button.setText("List Rows")
+        self.load_rows_button.setToolTip("Compare again and list the rows of one status")
+        self.load_rows_button.setPopupMode(QToolButton.InstantPopup)
+        load_rows_menu = QMenu(self.load_rows_button)
+        for status in (ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE):
+            load_rows_menu.addAction(status).triggered.connect(lambda checked, status=status: self.load_rows(status))
+        self.load_rows_button.setMenu(load_rows_menu)
+        self.load_rows_button.setVisible(False)
+        summary_layout.addWidget(self.load_rows_button)
+        layout.addLayout(summary_layout)
+        
+        # Time, rows and memory per phase of the last comparison, collapsed until needed
+        self.stats_group = QgsCollapsibleGroupBox("Statistics")
+        self.stats_group.setCollapsed(True)
+        stats_layout = QVBoxLayout()
+        self.stats_label = QLabel("")
+        self.stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)  # To copy into tickets
+        stats_layout.addWidget(self.stats_label)
+        self.stats_group.setLayout(stats_layout)
+        layout.addWidget(self.stats_group)
         
         # Connect layer selection to update join field options
         self.old_table_combo.currentTextChanged.connect(self.update_join_fields)
@@ -232,11 +374,12 @@ class TableCompareDialog(QDialog):
         
         self.setLayout(layout)
         
-        # Store original data for filtering
-        self.all_rows_data = []
-        self.comparison_data = {}  # Store comparison results for accept/reject functionality
-        self.original_row_order = []  # Store original row data for sorting
         self.columns_to_check = []  # Store which columns should be checked for modifications
+        self.compare_task = None  # Comparison currently running in the background
+        self.unlisted_unchanged = None  # Unchanged rows counted in the database but not listed
+        self.compared_task = None  # Finished task whose records are shown, for layers and field types
+        self.live_comparison = None  # Follows edits of the compared layers while Live Update is checked
+        self.comparison_summary = None  # Counts of a summary-only comparison, shown instead of rows
 
     def populate_layer_combos(self):
         """Populate combo boxes with available vector layers"""
@@ -255,7 +398,7 @@ class TableCompareDialog(QDialog):
 
     def update_join_fields(self):
         """Update join field options based on selected layers"""
-        self.join_field_combo.clear()
+        self.join_fields_menu.clear()
         
         old_layer = self.old_table_combo.currentData()
         new_layer = self.new_table_combo.currentData()
@@ -267,120 +410,97 @@ class TableCompareDialog(QDialog):
             common_fields = old_fields.intersection(new_fields)
             
             for field in sorted(common_fields):
-                self.join_field_combo.addItem(field)
+                action = self.join_fields_menu.addAction(field)
+                action.setCheckable(True)
+            
+            # Join on the first field until others are picked; without a key, blocking fields are picked by hand
+            actions = self.join_fields_menu.actions()
+            if actions and not self.keyless_check.isChecked():
+                actions[0].setChecked(True)
+        self.update_join_fields_text()
+
+    def keyless_toggled(self, checked):
+        """Clear the join fields when matching without a key, so only fields picked afterwards block pairs"""
+        self.match_distance_edit.setEnabled(checked)
+        if checked:
+            for action in self.join_fields_menu.actions():
+                action.setChecked(False)
+            self.update_join_fields_text()
+
+    def join_fields(self):
+        """Return the checked join fields"""
+        return [action.text() for action in self.join_fields_menu.actions() if action.isChecked()]
+
+    def update_join_fields_text(self):
+        """Show the checked join fields on the join fields button"""
+        self.join_fields_button.setText(", ".join(self.join_fields()) or "(none)")
 
     def apply_filters(self):
-        """Apply filters to hide/show rows based on status and update dynamic row numbering in headers"""
-        if not hasattr(self, 'all_rows_data') or not self.all_rows_data:
-            return
-            
-        show_added = self.filter_added.isChecked()
-        show_deleted = self.filter_deleted.isChecked()
-        show_modified = self.filter_modified.isChecked()
-        show_unchanged = self.filter_unchanged.isChecked()
-        
-        for row in range(self.results_table.rowCount()):
-            status_item = self.results_table.item(row, 0)  # Status is back to column 0
-            if status_item:
-                status = status_item.text()
-                should_show = (
-                    (status == "Added" and show_added) or
-                    (status == "Deleted" and show_deleted) or
-                    (status == "Modified" and show_modified) or
-                    (status == "Unchanged" and show_unchanged)
-                )
-                
-                self.results_table.setRowHidden(row, not should_show)
-        
-        # Update dynamic row numbering for visible rows
-        self.update_dynamic_row_numbers()
-
-    def format_value(self, value):
-        """Format values for display, handling special types like dates"""
-        if isinstance(value, QDate):
-            return value.toString("yyyy-MM-dd")
-        elif isinstance(value, QDateTime):
-            return value.toString("yyyy-MM-dd hh:mm:ss")
-        elif value is None:
-            return ""
-        else:
-            return str(value)
-    
-    def values_equal(self, val1, val2):
-        """Compare two values for equality, handling different data types"""
-        # Handle None values
-        if val1 is None and val2 is None:
-            return True
-        if val1 is None or val2 is None:
-            return False
-        
-        # Convert to strings for comparison to handle type differences
-        str1 = str(val1).strip()
-        str2 = str(val2).strip()
-        
-        # Handle numeric comparison
-        try:
-            float1 = float(str1)
-            float2 = float(str2)
-            # Compare with small tolerance for floating point precision
-            return abs(float1 - float2) < 1e-10
-        except (ValueError, TypeError):
-            # Not numeric, compare as strings
-            return str1 == str2
+        """Apply filters to hide/show rows based on status; row numbers follow the visible rows"""
+        visible_statuses = []
+        if self.filter_added.isChecked():
+            visible_statuses.append(ADDED)
+        if self.filter_deleted.isChecked():
+            visible_statuses.append(DELETED)
+        if self.filter_modified.isChecked():
+            visible_statuses.append(MODIFIED)
+        if self.filter_unchanged.isChecked():
+            visible_statuses.append(UNCHANGED)
+        if self.filter_duplicate.isChecked():
+            visible_statuses.append(DUPLICATE)
+        
+        self.results_proxy.set_visible_statuses(visible_statuses)
+
+    def selected_source_rows(self):
+        """Return the model rows of the rows selected in the results view"""
+        return [self.results_proxy.mapToSource(index).row()
+                for index in self.results_view.selectionModel().selectedRows()]
 
     def accept_selected_changes(self):
         """Accept selected changes"""
-        selected_rows = set()
-        for item in self.results_table.selectedItems():
-            selected_rows.add(item.row())
-        
-        for row in selected_rows:
-            status_item = self.results_table.item(row, 0)  # Status is back to column 0
-            if status_item and status_item.text() in ["Modified", "Added"]:
-                # Mark as accepted (change background to light green)
-                for col in range(self.results_table.columnCount()):
-                    item = self.results_table.item(row, col)
-                    if item:
-                        item.setBackground(QColor(200, 255, 200))  # Light green for accepted
+        self.results_model.set_decision(self.selected_source_rows(), ACCEPTED)
 
     def reject_selected_changes(self):
         """Reject selected changes"""
-        selected_rows = set()
-        for item in self.results_table.selectedItems():
-            selected_rows.add(item.row())
-        
-        for row in selected_rows:
-            status_item = self.results_table.item(row, 0)  # Status is back to column 0
-            if status_item and status_item.text() in ["Modified", "Added"]:
-                # Mark as rejected (change background to light red)
-                for col in range(self.results_table.columnCount()):
-                    item = self.results_table.item(row, col)
-                    if item:
-                        item.setBackground(QColor(255, 200, 200))  # Light red for rejected
+        self.results_model.set_decision(self.selected_source_rows(), REJECTED)
 
     def accept_all_changes(self):
         """Accept all changes"""
-        for row in range(self.results_table.rowCount()):
-            status_item = self.results_table.item(row, 0)  # Status is back to column 0
-            if status_item and status_item.text() in ["Modified", "Added"]:
-                for col in range(self.results_table.columnCount()):
-                    item = self.results_table.item(row, col)
-                    if item:
-                        item.setBackground(QColor(200, 255, 200))  # Light green for accepted
+        self.results_model.set_decision_all(ACCEPTED)
 
     def reject_all_changes(self):
         """Reject all changes"""
-        for row in range(self.results_table.rowCount()):
-            status_item = self.results_table.item(row, 0)  # Status is back to column 0
-            if status_item and status_item.text() in ["Modified", "Added"]:
-                for col in range(self.results_table.columnCount()):
-                    item = self.results_table.item(row, col)
-                    if item:
-                        item.setBackground(QColor(255, 200, 200))  # Light red for rejected
+        self.results_model.set_decision_all(REJECTED)
+
+    def show_field_decision_menu(self, position):
+        """Offer accepting or rejecting the change of the clicked field"""
+        index = self.results_view.indexAt(position)
+        if not index.isValid() or index.column() == 0:
+            return
+        source_index = self.results_proxy.mapToSource(index)
+        field = self.results_model.fields[source_index.column() - 1]
+        
+        # Apply to all selected rows if the clicked row is part of the selection
+        rows = self.selected_source_rows()
+        if source_index.row() not in rows:
+            rows = [source_index.row()]
+        rows = [row for row in rows if self.results_model.changed(row, field)]
+        if not rows:
+            return
+        
+        title = self.results_model.header(field)
+        menu = QMenu(self)
+        accept_action = menu.addAction(f"Accept Change of '{title}'")
+        reject_action = menu.addAction(f"Reject Change of '{title}'")
+        chosen = menu.exec_(self.results_view.viewport().mapToGlobal(position))
+        if chosen == accept_action:
+            self.results_model.set_field_decision(rows, field, ACCEPTED)
+        elif chosen == reject_action:
+            self.results_model.set_field_decision(rows, field, REJECTED)
 
     def export_results(self):
-        """Export comparison results to CSV"""
-        if self.results_table.rowCount() == 0:
+        """Export the visible comparison results, in their displayed order, to CSV, GeoPackage or Parquet"""
+        if self.results_proxy.rowCount() == 0:
             QMessageBox.warning(self, "Warning", "No data to export!")
             return
         
@@ -388,73 +508,111 @@ class TableCompareDialog(QDialog):
             self, 
             "Export Comparison Results", 
             "comparison_results.csv", 
-            "CSV files (*.csv)"
+            ";;".join(FORMAT_FILTERS.values())
+        )
+        if not filename:
+            return
+
+        task = self.compared_task
+        project = QgsProject.instance()
+        old_layer, new_layer = (project.mapLayer(layer_id) for layer_id in task.layer_ids) if task else (None, None)
+        rows = self.results_proxy.source_rows()
+        exporter = ResultExporter(self.results_model, rows, task.column_kinds if task else None,
+                                  task.layer_fields if task else None, old_layer, new_layer)
+
+        total = self.results_proxy.rowCount()
+        progress = QProgressDialog("Exporting results...", "Cancel", 0, total, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+
+        def report(done):
+            progress.setValue(done)
+            QCoreApplication.processEvents()
+            return not progress.wasCanceled()
+
+        try:
+            with timed(self.results_proxy.stats, EXPORT, total):
+                written = exporter.export(filename, report)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to export: {str(e)}")
+            return
+        finally:
+            progress.close()
+
+        if written < total:
+            QMessageBox.warning(self, "Export Canceled", f"Only {written} of {total} rows were exported to {filename}")
+        else:
+            QMessageBox.information(self, "Success", f"Results exported to {filename}")
+
+    def apply_decisions(self):
+        """Apply the accepted and rejected changes to a chosen layer after confirming what will be written"""
+        task = self.compared_task
+        if task is None or not self.results_model.decisions.decided().any():
+            QMessageBox.warning(self, "Warning", "Accept or reject some changes first!")
+            return
+        if task.matcher is not None:
+            QMessageBox.warning(self, "Warning",
+                                "Decisions on features matched without a key cannot be applied to a layer.")
+            return
+        project = QgsProject.instance()
+        old_layer, new_layer = (project.mapLayer(layer_id) for layer_id in task.layer_ids)
+        layers = [layer for layer in project.mapLayers().values() if isinstance(layer, QgsVectorLayer)]
+        if not layers:
+            return
+        names = [layer.name() for layer in layers]
+        current = layers.index(old_layer) if old_layer in layers else 0
+        name, ok = QInputDialog.getItem(self, "Apply Decisions", "Layer to write the decisions to:", names, current, False)
+        if not ok:
+            return
+        target = layers[names.index(name)]
+        
+        try:
+            plan = plan_changes(self.results_model, target, task.join_fields, old_layer, new_layer)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to prepare the edits: {str(e)}")
+            return
+        if not len(plan):
+            QMessageBox.information(self, "Apply Decisions", f"{target.name()} already matches the decisions.")
+            return
+        
+        # Dry run: show what would be written before touching the layer
+        counts = plan.counts()
+        answer = QMessageBox.question(
+            self,
+            "Apply Decisions",
+            f"Write the decisions to {target.name()}?\n\n"
+            f"{counts['added']} features added\n"
+            f"{counts['deleted']} features deleted\n"
+            f"{counts['changed']} features with changed attributes\n"
+            f"{counts['geometries']} features with changed geometry"
         )
+        if answer != QMessageBox.Yes:
+            return
+        
+        progress = QProgressDialog("Applying decisions...", "Cancel", 0, len(plan), self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(500)
+        
+        def report(done):
+            progress.setValue(done)
+            QCoreApplication.processEvents()
+            return not progress.wasCanceled()
+        
+        was_editing = target.isEditable()
+        try:
+            with timed(self.results_proxy.stats, APPLY, len(plan)):
+                applied = apply_plan(plan, target, report)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to apply the decisions: {str(e)}")
+            return
+        finally:
+            progress.close()
         
-        if filename:
-            try:
-                with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                    writer = csv.writer(csvfile)
-                    
-                    # Write headers (all columns)
-                    headers = []
-                    for col in range(self.results_table.columnCount()):
-                        header_item = self.results_table.horizontalHeaderItem(col)
-                        headers.append(header_item.text() if header_item else f"Column_{col}")
-                    
-                    # Add decision column
-                    headers.append("Decision")
-                    writer.writerow(headers)
-                    
-                    # Write data
-                    for row in range(self.results_table.rowCount()):
-                        if self.results_table.isRowHidden(row):
-                            continue  # Skip hidden rows
-                            
-                        row_data = []
-                        decision = "Pending"
-                        
-                        # Get the status for this row (back to column 0)
-                        status_item = self.results_table.item(row, 0)
-                        status = status_item.text() if status_item else ""
-                        
-                        # Determine decision based on background color of status column
-                        if status_item:
-                            bg_color = status_item.background().color()
-                            if bg_color == QColor(200, 255, 200):
-                                decision = "Accepted"
-                            elif bg_color == QColor(255, 200, 200):
-                                decision = "Rejected"
-                        
-                        # Export all columns
-                        for col in range(self.results_table.columnCount()):
-                            item = self.results_table.item(row, col)
-                            if item:
-                                text = item.text()
-                                
-                                # If this contains an arrow (indicating a change), extract only the appropriate value
-                                if " → " in text:
-                                    if decision == "Rejected":
-                                        # For rejected changes, export the old value (before arrow)
-                                        clean_text = text.split(" → ")[0]
-                                    else:
-                                        # For accepted or pending changes, export the new value (after arrow)
-                                        clean_text = text.split(" → ")[1]
-                                else:
-                                    # No change, use as is
-                                    clean_text = text
-                                
-                                row_data.append(clean_text)
-                            else:
-                                row_data.append("")
-                        
-                        row_data.append(decision)
-                        writer.writerow(row_data)
-                
-                QMessageBox.information(self, "Success", f"Results exported to {filename}")
-                
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to export: {str(e)}")
+        if applied:
+            unsaved = " (in its edit session, not saved yet)" if was_editing else ""
+            QMessageBox.information(self, "Success", f"{applied} edits written to {target.name()}{unsaved}")
+        else:
+            QMessageBox.warning(self, "Apply Canceled", f"No edits were written to {target.name()}")
 
     def select_columns_to_check(self):
         """Allow user to select which columns should be checked for modifications"""
@@ -491,11 +649,11 @@ class TableCompareDialog(QDialog):
         
         # Create checkboxes for each field
         checkboxes = {}
+        default_fields = set(default_columns_to_check(all_fields))
         for field in all_fields:
             checkbox = QCheckBox(field)
             # Default: check all columns except common auto-generated ones
-            if field.lower() not in ['fid', 'id', 'objectid', 'gid', 'created_date', 'modified_date', 'timestamp']:
-                checkbox.setChecked(True)
+            checkbox.setChecked(field in default_fields)
             checkboxes[field] = checkbox
             scroll_layout.addWidget(checkbox)
         
@@ -531,15 +689,19 @@ class TableCompareDialog(QDialog):
             self.columns_to_check = [field for field, checkbox in checkboxes.items() if checkbox.isChecked()]
             
             # Automatically re-run comparison if we have data
-            if self.results_table.rowCount() > 0:
+            if self.results_model.rowCount() > 0:
                 QMessageBox.information(
                     self, 
                     "Columns Updated", 
                     f"Selected {len(self.columns_to_check)} columns to check for modifications.\n"
                     f"Comparison results updated automatically."
                 )
-                # Re-run the comparison with new settings
-                self.compare_tables()
+                # Recombine the cached difference masks instead of comparing again
+                self.results_model.set_columns_to_check(self.checked_columns())
+                if self.live_comparison is not None:
+                    self.live_comparison.set_columns_to_check(self.checked_columns())
+                self.apply_filters()
+                self.update_summary()
             else:
                 QMessageBox.information(
                     self, 
@@ -548,23 +710,14 @@ class TableCompareDialog(QDialog):
                     f"Click 'Compare Tables' to see results."
                 )
 
-    def on_column_sort(self):
-        """Called when a column header is clicked for sorting - update row numbers after sort"""
-        # Use a short delay to ensure the sort operation completes first
-        from qgis.PyQt.QtCore import QTimer
-        QTimer.singleShot(10, self.update_dynamic_row_numbers)
-
-    def update_dynamic_row_numbers(self):
-        """Update the dynamic row numbering in vertical headers for visible rows"""
-        visible_row_count = 0
-        
-        for row in range(self.results_table.rowCount()):
-            if not self.results_table.isRowHidden(row):
-                visible_row_count += 1
-                self.results_table.setVerticalHeaderItem(row, QTableWidgetItem(str(visible_row_count)))
+    def checked_columns(self):
+        """Return the columns deciding the Modified status of the current results, geometry included if compared"""
+        if GEOMETRY_FIELD in self.results_model.fields:
+            return self.columns_to_check + [GEOMETRY_FIELD]
+        return self.columns_to_check
 
-    def compare_tables(self):
-        """Main comparison logic"""
+    def compare_tables(self, statuses=None):
+        """Main comparison logic; with statuses, only rows of those statuses are listed"""
         old_layer = self.old_table_combo.currentData()
         new_layer = self.new_table_combo.currentData()
         
@@ -572,150 +725,205 @@ class TableCompareDialog(QDialog):
             return
         
         # Clear previous results completely
-        self.results_table.setRowCount(0)
-        self.results_table.setColumnCount(0)
-        self.all_rows_data = []
-        self.comparison_data = {}
+        self.results_model.clear()
+        self.unlisted_unchanged = None
+        self.compared_task = None
+        self.update_live_comparison()
+        self.results_proxy.stats = None
+        self.comparison_summary = None
+        self.update_summary()
+        self.update_stats()
             
         # Get field names (assuming same structure)
         fields = [field.name() for field in old_layer.fields()]
         
         # If no columns selected for checking, use all fields
         if not self.columns_to_check:
-            self.columns_to_check = [f for f in fields if f.lower() not in ['fid', 'id', 'objectid', 'gid', 'created_date', 'modified_date', 'timestamp']]
-        
-        # Get selected join field
-        join_field = self.join_field_combo.currentText()
-        if not join_field:
+            self.columns_to_check = default_columns_to_check(fields)
+        
+        # Get selected join fields
+        join_fields = self.join_fields()
+        matcher = None
+        if self.keyless_check.isChecked():
+            # Join fields only narrow down the candidates
+            matcher = KeylessMatcher(join_fields, self.columns_to_check, self.match_distance())
+        elif not join_fields:
             # Fallback to first field if none selected
-            join_field = fields[0] if fields else None
+            join_fields = fields[:1]
         
-        if not join_field:
+        if not join_fields and matcher is None:
             return
         
-        # Create dictionaries for comparison
-        old_features = {}
-        new_features = {}
-        
-        # Populate old features
-        for feature in old_layer.getFeatures():
-            feature_id = feature[join_field]
-            old_features[feature_id] = {field: feature[field] for field in fields}
-        
-        # Populate new features
-        for feature in new_layer.getFeatures():
-            feature_id = feature[join_field]
-            new_features[feature_id] = {field: feature[field] for field in fields}
-        
-        self.display_comparison_results(old_features, new_features, fields)
+        # Fetch and diff in the background; results come back in on_comparison_completed
+        self.cancel_comparison()
+        fingerprint_cache = self.fingerprint_cache() if self.fingerprint_cache_check.isChecked() else None
+        task = CompareTask(old_layer, new_layer, join_fields, fields, self.columns_to_check, self.tolerance(),
+                           fingerprint_cache, self.pushdown_check.isChecked(), self.geometry_check.isChecked(),
+                           *self.spill_thresholds(), summary_only=self.summary_check.isChecked() and not statuses,
+                           statuses=statuses, matcher=matcher)
+        task.progressChanged.connect(self.on_comparison_progress)
+        task.taskCompleted.connect(lambda: self.on_comparison_completed(task))
+        task.taskTerminated.connect(lambda: self.on_comparison_terminated(task))
+        self.compare_task = task
+        self.set_comparison_running(True)
+        QgsApplication.taskManager().addTask(task)
+
+    def tolerance(self):
+        """Return the tolerance entered for real number fields"""
+        try:
+            return abs(float(self.tolerance_edit.text()))
+        except ValueError:
+            return DEFAULT_TOLERANCE
 
-    def display_comparison_results(self, old_features, new_features, fields):
-        """Display comparison results in the table widget"""
-        all_ids = set(old_features.keys()) | set(new_features.keys())
-        
-        # Setup table
-        self.results_table.setRowCount(len(all_ids))
-        self.results_table.setColumnCount(len(fields) + 1)  # +1 for status column only
-        
-        headers = ["Status"] + fields
-        self.results_table.setHorizontalHeaderLabels(headers)
-        
-        # Clear previous data
-        self.all_rows_data = []
-        self.comparison_data = {}  # Reset comparison data
-        
-        # Colors for different states - more distinguishable colors
-        added_color = QColor(144, 238, 144)    # Light green
-        deleted_color = QColor(255, 99, 99)    # Bright red (more distinct)
-        modified_color = QColor(255, 255, 150) # Bright yellow (more distinct)
-        unchanged_color = QColor(255, 255, 255) # White
-        
-        row = 0
-        for feature_id in sorted(all_ids):
-            status = ""
-            row_color = unchanged_color
-            
-            if feature_id in old_features and feature_id in new_features:
-                # Feature exists in both - check if modified
-                old_data = old_features[feature_id]
-                new_data = new_features[feature_id]
-                
-                # Check if any field is actually different - only check selected columns
-                is_modified = False
-                for field in self.columns_to_check:
-                    if field in old_data and field in new_data:
-                        if not self.values_equal(old_data.get(field), new_data.get(field)):
-                            is_modified = True
-                            break
-                
-                if is_modified:
-                    status = "Modified"
-                    row_color = modified_color
-                else:
-                    status = "Unchanged"
-                    row_color = unchanged_color
-                
-                # Use new data for display
-                data = new_data
-                
-            elif feature_id in new_features:
-                # Added feature
-                status = "Added"
-                row_color = added_color
-                data = new_features[feature_id]
-                
-            else:
-                # Deleted feature
-                status = "Deleted"
-                row_color = deleted_color
-                data = old_features[feature_id]
-            
-            # Set row header (dynamic numbering)
-            self.results_table.setVerticalHeaderItem(row, QTableWidgetItem(str(row + 1)))
-            
-            # Set status
-            status_item = QTableWidgetItem(status)
-            status_item.setBackground(row_color)
-            self.results_table.setItem(row, 0, status_item)
-            
-            # Set field values
-            for col, field in enumerate(fields, 1):  # Start from column 1
-                if status == "Modified" and feature_id in old_features and feature_id in new_features:
-                    old_value = old_features[feature_id].get(field)
-                    new_value = new_features[feature_id].get(field)
-                    
-                    # Only show arrows and highlighting for fields that are being checked
-                    if field in self.columns_to_check and not self.values_equal(old_value, new_value):
-                        # Show change: old -> new (only for fields we're checking)
-                        display_text = f"{self.format_value(old_value)} → {self.format_value(new_value)}"
-                        item = QTableWidgetItem(display_text)
-                        item.setBackground(QColor(255, 150, 150))  # Darker red for changed fields
-                    else:
-                        # Either field not being checked OR no change - just show new value
-                        item = QTableWidgetItem(self.format_value(new_value))
-                        item.setBackground(row_color)  # Use row color
-                else:
-                    # Use appropriate value based on status
-                    item = QTableWidgetItem(self.format_value(data.get(field, '')))
-                    item.setBackground(row_color)  # Always apply row color
-                
-                self.results_table.setItem(row, col, item)
-            
-            # Store comparison data for this feature
-            self.comparison_data[feature_id] = {
-                'status': status,
-                'old_data': old_features.get(feature_id, {}),
-                'new_data': new_features.get(feature_id, {}),
-                'row': row
-            }
+    def match_distance(self):
+        """Return the largest distance between the geometries of features matched without a key"""
+        try:
+            return abs(float(self.match_distance_edit.text()))
+        except ValueError:
+            return 0.0
+
+    def spill_thresholds(self):
+        """Return the features and memory (MB) above which comparisons run on disk, from the settings"""
+        settings = QSettings()
+        try:
+            spill_rows = int(settings.value('table_compare/spill_rows', SPILL_ROWS))
+        except (TypeError, ValueError):
+            spill_rows = SPILL_ROWS
+        try:
+            spill_memory_mb = float(settings.value('table_compare/spill_memory_mb'))
+        except (TypeError, ValueError):
+            spill_memory_mb = None  # Half the available memory
+        return spill_rows, spill_memory_mb
+
+    def fingerprint_cache(self):
+        """Return the fingerprint cache stored in the user profile"""
+        cache_dir = os.path.join(QgsApplication.qgisSettingsDirPath(), 'table_compare')
+        os.makedirs(cache_dir, exist_ok=True)
+        return FingerprintCache(os.path.join(cache_dir, 'fingerprints.sqlite'))
+
+    def cancel_comparison(self):
+        """Cancel the comparison running in the background, if any"""
+        if self.compare_task is not None:
+            self.compare_task.cancel()
+
+    def set_comparison_running(self, running):
+        """Toggle the progress controls while a comparison runs"""
+        self.progress_bar.setVisible(running)
+        self.progress_label.setVisible(running)
+        self.cancel_button.setVisible(running)
+        self.compare_button.setEnabled(not running)
+        if running:
+            self.progress_bar.setValue(0)
+            self.progress_label.setText("Starting comparison...")
+
+    def on_comparison_progress(self, progress):
+        """Show features read and rows diffed by the running task"""
+        task = self.compare_task
+        if task is None:
+            return
+        self.progress_bar.setValue(int(progress))
+        self.progress_label.setText(
+            f"{task.features_read} of {task.total_features} features read, {task.rows_diffed} rows compared")
+
+    def on_comparison_completed(self, task):
+        """Hand the records of a finished task to the results view"""
+        if task is not self.compare_task:
+            return  # Superseded by a newer comparison
+        self.compare_task = None
+        self.set_comparison_running(False)
+        self.results_proxy.stats = task.stats
+        if task.summary is not None:
+            # Nothing to list until a status is chosen
+            self.comparison_summary = task.summary
+            task.stats.log()
+            self.update_summary()
+            self.update_stats()
+            return
+        self.unlisted_unchanged = task.unchanged_count
+        self.compared_task = task
+        self.display_comparison_results(task.records, task.fields, task.column_kinds)
+        task.records = []  # The model holds the records now
+        
+        # Later filter, sort and export phases are logged as they happen
+        task.stats.log()
+        task.stats.on_phase = self.on_stats_phase
+        self.update_stats()
+        self.update_live_comparison()
+
+    def update_live_comparison(self):
+        """Follow edits of the compared layers while Live Update is checked and the results allow it"""
+        if self.live_comparison is not None:
+            self.live_comparison.stop()
+            self.live_comparison = None
+        task = self.compared_task
+        # Results compared in the database do not list unchanged rows, so edits cannot be matched to rows;
+        # results compared on disk cannot be updated, and features matched without a key have no key to follow
+        if (not self.live_check.isChecked() or task is None or task.unchanged_count is not None
+                or task.spilled or task.matcher is not None):
+            return
+        project = QgsProject.instance()
+        old_layer, new_layer = (project.mapLayer(layer_id) for layer_id in task.layer_ids)
+        if old_layer is None or new_layer is None:
+            return
+        self.live_comparison = LiveComparison(self.results_model, old_layer, new_layer, task,
+                                              self.results_proxy.stats, self)
+        self.live_comparison.set_columns_to_check(self.checked_columns())
+        self.live_comparison.updated.connect(self.update_summary)
+
+    def on_stats_phase(self, phase):
+        """Log a phase run after the comparison and show it in the statistics panel"""
+        self.results_proxy.stats.log([phase.name])
+        self.update_stats()
+
+    def update_stats(self):
+        """Show the phases of the current comparison in the statistics panel"""
+        stats = self.results_proxy.stats
+        self.stats_label.setText(stats.report() if stats is not None else "")
+
+    def on_comparison_terminated(self, task):
+        """Report a canceled or failed comparison"""
+        if task is not self.compare_task:
+            return
+        self.compare_task = None
+        self.set_comparison_running(False)
+        if task.exception is not None:
+            QMessageBox.critical(self, "Error", f"Comparison failed: {str(task.exception)}")
+
+    def display_comparison_results(self, records, fields, column_kinds=None):
+        """Show comparison records from the diff engine in the results view"""
+        with timed(self.results_proxy.stats, MODEL, len(records)):
+            self.results_model.set_records(records, fields, column_kinds)
             
-            row += 1
-        
-        # Store data for filtering
-        self.all_rows_data = list(range(self.results_table.rowCount()))
-        
-        # Resize columns to content
-        self.results_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+            # Size columns once from the visible rows rather than tracking contents
+            self.results_view.resizeColumnsToContents()
         
         # Apply current filters
-        self.apply_filters()
\ No newline at end of file
+        self.apply_filters()
+        self.update_summary()
+
+    def load_rows(self, status):
+        """List the rows of one status of the summarized comparison"""
+        for check, filtered in ((self.filter_added, ADDED), (self.filter_deleted, DELETED),
+                                (self.filter_modified, MODIFIED), (self.filter_unchanged, UNCHANGED),
+                                (self.filter_duplicate, DUPLICATE)):
+            check.setChecked(filtered == status)
+        self.compare_tables([status])
+
+    def update_summary(self):
+        """Show the number of rows per status below the results"""
+        summary = self.comparison_summary
+        self.load_rows_button.setVisible(summary is not None)
+        if summary is not None:
+            self.summary_label.setText(summary.report())
+            return
+        counts = self.results_model.status_counts()
+        parts = [f"{status}: {counts[status]}" for status in (ADDED, DELETED, MODIFIED)]
+        if self.unlisted_unchanged is not None:
+            parts.append(f"{UNCHANGED}: {counts[UNCHANGED] + self.unlisted_unchanged} "
+                         f"({self.unlisted_unchanged} identical rows not listed)")
+        else:
+            parts.append(f"{UNCHANGED}: {counts[UNCHANGED]}")
+        if counts[DUPLICATE]:
+            parts.append(f"{DUPLICATE}: {self.results_model.duplicate_key_count()} keys "
+                         f"({counts[DUPLICATE]} features)")
+        self.summary_label.setText(", ".join(parts) if self.results_model.fields else "")
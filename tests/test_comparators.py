@@ -0,0 +1,63 @@
+import datetime
+
+from table_compare.comparators import (INTEGER, REAL, TEXT, DATE, DATETIME, BOOL, GEOMETRY, OTHER, GeometryValue,
+                                       column_differs, common_kind, values_equal)
+
+
+def differs(kind, old, new, **kwargs):
+    return column_differs(kind, old, new, **kwargs).tolist()
+
+
+def test_integers_and_nulls():
+    assert differs(INTEGER, [1, 2, None, None], [1, 3, None, 4]) == [False, True, False, True]
+
+
+def test_reals_within_tolerance():
+    assert differs(REAL, [1.0, 1.0, None], [1.05, 1.2, 1.0], tolerance=0.1) == [False, True, True]
+
+
+def test_booleans_dates_and_datetimes():
+    day = datetime.date(2024, 1, 31)
+    moment = datetime.datetime(2024, 1, 31, 12, 0)
+    assert differs(BOOL, [True, False], [True, True]) == [False, True]
+    assert differs(DATE, [day, day], [day, datetime.date(2024, 2, 1)]) == [False, True]
+    assert differs(DATETIME, [moment, None], [moment, moment]) == [False, True]
+
+
+def test_text_is_compared_exactly():
+    assert differs(TEXT, ['a', 'a ', None], ['a', 'a', None]) == [False, True, False]
+
+
+def test_values_not_fitting_their_kind_fall_back_to_untyped():
+    assert differs(INTEGER, [1, 'x'], [1, 'y']) == [False, True]
+    assert differs(OTHER, ['1', 2.0], [1, '2']) == [False, False]
+
+
+def test_geometries_by_box_hash_and_equality_test():
+    square = GeometryValue(b'square', (0, 0, 1, 1))
+    same = GeometryValue(b'square', (0, 0, 1, 1))
+    reordered = GeometryValue(b'square reordered', (0, 0, 1, 1))
+    moved = GeometryValue(b'moved', (5, 5, 6, 6))
+    calls = []
+
+    def geometry_equal(old, new, tolerance):
+        calls.append((old, new))
+        return True
+
+    result = differs(GEOMETRY, [square, square, square, None], [same, reordered, moved, None],
+                     geometry_equal=geometry_equal)
+    assert result == [False, False, True, False]
+    assert calls == [(square, reordered)]
+
+
+def test_common_kind():
+    assert common_kind(INTEGER, INTEGER) == INTEGER
+    assert common_kind(INTEGER, REAL) == REAL
+    assert common_kind(INTEGER, TEXT) == OTHER
+
+
+def test_values_equal():
+    assert values_equal(None, None)
+    assert not values_equal(None, 0)
+    assert values_equal(' 1', 1.0)
+    assert not values_equal('a', 'b')
@@ -0,0 +1,53 @@
+import numpy as np
+
+from table_compare.decision_store import ACCEPTED, PENDING, REJECTED, DecisionStore
+
+
+def test_field_decisions_fall_back_to_the_row_decision():
+    decisions = DecisionStore(3)
+    decisions.set_rows([0, 1], ACCEPTED)
+    decisions.set_field([1], 'name', REJECTED)
+    assert decisions.row(1) == ACCEPTED
+    assert decisions.field(1, 'name') == REJECTED
+    assert decisions.field(1, 'area') == ACCEPTED
+    assert decisions.field(0, 'name') == ACCEPTED
+    assert decisions.field(2, 'name') == PENDING
+
+
+def test_row_decisions_replace_field_decisions():
+    decisions = DecisionStore(2)
+    decisions.set_field([0, 1], 'name', REJECTED)
+    decisions.set_rows(np.array([True, False]), ACCEPTED)
+    assert decisions.field(0, 'name') == ACCEPTED
+    assert decisions.field(1, 'name') == REJECTED
+
+
+def test_decided_rows_include_field_decisions():
+    decisions = DecisionStore(4)
+    decisions.set_rows([0], REJECTED)
+    decisions.set_field([2], 'name', ACCEPTED)
+    assert decisions.decided().tolist() == [True, False, True, False]
+
+
+def test_append_and_remove_keep_the_decisions_of_other_rows():
+    decisions = DecisionStore(3)
+    decisions.set_rows([0], ACCEPTED)
+    decisions.set_field([2], 'name', REJECTED)
+    decisions.remove([1])
+    decisions.append(2)
+    assert len(decisions) == 4
+    assert decisions.rows.tolist() == [ACCEPTED, PENDING, PENDING, PENDING]
+    assert decisions.fields['name'].tolist() == [PENDING, REJECTED, PENDING, PENDING]
+
+
+def test_labels_list_the_fields_decided_otherwise():
+    decisions = DecisionStore(3)
+    decisions.set_rows([0, 1], ACCEPTED)
+    decisions.set_field([0, 1], 'name', ACCEPTED)
+    decisions.set_field([1], 'area', REJECTED)
+    decisions.set_field([2], 'name', REJECTED)
+    assert decisions.label(0) == "Accepted"
+    assert decisions.label(1) == "Accepted; area: Rejected"
+    assert decisions.label(2) == "Pending; name: Rejected"
+    decisions.reset(1)
+    assert decisions.label(0) == "Pending"
@@ -0,0 +1,128 @@
+import pytest
+
+from table_compare.comparators import FID_FIELD, INTEGER, REAL, TEXT
+from table_compare.diff_engine import (ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE, CachedRow, ColumnRow,
+                                       UnorderedKeysError, column_values, diff_rows, indexed_rows, join_key,
+                                       row_fingerprint, sort_key)
+
+KINDS = {'id': INTEGER, 'name': TEXT, 'area': REAL}
+
+
+def rows(*values):
+    return [(values['id'], values) for values in values]
+
+
+def statuses(records):
+    return [(record.key, record.status) for record in records]
+
+
+def test_merge_join_statuses():
+    old = rows({'id': 1, 'name': 'a', 'area': 1.0}, {'id': 2, 'name': 'b', 'area': 2.0},
+               {'id': 3, 'name': 'c', 'area': 3.0})
+    new = rows({'id': 2, 'name': 'b', 'area': 2.0}, {'id': 3, 'name': 'C', 'area': 3.0},
+               {'id': 4, 'name': 'd', 'area': 4.0})
+    records = list(diff_rows(old, new, ['name', 'area'], KINDS))
+    assert statuses(records) == [(1, DELETED), (2, UNCHANGED), (3, MODIFIED), (4, ADDED)]
+    assert records[2].changed == ('name',)
+
+
+def test_duplicate_keys_yield_a_record_per_row():
+    old = rows({'id': 1, 'name': 'a'}, {'id': 1, 'name': 'b'}, {'id': 2, 'name': 'c'})
+    new = rows({'id': 1, 'name': 'a'}, {'id': 2, 'name': 'c'})
+    records = list(diff_rows(old, new, ['name'], KINDS))
+    assert statuses(records) == [(1, DUPLICATE), (1, DUPLICATE), (1, DUPLICATE), (2, UNCHANGED)]
+    assert [record.side for record in records[:3]] == ['old', 'old', 'new']
+
+
+def test_real_tolerance():
+    old = rows({'id': 1, 'area': 1.0}, {'id': 2, 'area': 2.0})
+    new = rows({'id': 1, 'area': 1.0005}, {'id': 2, 'area': 2.1})
+    records = list(diff_rows(old, new, ['area'], KINDS, tolerance=0.001))
+    assert statuses(records) == [(1, UNCHANGED), (2, MODIFIED)]
+
+
+def test_unchecked_differences_are_kept_for_recheck():
+    old = rows({'id': 1, 'name': 'a', 'area': 1.0})
+    new = rows({'id': 1, 'name': 'a', 'area': 5.0})
+    record, = diff_rows(old, new, ['name'], KINDS, compare_fields=['name', 'area'])
+    assert record.status == UNCHANGED
+    assert record.differing == ('area',)
+    record.recheck({'name', 'area'})
+    assert record.status == MODIFIED and record.changed == ('area',)
+
+
+def test_unordered_input_is_rejected():
+    old = rows({'id': 2}, {'id': 1})
+    with pytest.raises(UnorderedKeysError):
+        list(diff_rows(old, [], [], KINDS))
+
+
+def test_indexed_rows_orders_unordered_input():
+    old = rows({'id': 3, 'name': 'c'}, {'id': 1, 'name': 'a'})
+    new = rows({'id': 1, 'name': 'a'}, {'id': 3, 'name': 'x'})
+    records = list(diff_rows(indexed_rows(old), indexed_rows(new), ['name'], KINDS))
+    assert statuses(records) == [(1, UNCHANGED), (3, MODIFIED)]
+
+
+def test_composite_keys_match_with_null_parts():
+    fields = ['district', 'parcel', 'sub']
+    old = [{'district': 1, 'parcel': 1, 'sub': None, 'name': 'a'}, {'district': 1, 'parcel': 2, 'sub': 1, 'name': 'b'}]
+    new = [{'district': 1, 'parcel': 1, 'sub': None, 'name': 'a'}, {'district': 1, 'parcel': 2, 'sub': 1, 'name': 'x'}]
+    records = list(diff_rows(indexed_rows((join_key(values, fields), values) for values in old),
+                             indexed_rows((join_key(values, fields), values) for values in new), ['name']))
+    assert statuses(records) == [((1, 1, None), UNCHANGED), ((1, 2, 1), MODIFIED)]
+
+
+def test_sort_key_puts_nulls_first():
+    assert sorted([3, None, 'a', 1.5], key=sort_key) == [None, 1.5, 3, 'a']
+
+
+def test_fingerprints_skip_equal_rows_and_load_cached_rows():
+    old_values = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}, {'id': 3, 'name': 'c'}]
+    new = rows({'id': 1, 'name': 'a'}, {'id': 2, 'name': 'x'})
+    cached = [(values['id'], CachedRow(values['id'], row_fingerprint(values, ['name']))) for values in old_values]
+    loaded = []
+
+    def load_old(cached_rows):
+        loaded.extend(row.fid for row in cached_rows)
+        return [old_values[row.fid - 1] for row in cached_rows]
+
+    records = list(diff_rows(cached, new, ['name'], KINDS, fingerprints=True, load_old=load_old))
+    assert statuses(records) == [(1, UNCHANGED), (2, MODIFIED), (3, DELETED)]
+    assert sorted(loaded) == [2, 3]
+    assert records[2].old == {'id': 3, 'name': 'c'}
+
+
+def test_unchanged_cached_rows_keep_their_feature_id():
+    cached = [(1, CachedRow(10, row_fingerprint({'name': 'a'}, ['name'])))]
+    new = rows({'id': 1, 'name': 'a', FID_FIELD: 20})
+    record, = diff_rows(cached, new, ['name'], KINDS, fingerprints=True, load_old=lambda cached_rows: [])
+    assert record.status == UNCHANGED
+    assert record.old == {'id': 1, 'name': 'a', FID_FIELD: 10}
+    assert record.new[FID_FIELD] == 20
+
+
+def test_integral_reals_share_a_fingerprint_with_integers():
+    assert row_fingerprint({'a': 1}, ['a']) == row_fingerprint({'a': 1.0}, ['a'])
+    assert row_fingerprint({'a': 1}, ['a']) != row_fingerprint({'a': 2}, ['a'])
+
+
+def column_rows(columns):
+    return [(columns['id'][row], ColumnRow(columns, row)) for row in range(len(columns['id']))]
+
+
+def test_column_rows_read_their_batch_columns():
+    batch = {'id': [1, 2, 3, 4], 'name': ['a', 'b', 'c', 'd']}
+    rows = [ColumnRow(batch, row) for row in range(4)]
+    assert rows[1] == {'id': 2, 'name': 'b'} and rows[1].get('area') is None and 'area' not in rows[1]
+    other = {'id': 9, 'name': 'z'}
+    assert column_values(rows[:2] + [other] + [rows[3], rows[1]], 'name') == ['a', 'b', 'z', 'd', 'b']
+    assert row_fingerprint(rows[1], ['id', 'name']) == row_fingerprint({'id': 2, 'name': 'b'}, ['id', 'name'])
+
+
+def test_column_rows_compare_like_dicts():
+    old = {'id': [1, 2, 3], 'name': ['a', 'b', 'c'], 'area': [1.0, 2.0, None]}
+    new = {'id': [2, 3, 4], 'name': ['b', 'C', 'd'], 'area': [2.0, None, 4.0]}
+    records = list(diff_rows(column_rows(old), column_rows(new), ['name', 'area'], KINDS))
+    assert statuses(records) == [(1, DELETED), (2, UNCHANGED), (3, MODIFIED), (4, ADDED)]
+    assert records[2].changed == ('name',)
@@ -0,0 +1,75 @@
+import csv
+
+import pytest
+
+pytest.importorskip('qgis.core')
+
+from table_compare.comparators import BOOL, INTEGER, TEXT  # noqa: E402
+from table_compare.decision_store import ACCEPTED, REJECTED  # noqa: E402
+from table_compare.diff_engine import ADDED, DELETED, MODIFIED, UNCHANGED, DiffRecord  # noqa: E402
+from table_compare.exporters import ResultExporter  # noqa: E402
+from table_compare.results_model import ComparisonResultsModel  # noqa: E402
+
+FIELDS = ['id', 'name', 'kind', 'open']
+KINDS = {'id': INTEGER, 'name': TEXT, 'kind': TEXT, 'open': BOOL}
+
+
+def values(id, name, kind, open=None):
+    return {'id': id, 'name': name, 'kind': kind, 'open': open}
+
+
+def model(records=None):
+    result = ComparisonResultsModel()
+    result.set_records(records or [
+        DiffRecord(1, DELETED, old=values(1, 'a', 'x')),
+        DiffRecord(2, MODIFIED, values(2, 'b', 'x'), values(2, 'B', 'y'), ('name', 'kind'), ('name', 'kind')),
+        DiffRecord(3, UNCHANGED, values(3, 'c', 'x'), values(3, 'c', 'x')),
+        DiffRecord(4, ADDED, new=values(4, 'd', 'z')),
+    ], FIELDS, KINDS)
+    return result
+
+
+def test_records_of_the_given_rows_with_decisions_applied():
+    results = model()
+    results.set_decision([1], ACCEPTED)
+    results.set_field_decision([1], 'name', REJECTED)
+    records = ResultExporter(results, [3, 1], KINDS).records([3, 1])
+    assert [(status, values, decision) for status, values, decision, _ in records] == [
+        (ADDED, [4, 'd', 'z', None], "Pending"),
+        (MODIFIED, [2, 'b', 'y', None], "Accepted; name: Rejected"),
+    ]
+    assert records[1][3].key == 2
+
+
+def test_csv_has_a_line_per_row_with_its_decision(tmp_path):
+    results = model()
+    results.set_decision([0], REJECTED)
+    path = str(tmp_path / 'diff.csv')
+    assert ResultExporter(results, [0, 1], KINDS).export(path) == 2
+    with open(path, newline='', encoding='utf-8') as file:
+        lines = list(csv.reader(file))
+    assert lines[0][0] == 'Status' and lines[0][-1] == 'Decision'
+    assert [(line[0], line[-1]) for line in lines[1:]] == [(DELETED, "Rejected"), (MODIFIED, "Pending")]
+
+
+def test_booleans_read_as_numbers_are_exported_as_booleans():
+    results = model([
+        DiffRecord(1, MODIFIED, values(1, 'a', 'x', 0), values(1, 'a', 'x', 1), ('open',), ('open',)),
+        DiffRecord(2, UNCHANGED, values(2, 'b', 'x', 1), values(2, 'b', 'x', 1)),
+    ])
+    exporter = ResultExporter(results, [0, 1], KINDS)
+    assert exporter.value_kind('open') == BOOL
+    assert exporter.value_kind('name') == TEXT
+
+
+def test_parquet_keeps_booleans_read_as_numbers(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    results = model([
+        DiffRecord(1, MODIFIED, values(1, 'a', 'x', 0), values(1, 'a', 'x', 1), ('open',), ('open',)),
+        DiffRecord(2, ADDED, new=values(2, 'b', 'x', None)),
+    ])
+    path = str(tmp_path / 'diff.parquet')
+    assert ResultExporter(results, [0, 1], KINDS).export(path) == 2
+    table = pq.read_table(path)
+    assert str(table.schema.field('open').type) == 'bool'
+    assert table.column('open').to_pylist() == [True, None]
@@ -0,0 +1,48 @@
+import datetime
+
+from table_compare.fingerprint_cache import FingerprintCache, cache_key
+
+
+def write(cache, key, version, rows):
+    writer = cache.writer(key, version)
+    writer.begin()
+    for row in rows:
+        writer.add(*row)
+    writer.commit()
+
+
+def test_round_trip(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'cache.sqlite'))
+    key = cache_key('ogr', 'a.gpkg', ['id'], ['name'])
+    write(cache, key, 'v1', [(1, 10, b'one'), ((2, 'b'), 11, b'two')])
+    rows = list(cache.rows(key, 'v1'))
+    assert [(key, row.fid, row.fingerprint) for key, row in rows] == [(1, 10, b'one'), ((2, 'b'), 11, b'two')]
+
+
+def test_other_version_or_no_version_misses(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'cache.sqlite'))
+    write(cache, 'key', 'v1', [(1, 10, b'one')])
+    assert cache.rows('key', 'v2') is None
+    assert cache.rows('key', None) is None
+    assert cache.writer('key', None) is None
+
+
+def test_discarded_entry_is_not_valid(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'cache.sqlite'))
+    write(cache, 'key', 'v1', [(1, 10, b'one')])
+    writer = cache.writer('key', 'v2')
+    writer.begin()
+    writer.add(1, 10, b'changed')
+    writer.discard()
+    assert list(cache.rows('key', 'v1'))[0][1].fingerprint == b'one'
+
+
+def test_keys_not_stored_as_json_invalidate_the_entry(tmp_path):
+    cache = FingerprintCache(str(tmp_path / 'cache.sqlite'))
+    write(cache, 'key', 'v1', [(datetime.date(2024, 1, 1), 10, b'one')])
+    assert cache.rows('key', 'v1') is None
+
+
+def test_cache_key_is_stable():
+    assert cache_key('a', ['b'], {'c': 1}) == cache_key('a', ['b'], {'c': 1})
+    assert cache_key('a') != cache_key('b')
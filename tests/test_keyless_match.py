@@ -0,0 +1,49 @@
+import pytest
+
+qgis_core = pytest.importorskip('qgis.core')
+
+from table_compare.comparators import GEOMETRY, GEOMETRY_FIELD, INTEGER, TEXT  # noqa: E402
+from table_compare.compare_task import without_geometry  # noqa: E402
+from table_compare.diff_engine import ADDED, DELETED, MODIFIED, UNCHANGED, ColumnRow, diff_rows  # noqa: E402
+from table_compare.feature_fetcher import geometries_equal, geometry_value  # noqa: E402
+from table_compare.keyless_match import KeylessMatcher  # noqa: E402
+
+KINDS = {'zone': INTEGER, 'name': TEXT}
+
+
+def point(x, y):
+    return geometry_value(qgis_core.QgsGeometry.fromWkt('POINT ({} {})'.format(x, y)))
+
+
+def column_rows(columns):
+    return [ColumnRow(columns, row) for row in range(len(columns['name']))]
+
+
+def statuses(records):
+    return sorted(((record.status, (record.new or record.old)['name']) for record in records))
+
+
+def test_pairs_by_proximity_are_compared_with_their_geometry():
+    old = column_rows({'zone': [1, 1, 2], 'name': ['a', 'b', 'c'],
+                       GEOMETRY_FIELD: [point(0, 0), point(10, 0), point(50, 50)]})
+    new = column_rows({'zone': [1, 1, 3], 'name': ['a', 'B', 'd'],
+                       GEOMETRY_FIELD: [point(0, 0), point(10.2, 0), point(90, 90)]})
+    matcher = KeylessMatcher((), ['zone', 'name'], max_distance=1.0)
+    old_keyed, new_keyed = matcher.keyed_rows(old, new)
+    kinds = dict(KINDS, **{GEOMETRY_FIELD: GEOMETRY})
+    records = list(diff_rows(iter(old_keyed), iter(new_keyed), ['name', GEOMETRY_FIELD], kinds,
+                             geometry_equal=geometries_equal))
+    assert statuses(records) == [(ADDED, 'd'), (DELETED, 'c'), (MODIFIED, 'B'), (UNCHANGED, 'a')]
+    assert next(record for record in records if record.status == MODIFIED).changed == ('name', GEOMETRY_FIELD)
+
+
+def test_pairs_by_blocking_fields_are_compared_without_geometry():
+    old = column_rows({'zone': [1, 2, 4], 'name': ['a', 'b', 'c'],
+                       GEOMETRY_FIELD: [point(0, 0), point(5, 5), point(9, 9)]})
+    new = column_rows({'zone': [2, 1, 3], 'name': ['x', 'a', 'd'],
+                       GEOMETRY_FIELD: [point(100, 100), point(0, 0), point(9, 9)]})
+    matcher = KeylessMatcher(['zone'], ['name'], max_distance=1000.0, min_score=0.0)
+    old_keyed, new_keyed = matcher.keyed_rows(old, new)
+    records = list(diff_rows(without_geometry(old_keyed), without_geometry(new_keyed), ['name'], KINDS))
+    assert statuses(records) == [(ADDED, 'd'), (DELETED, 'c'), (MODIFIED, 'x'), (UNCHANGED, 'a')]
+    assert all(GEOMETRY_FIELD not in (record.old or record.new) for record in records)
@@ -0,0 +1,89 @@
+import datetime
+
+import numpy as np
+
+from table_compare.comparators import INTEGER, REAL, TEXT, DATE
+from table_compare.diff_engine import ADDED, DELETED, MODIFIED, UNCHANGED, ColumnRow, DiffRecord
+from table_compare.result_store import OLD, NEW, DictionaryColumn, ResultStore, TypedColumn
+
+FIELDS = ['id', 'name', 'area', 'day']
+KINDS = {'id': INTEGER, 'name': TEXT, 'area': REAL, 'day': DATE}
+DAY = datetime.date(2024, 5, 1)
+
+
+def values(id, name, area=None, day=None):
+    return {'id': id, 'name': name, 'area': area, 'day': day}
+
+
+def records():
+    return [
+        DiffRecord(1, DELETED, old=values(1, 'b', 3.0, DAY)),
+        DiffRecord(2, MODIFIED, values(2, 'a', 1.0), values(2, 'c', 1.0), ('name',), ('name',)),
+        DiffRecord(3, UNCHANGED, values(3, None, 2.0), values(3, None, 2.5), (), ('area',)),
+        DiffRecord(4, ADDED, new=values(4, 'a', None, DAY)),
+    ]
+
+
+def store():
+    return ResultStore.from_records(records(), FIELDS, KINDS, ['id'])
+
+
+def test_round_trip_of_records():
+    result = store()
+    assert len(result) == 4
+    assert [result.status(row) for row in range(4)] == [DELETED, MODIFIED, UNCHANGED, ADDED]
+    assert result.values(0, NEW) is None
+    assert result.values(0, OLD) == values(1, 'b', 3.0, DAY)
+    assert result.value(1, 'name') == 'c' and result.value(1, 'name', OLD) == 'a'
+    assert result.key(3) == 4
+    assert result[1].changed == ('name',)
+    assert isinstance(result.columns[NEW]['area'], TypedColumn)
+    assert isinstance(result.columns[NEW]['name'], DictionaryColumn)
+
+
+def test_values_not_fitting_their_type_switch_to_a_dictionary():
+    result = ResultStore(FIELDS, KINDS, ['id'])
+    result.extend([DiffRecord(1, ADDED, new=values(1, 'a', 1.5))])
+    result.extend([DiffRecord(2, ADDED, new=values(2, 'b', 'n/a'))])
+    result.finish()
+    assert isinstance(result.columns[NEW]['area'], DictionaryColumn)
+    assert [result.value(row, 'area') for row in range(2)] == [1.5, 'n/a']
+
+
+def test_sort_order_on_shown_values_nulls_first():
+    result = store()
+    # Shown areas: 3.0 (deleted row), 1.0, 2.5, NULL
+    assert result.sort_order('area').tolist() == [3, 1, 2, 0]
+    # Shown names: 'b', 'c', NULL, 'a'
+    assert result.sort_order('name').tolist() == [2, 3, 0, 1]
+
+
+def test_recheck_changes_modified_rows():
+    result = store()
+    rows, modified = result.recheck({'area'})
+    assert rows.tolist() == [1, 2] and modified.tolist() == [False, True]
+    assert [result.status(row) for row in range(4)] == [DELETED, UNCHANGED, MODIFIED, ADDED]
+    assert result.changed_mask('area').tolist() == [False, False, True, False]
+    assert not result.changed_mask('name').any()
+
+
+def test_replace_append_delete_keep_the_key_index():
+    result = store()
+    assert result.rows_of_key(2) == [1]
+    result.replace(1, DiffRecord(5, ADDED, new=values(5, 'e')))
+    result.append([DiffRecord(6, DELETED, old=values(6, 'f', 6.0))])
+    assert result.rows_of_key(2) == [] and result.rows_of_key(5) == [1] and result.rows_of_key(6) == [4]
+    result.delete([0])
+    assert len(result) == 4
+    assert [result.key(row) for row in range(4)] == [5, 3, 4, 6]
+    assert result.rows_of_key(6) == [3]
+    assert np.array_equal(result.present[OLD], [False, True, False, True])
+
+
+def test_fetched_column_rows_are_stored_and_replace_rows():
+    columns = {field: [value] for field, value in values(7, 'g', 7.0, DAY).items()}
+    result = store()
+    result.append([DiffRecord(7, ADDED, new=ColumnRow(columns, 0))])
+    result.replace(0, DiffRecord(1, DELETED, old=ColumnRow(columns, 0)))
+    assert result.values(4, NEW) == values(7, 'g', 7.0, DAY)
+    assert result.values(0, OLD) == values(7, 'g', 7.0, DAY)
@@ -0,0 +1,53 @@
+import csv
+
+from table_compare.comparators import INTEGER
+from table_compare.diff_engine import ADDED, DELETED, MODIFIED, UNCHANGED, DUPLICATE, ColumnRow
+from table_compare.snapshots import compare_snapshots
+
+SNAPSHOTS = [
+    [{'id': 1, 'a': 1}, {'id': 2, 'a': 2}],
+    [{'id': 3, 'a': 3}, {'id': 1, 'a': 5}, {'id': 2, 'a': 2}],
+    [{'id': 3, 'a': 3}, {'id': 1, 'a': 5}, {'id': 3, 'a': 4}],
+]
+
+
+def timeline():
+    return compare_snapshots(['jan', 'feb', 'mar'], ([(row['id'], row) for row in rows] for rows in SNAPSHOTS),
+                             ['a'], {'id': INTEGER, 'a': INTEGER})
+
+
+def test_timeline_per_key():
+    result = timeline()
+    assert result.timeline(1) == [('jan -> feb', MODIFIED, ('a',)), ('feb -> mar', UNCHANGED, ())]
+    assert [status for step, status, changed in result.timeline(2)] == [UNCHANGED, DELETED]
+    assert [status for step, status, changed in result.timeline(3)] == [ADDED, DUPLICATE]
+
+
+def test_fetched_column_rows_give_the_same_timeline():
+    def column_rows(rows):
+        columns = {'id': [row['id'] for row in rows], 'a': [row['a'] for row in rows]}
+        return [(key, ColumnRow(columns, row)) for row, key in enumerate(columns['id'])]
+    result = compare_snapshots(['jan', 'feb', 'mar'], (column_rows(rows) for rows in SNAPSHOTS),
+                               ['a'], {'id': INTEGER, 'a': INTEGER})
+    assert result.step_counts() == timeline().step_counts()
+    assert result.timeline(1) == timeline().timeline(1)
+
+
+def test_step_counts():
+    counts = timeline().step_counts()
+    assert counts[0][ADDED] == 1 and counts[0][MODIFIED] == 1 and counts[0][UNCHANGED] == 1
+    assert counts[1][DELETED] == 1 and counts[1][DUPLICATE] == 1
+
+
+def test_csv_leaves_out_unchanged_keys(tmp_path):
+    path = str(tmp_path / 'timeline.csv')
+    timeline().write_csv(path, ['id'])
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        rows = list(csv.reader(csvfile))
+    assert rows[0] == ['id', 'jan -> feb', 'feb -> mar']
+    assert rows[1] == ['1', 'Modified: a', 'Unchanged']
+
+
+def test_cancel_between_snapshots():
+    result = compare_snapshots(['a', 'b'], iter([[], []]), [], is_canceled=lambda: True)
+    assert result is None
@@ -0,0 +1,79 @@
+from table_compare.comparators import FID_FIELD, INTEGER, REAL, TEXT
+from table_compare.diff_engine import DUPLICATE, diff_rows, indexed_rows, join_key
+from table_compare.spill_store import NEW_TABLE, OLD_TABLE, Spill, SpillDatabase
+
+JOIN_FIELDS = ['district', 'parcel']
+FIELDS = JOIN_FIELDS + ['area', 'name']
+KINDS = {'district': INTEGER, 'parcel': INTEGER, 'area': REAL, 'name': TEXT}
+
+OLD_ROWS = [
+    (1, 1, 10.0, 'a'),
+    (1, 2, 20.0, 'b'),
+    (1, None, 30.0, 'c'),
+    (2, None, 40.0, 'd'),
+    (2, None, 41.0, 'e'),
+    (3, 1, 50.0, 'f'),
+]
+NEW_ROWS = [
+    (1, 1, 10.0, 'a'),
+    (1, 2, 25.0, 'b'),
+    (1, None, 30.0, 'c'),
+    (2, None, 40.0, 'd'),
+    (4, 1, 60.0, 'g'),
+]
+
+
+class Batch:
+    """Rows of a fetch batch, column by column"""
+
+    def __init__(self, rows):
+        self.columns = {field: [row[i] for row in rows] for i, field in enumerate(FIELDS)}
+        self.columns[FID_FIELD] = list(range(len(rows)))
+
+    def __len__(self):
+        return len(self.columns[FID_FIELD])
+
+
+def spilled(tmp_path):
+    database = SpillDatabase(str(tmp_path))
+    spill = Spill(database, JOIN_FIELDS, FIELDS, KINDS, ['area', 'name'], 0.0)
+    spill.insert(OLD_TABLE, Batch(OLD_ROWS))
+    spill.insert(NEW_TABLE, Batch(NEW_ROWS))
+    return spill.run(['area', 'name'], FIELDS)
+
+
+def local_records():
+    def keyed(rows):
+        return indexed_rows((join_key(values, JOIN_FIELDS), values)
+                            for values in (dict(zip(FIELDS, row)) for row in rows))
+    return list(diff_rows(keyed(OLD_ROWS), keyed(NEW_ROWS), ['area', 'name'], KINDS))
+
+
+def outcome(keys_and_statuses):
+    return sorted((str(key), status) for key, status in keys_and_statuses)
+
+
+def test_spill_agrees_with_the_local_diff(tmp_path):
+    store = spilled(tmp_path)
+    try:
+        assert outcome((store.key(row), store.status(row)) for row in range(len(store))) == \
+            outcome((record.key, record.status) for record in local_records())
+    finally:
+        store.database.close()
+
+
+def test_repeated_null_keys_are_set_aside_as_duplicates(tmp_path):
+    store = spilled(tmp_path)
+    try:
+        duplicates = [store.key(row) for row in range(len(store)) if store.status(row) == DUPLICATE]
+        assert duplicates == [(2, None)] * 3
+    finally:
+        store.database.close()
+
+
+def test_spilled_results_are_read_only(tmp_path):
+    store = spilled(tmp_path)
+    try:
+        assert store.read_only
+    finally:
+        store.database.close()
@@ -0,0 +1,97 @@
+import sqlite3
+
+import pytest
+
+from table_compare.comparators import FID_FIELD, INTEGER, REAL, TEXT
+from table_compare.diff_engine import UNCHANGED, diff_rows, indexed_rows, join_key
+from table_compare.sql_pushdown import SQLITE, PushdownPlan, SqliteExecutor, quote_identifier
+
+JOIN_FIELDS = ['district', 'parcel', 'sub']
+FIELDS = JOIN_FIELDS + ['area', 'name']
+KINDS = {'district': INTEGER, 'parcel': INTEGER, 'sub': INTEGER, 'area': REAL, 'name': TEXT}
+
+OLD_ROWS = [
+    (1, 1, None, 10.0, 'a'),
+    (1, 2, None, 20.0, 'b'),
+    (1, 3, 1, 30.0, 'c'),
+    (2, None, None, 40.0, 'd'),
+    (3, 1, None, 50.0, 'e'),
+    (3, 1, None, 51.0, 'f'),
+]
+NEW_ROWS = [
+    (1, 1, None, 10.0, 'a'),
+    (1, 2, None, 25.0, 'b'),
+    (1, 4, None, 60.0, 'g'),
+    (2, None, None, 40.0, 'd'),
+    (3, 1, None, 50.0, 'e'),
+]
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'layers.sqlite')
+    connection = sqlite3.connect(path)
+    for table, rows in (('old', OLD_ROWS), ('new', NEW_ROWS)):
+        connection.execute("CREATE TABLE {} ({})".format(table, ", ".join(FIELDS)))
+        connection.executemany("INSERT INTO {} VALUES (?, ?, ?, ?, ?)".format(table), rows)
+    connection.commit()
+    connection.close()
+    return path
+
+
+def plan(join_fields=JOIN_FIELDS):
+    return PushdownPlan(SQLITE, quote_identifier('old'), quote_identifier('new'), join_fields, FIELDS,
+                        ['area', 'name'], ['area'])
+
+
+def local_records(old_rows, new_rows, join_fields=JOIN_FIELDS):
+    def keyed(rows):
+        return indexed_rows((join_key(values, join_fields), values)
+                            for values in (dict(zip(FIELDS, row)) for row in rows))
+    return list(diff_rows(keyed(old_rows), keyed(new_rows), ['area', 'name'], KINDS))
+
+
+def outcome(records):
+    return sorted(((str(record.key), record.status) for record in records))
+
+
+def test_null_key_parts_match_like_the_local_diff(database):
+    unique_old = [row for row in OLD_ROWS if row[0] != 3]
+    unique_new = [row for row in NEW_ROWS if row[0] != 3]
+    connection = sqlite3.connect(database)
+    connection.execute("DELETE FROM old WHERE district = 3")
+    connection.execute("DELETE FROM new WHERE district = 3")
+    connection.commit()
+    connection.close()
+
+    execute = SqliteExecutor(database)
+    try:
+        records, unchanged = plan().run(execute, ['area', 'name'])
+        records = list(records)
+    finally:
+        execute.close()
+    local = local_records(unique_old, unique_new)
+    assert outcome(records) == outcome(record for record in local if record.status != UNCHANGED)
+    assert unchanged == sum(record.status == UNCHANGED for record in local) == 2
+
+
+def test_repeated_null_keys_are_duplicates(database):
+    execute = SqliteExecutor(database)
+    try:
+        assert plan().has_duplicate_keys(execute)
+    finally:
+        execute.close()
+
+
+def test_feature_ids_are_read_from_the_id_columns(database):
+    pushdown = PushdownPlan(SQLITE, quote_identifier('old'), quote_identifier('new'), JOIN_FIELDS, FIELDS,
+                            ['area', 'name'], ['area'], id_columns=('rowid', 'rowid'))
+    execute = SqliteExecutor(database)
+    try:
+        records, unchanged = pushdown.run(execute, ['area', 'name'])
+        records = {record.key: record for record in records}
+    finally:
+        execute.close()
+    assert records[(1, 2, None)].old[FID_FIELD] == 2 and records[(1, 2, None)].new[FID_FIELD] == 2
+    assert records[(1, 3, 1)].old[FID_FIELD] == 3 and records[(1, 3, 1)].new is None
+    assert records[(1, 4, None)].new[FID_FIELD] == 3
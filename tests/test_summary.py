@@ -0,0 +1,20 @@
+import json
+
+from table_compare.diff_engine import ADDED, MODIFIED, UNCHANGED, DiffRecord
+from table_compare.summary import ComparisonSummary
+
+
+def test_counts_fields_and_samples():
+    summary = ComparisonSummary(['name', 'area'], ['name'], sample_size=2)
+    for key in range(3):
+        summary.add(DiffRecord(key, MODIFIED, changed=('name',), differing=('name', 'area')))
+    summary.add(DiffRecord(10, UNCHANGED, differing=('area',)))
+    summary.add(DiffRecord(11, ADDED))
+    summary.add_unchanged(5)
+
+    assert len(summary) == 10
+    assert summary.counts[MODIFIED] == 3 and summary.counts[UNCHANGED] == 6
+    assert summary.changed_fields() == [('area', 4), ('name', 3)]
+    assert summary.samples[MODIFIED] == [0, 1]
+    assert 'area: 4 (not checked)' in summary.report()
+    assert json.loads(summary.to_json())['samples'][ADDED] == ['11']